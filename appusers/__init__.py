@@ -1,5 +1,6 @@
 from flask import Flask
-from appusers import users, groups, login, models, database, configuration
+from appusers import (users, groups, login, models, database, configuration,
+    throttle, passwords, audit, utils, jsonprovider)
 
 
 def create_app():
@@ -20,7 +21,25 @@ def create_app():
 
         # Initialize Database object
         database.db.init_app(app)
+        database.init_sqlite_pragmas(app)
         database.db.create_all()
+        database.init_unit_of_work(app)
+        database.init_fulltext_search(app)
+        database.init_read_replicas(app)
+        database.init_caches(app)
+        utils.init_response_cache(app)
+
+        # Select JSON encoder of Responses
+        jsonprovider.json_provider.init_app(app)
+
+        # Initialize password hasher pool
+        passwords.hasher.init_app(app)
+
+        # Start login audit log flusher
+        audit.audit.init_app(app)
+
+        # Initialize login throttle store
+        throttle.throttle.init_app(app)
 
         # Initialize JWT Manager
         login.jwt.init_app(app)
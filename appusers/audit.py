@@ -0,0 +1,142 @@
+"""Login audit log module
+
+This module declares AuditLog class, which buffers Login attempt records
+in memory and inserts them to login_event table in batches, from
+a background thread. Buffer is flushed every AUDIT_FLUSH_INTERVAL or as
+soon as AUDIT_BATCH_SIZE records are buffered, so Login operation does not
+wait for Database insert. Records of failed flush (e.g. database is locked)
+return to buffer and are retried by next flush, up to MAX_BUFFER_SIZE
+records. Records buffered since last flush are lost when worker crashes,
+or when flush fails on shutdown.
+
+audit, an instance of AuditLog is declared here and is initialized
+in Application Factory function.
+audit uses following Application Config variables:
+
+- AUDIT_LOG - record Login attempts
+- AUDIT_DATABASE_URI - Database of login_event table ('audit' bind),
+    None stores it in SQLALCHEMY_DATABASE_URI Database
+- AUDIT_FLUSH_INTERVAL - maximal time records wait in buffer
+- AUDIT_BATCH_SIZE - number of buffered records triggering flush
+- AUDIT_RETENTION - records older than this period are deleted
+"""
+import atexit
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from appusers.database import db, LoginEvent
+
+
+# Records older than AUDIT_RETENTION are deleted at most this often
+PRUNE_INTERVAL = timedelta(hours=1)
+
+# Records kept in buffer while flushes fail, oldest are dropped beyond it
+MAX_BUFFER_SIZE = 100000
+
+class AuditLog:
+    """Buffered, append-only log of Login attempts"""
+
+    def __init__(self):
+        self.app = None
+        self.buffer = []
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.stopped = Event()
+        self.thread = None
+        self.last_prune = None
+
+    def init_app(self, app):
+        """Start flusher thread for app, stop thread of previous app"""
+        self.stop()
+        self.app = app
+        if not app.config.get('AUDIT_LOG'):
+            return
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, name='audit-flusher', daemon=True)
+        self.thread.start()
+
+    def record(self, result, userid=None, username=None, address=None):
+        """Buffer Login attempt record"""
+        if self.thread is None:
+            return
+        with self.lock:
+            self.buffer.append({
+                'userid': userid,
+                'username': username,
+                'address': address,
+                'result': result,
+                'time': datetime.now()
+                })
+            full = len(self.buffer) >= self.app.config['AUDIT_BATCH_SIZE']
+        if full:
+            self.wakeup.set()
+
+    def run(self):
+        """Flusher thread loop"""
+        interval = self.app.config['AUDIT_FLUSH_INTERVAL'].total_seconds()
+        stopped = self.stopped
+        while not stopped.is_set():
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f'Audit log flush failed: {e}')
+
+    def flush(self):
+        """Insert buffered records in one transaction, prune old records.
+           Records return to buffer if transaction fails.
+        """
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        now = datetime.now()
+        prune = self.last_prune is None or now - self.last_prune > PRUNE_INTERVAL
+        if not rows and not prune:
+            return
+        engine = db.get_engine(self.app, bind='audit')
+        try:
+            with engine.begin() as connection:
+                if rows:
+                    connection.execute(LoginEvent.__table__.insert(), rows)
+                if prune:
+                    oldest = now - self.app.config['AUDIT_RETENTION']
+                    connection.execute(LoginEvent.__table__.delete().where(
+                        LoginEvent.time < oldest))
+        except Exception:
+            self.requeue(rows)
+            raise
+        if prune:
+            self.last_prune = now
+
+    def requeue(self, rows):
+        """Return rows of failed flush to buffer, before records buffered
+           since, keep at most MAX_BUFFER_SIZE newest records
+        """
+        with self.lock:
+            self.buffer = rows + self.buffer
+            dropped = len(self.buffer) - MAX_BUFFER_SIZE
+            if dropped > 0:
+                del self.buffer[:dropped]
+        if dropped > 0:
+            self.app.logger.error(
+                f'Audit log buffer full, {dropped} records dropped')
+
+    def stop(self):
+        """Stop flusher thread and flush buffer, records are dropped
+           if flush fails
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join()
+        self.thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            self.app.logger.error(f'Audit log flush failed, '
+                f'{len(self.buffer)} records dropped: {e}')
+            self.buffer = []
+
+# Audit log object is initialized in Application Factory
+audit = AuditLog()
+atexit.register(audit.stop)
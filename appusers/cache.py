@@ -0,0 +1,147 @@
+"""In-process cache module
+
+This module declares LRUCache class, a thread-safe, size bounded cache with
+Least Recently Used eviction and optional expiry of entries. Cache may also
+be bounded by total size in bytes of cached values.
+Caches are declared in modules using them and are configured from
+Application Config variables in Application Factory function.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class LRUCache:
+    """Size bounded Least Recently Used cache with optional entry expiry
+
+    ttl is a default time to live of entries in seconds, None means entries
+    do not expire. If maxbytes is set, sizeof(value) returns size of value
+    in bytes and total size of values is kept under maxbytes. Cache keeps
+    hit, miss and eviction counters.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize=None, ttl=None, maxbytes=None):
+        """Set new size limits and default time to live, clear the cache"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self.ttl = ttl
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return value cached for key or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value, _ = entry
+                if expires is None or expires > monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Cache value for key, evicting least recently used entries"""
+        ttl = self.ttl if ttl is None else ttl
+        expires = monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._store(key, expires, value)
+
+    def incr(self, key, delta=1, ttl=None):
+        """Atomically add delta to value cached for key (0 if missing or
+           expired), restart its time to live and return new value
+        """
+        def add(value):
+            value = (value or 0) + delta
+            return value, value
+        return self.update(key, add, ttl)
+
+    def update(self, key, func, ttl=None):
+        """Atomically replace value cached for key with func(value)
+
+        func gets current value (None if missing or expired) and returns
+        (new value, result) pair. new value None keeps current entry.
+        Returns result.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            value = None
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                value = entry[1]
+            value, result = func(value)
+            if value is not None:
+                self._store(
+                    key, now + ttl if ttl is not None else None, value)
+            return result
+
+    def _store(self, key, expires, value):
+        """Store entry and evict least recently used entries over limits,
+           lock must be held
+        """
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires, value, size)
+        self.bytes += size
+        while self._entries and (len(self._entries) > self.maxsize or
+                (self.maxbytes is not None and self.bytes > self.maxbytes)):
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def _remove(self, key):
+        """Remove entry and return it, lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        return entry
+
+    def pop(self, key, default=None):
+        """Remove key from the cache and return its value"""
+        with self._lock:
+            entry = self._remove(key)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return dictionary with cache size, memory use and counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': self.bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+                }
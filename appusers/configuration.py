@@ -7,6 +7,7 @@ Application Factory.
 """
 import os, argparse, ast
 from datetime import timedelta
+from sqlalchemy.pool import QueuePool
 from appusers.models import config_variables_schema
 
 def configure(app):
@@ -31,6 +32,59 @@ def configure(app):
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///appusers.sqlite3'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Read replica Database URIs, list or comma separated string
+    # Replicas are added to SQLALCHEMY_BINDS in the end of configure()
+    app.config['DATABASE_REPLICAS'] = []
+    # Client reads from primary Database for this period after write
+    app.config['REPLICA_PIN_TIMEOUT'] = timedelta(seconds=5)
+
+    # Maximal age of cached count of all Users or Groups (X-Total-Count)
+    app.config['COUNT_CACHE_TIMEOUT'] = timedelta(seconds=60)
+
+    # Search Users (q filter) with SQLite FTS5 index (see
+    # database.init_fulltext_search()), LIKE matching is used if disabled
+    app.config['FULLTEXT_SEARCH'] = True
+
+    # Cache of authenticated Users' Principals (see database.load_principal())
+    # Cache is per worker: after admin status is revoked or User is locked
+    # in one worker, other workers accept old admin claims of Tokens
+    # (see utils.admin_required) until timeout, keep it short.
+    app.config['PRINCIPAL_CACHE'] = True
+    app.config['PRINCIPAL_CACHE_SIZE'] = 10000
+    app.config['PRINCIPAL_CACHE_TIMEOUT'] = timedelta(seconds=5)
+
+    # Cache of serialized List Users and List Groups Responses, invalidated
+    # by writes in this worker (see utils.cached_response()), size in bytes.
+    # Timeout limits staleness after writes made by other workers.
+    app.config['RESPONSE_CACHE'] = True
+    app.config['RESPONSE_CACHE_SIZE'] = 64 * 1024 * 1024
+    app.config['RESPONSE_CACHE_TIMEOUT'] = timedelta(seconds=10)
+
+    # Cache of serialized User and Group Representations of Retrieve
+    # operations, evicted by writes in this worker (see database.entity_cache)
+    app.config['ENTITY_CACHE'] = True
+    app.config['ENTITY_CACHE_SIZE'] = 10000
+    app.config['ENTITY_CACHE_TIMEOUT'] = timedelta(seconds=10)
+
+    # JSON encoder of Responses and decoder of Request bodies, 'auto' uses
+    # orjson when installed (see jsonprovider.JSONProvider)
+    app.config['JSON_PROVIDER'] = 'auto'
+
+    # SQLite pragmas set on every new Database connection, None keeps
+    # SQLite default (see database.init_sqlite_pragmas())
+    app.config['SQLITE_JOURNAL_MODE'] = None
+    app.config['SQLITE_SYNCHRONOUS'] = None
+    app.config['SQLITE_MMAP_SIZE'] = None
+    app.config['SQLITE_CACHE_SIZE'] = None
+    app.config['SQLITE_BUSY_TIMEOUT'] = None
+
+    # SQLAlchemy connection pool options, None keeps SQLAlchemy default
+    # Merged to SQLALCHEMY_ENGINE_OPTIONS in the end of configure()
+    app.config['DATABASE_POOL_SIZE'] = None
+    app.config['DATABASE_MAX_OVERFLOW'] = None
+    app.config['DATABASE_POOL_RECYCLE'] = None
+    app.config['DATABASE_POOL_PRE_PING'] = None
+
     # X-API-Key value for development
     app.config['API_KEY'] = 'appusers' # change this!
 
@@ -52,6 +106,38 @@ def configure(app):
         seconds=0
         )
 
+    # Password hashing: 'pbkdf2-sha256' or 'scrypt', cost (iterations or
+    # log2 N, see python manage.py calibrate) and pool verifying passwords
+    app.config['PASSWORD_HASH'] = 'pbkdf2-sha256'
+    app.config['PASSWORD_COST'] = 600000
+    app.config['PASSWORD_POOL'] = 'thread'
+    app.config['PASSWORD_WORKERS'] = 4
+
+    # Failed login counters store: 'memory' (per worker), 'sqlite'
+    # (sidecar file shared by workers) or 'database' (user table),
+    # see throttle module
+    app.config['THROTTLE_STORE'] = 'memory'
+    app.config['THROTTLE_STORE_PATH'] = 'throttle.sqlite3'
+    app.config['THROTTLE_STORE_SIZE'] = 10000
+
+    # Login token buckets in throttle store, attempts per minute and
+    # attempts allowed at once, by client address and by username
+    app.config['LOGIN_IP_RATE'] = 300
+    app.config['LOGIN_IP_BURST'] = 100
+    app.config['LOGIN_USERNAME_RATE'] = 10
+    app.config['LOGIN_USERNAME_BURST'] = 20
+
+    # Login attempts audit log (see audit module), None stores login_event
+    # table in SQLALCHEMY_DATABASE_URI Database
+    app.config['AUDIT_LOG'] = True
+    app.config['AUDIT_DATABASE_URI'] = None
+    app.config['AUDIT_FLUSH_INTERVAL'] = timedelta(seconds=5)
+    app.config['AUDIT_BATCH_SIZE'] = 500
+    app.config['AUDIT_RETENTION'] = timedelta(days=90)
+
+    # Commit Database changes once per Request (see database.commit())
+    app.config['UNIT_OF_WORK'] = False
+
     """ Read Configuration Variables from Python source file pointed by
         APPUSERS_CONFIG environment variable or from
         development_config.py (if env var not set)
@@ -89,6 +175,46 @@ def configure(app):
         APPUSERS_ACCESS_TOKEN_EXPIRES -> JWT_ACCESS_TOKEN_EXPIRES
         APPUSERS_MAX_FAILED_LOGIN_ATTEMPTS -> MAX_FAILED_LOGIN_ATTEMPTS
         APPUSERS_LOCK_TIMEOUT -> LOCK_TIMEOUT
+        APPUSERS_PASSWORD_HASH -> PASSWORD_HASH
+        APPUSERS_PASSWORD_COST -> PASSWORD_COST
+        APPUSERS_PASSWORD_POOL -> PASSWORD_POOL
+        APPUSERS_PASSWORD_WORKERS -> PASSWORD_WORKERS
+        APPUSERS_THROTTLE_STORE -> THROTTLE_STORE
+        APPUSERS_THROTTLE_STORE_PATH -> THROTTLE_STORE_PATH
+        APPUSERS_THROTTLE_STORE_SIZE -> THROTTLE_STORE_SIZE
+        APPUSERS_LOGIN_IP_RATE -> LOGIN_IP_RATE
+        APPUSERS_LOGIN_IP_BURST -> LOGIN_IP_BURST
+        APPUSERS_LOGIN_USERNAME_RATE -> LOGIN_USERNAME_RATE
+        APPUSERS_LOGIN_USERNAME_BURST -> LOGIN_USERNAME_BURST
+        APPUSERS_AUDIT_LOG -> AUDIT_LOG
+        APPUSERS_AUDIT_DATABASE_URI -> AUDIT_DATABASE_URI
+        APPUSERS_AUDIT_FLUSH_INTERVAL -> AUDIT_FLUSH_INTERVAL
+        APPUSERS_AUDIT_BATCH_SIZE -> AUDIT_BATCH_SIZE
+        APPUSERS_AUDIT_RETENTION -> AUDIT_RETENTION
+        APPUSERS_UNIT_OF_WORK -> UNIT_OF_WORK
+        APPUSERS_DATABASE_REPLICAS -> DATABASE_REPLICAS
+        APPUSERS_REPLICA_PIN_TIMEOUT -> REPLICA_PIN_TIMEOUT
+        APPUSERS_COUNT_CACHE_TIMEOUT -> COUNT_CACHE_TIMEOUT
+        APPUSERS_FULLTEXT_SEARCH -> FULLTEXT_SEARCH
+        APPUSERS_PRINCIPAL_CACHE -> PRINCIPAL_CACHE
+        APPUSERS_PRINCIPAL_CACHE_SIZE -> PRINCIPAL_CACHE_SIZE
+        APPUSERS_PRINCIPAL_CACHE_TIMEOUT -> PRINCIPAL_CACHE_TIMEOUT
+        APPUSERS_RESPONSE_CACHE -> RESPONSE_CACHE
+        APPUSERS_RESPONSE_CACHE_SIZE -> RESPONSE_CACHE_SIZE
+        APPUSERS_RESPONSE_CACHE_TIMEOUT -> RESPONSE_CACHE_TIMEOUT
+        APPUSERS_ENTITY_CACHE -> ENTITY_CACHE
+        APPUSERS_ENTITY_CACHE_SIZE -> ENTITY_CACHE_SIZE
+        APPUSERS_ENTITY_CACHE_TIMEOUT -> ENTITY_CACHE_TIMEOUT
+        APPUSERS_JSON_PROVIDER -> JSON_PROVIDER
+        APPUSERS_SQLITE_JOURNAL_MODE -> SQLITE_JOURNAL_MODE
+        APPUSERS_SQLITE_SYNCHRONOUS -> SQLITE_SYNCHRONOUS
+        APPUSERS_SQLITE_MMAP_SIZE -> SQLITE_MMAP_SIZE
+        APPUSERS_SQLITE_CACHE_SIZE -> SQLITE_CACHE_SIZE
+        APPUSERS_SQLITE_BUSY_TIMEOUT -> SQLITE_BUSY_TIMEOUT
+        APPUSERS_DATABASE_POOL_SIZE -> DATABASE_POOL_SIZE
+        APPUSERS_DATABASE_MAX_OVERFLOW -> DATABASE_MAX_OVERFLOW
+        APPUSERS_DATABASE_POOL_RECYCLE -> DATABASE_POOL_RECYCLE
+        APPUSERS_DATABASE_POOL_PRE_PING -> DATABASE_POOL_PRE_PING
     """
     try:
         envvar_config = config_variables_schema.load(os.environ, partial=True)
@@ -133,6 +259,128 @@ def configure(app):
     parser.add_argument('-l', '--lock-timeout', nargs='?', type=int,
         metavar='INT', help='Account lock timeout in seconds',
         dest='APPUSERS_LOCK_TIMEOUT')
+    parser.add_argument('--password-hash', nargs='?', type=str,
+        metavar='pbkdf2-sha256|scrypt', help='Password hashing method',
+        dest='APPUSERS_PASSWORD_HASH')
+    parser.add_argument('--password-cost', nargs='?', type=int,
+        metavar='INT', help='Password hashing iterations (scrypt: log2 N)',
+        dest='APPUSERS_PASSWORD_COST')
+    parser.add_argument('--password-pool', nargs='?', type=str,
+        metavar='thread|process', help='Password verification pool type',
+        dest='APPUSERS_PASSWORD_POOL')
+    parser.add_argument('--password-workers', nargs='?', type=int,
+        metavar='INT', help='Password verification pool size, 0 disables pool',
+        dest='APPUSERS_PASSWORD_WORKERS')
+    parser.add_argument('--throttle-store', nargs='?', type=str,
+        metavar='memory|sqlite|database', help='Failed login counters store',
+        dest='APPUSERS_THROTTLE_STORE')
+    parser.add_argument('--throttle-store-path', nargs='?', type=str,
+        metavar='PATH', help='SQLite throttle store file',
+        dest='APPUSERS_THROTTLE_STORE_PATH')
+    parser.add_argument('--throttle-store-size', nargs='?', type=int,
+        metavar='INT', help='Maximal number of counters in memory throttle store',
+        dest='APPUSERS_THROTTLE_STORE_SIZE')
+    parser.add_argument('--login-ip-rate', nargs='?', type=float,
+        metavar='FLOAT', help='Login attempts per minute from client address',
+        dest='APPUSERS_LOGIN_IP_RATE')
+    parser.add_argument('--login-ip-burst', nargs='?', type=int,
+        metavar='INT', help='Login attempts at once from client address',
+        dest='APPUSERS_LOGIN_IP_BURST')
+    parser.add_argument('--login-username-rate', nargs='?', type=float,
+        metavar='FLOAT', help='Login attempts per minute for username',
+        dest='APPUSERS_LOGIN_USERNAME_RATE')
+    parser.add_argument('--login-username-burst', nargs='?', type=int,
+        metavar='INT', help='Login attempts at once for username',
+        dest='APPUSERS_LOGIN_USERNAME_BURST')
+    parser.add_argument('--audit-log', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Record Login attempts',
+        dest='APPUSERS_AUDIT_LOG')
+    parser.add_argument('--audit-db-uri', nargs='?', type=str, metavar='URI',
+        help='Login attempts audit log Database URI',
+        dest='APPUSERS_AUDIT_DATABASE_URI')
+    parser.add_argument('--audit-flush-interval', nargs='?', type=int,
+        metavar='INT', help='Audit log buffer flush interval in seconds',
+        dest='APPUSERS_AUDIT_FLUSH_INTERVAL')
+    parser.add_argument('--audit-batch-size', nargs='?', type=int,
+        metavar='INT', help='Audit log records triggering buffer flush',
+        dest='APPUSERS_AUDIT_BATCH_SIZE')
+    parser.add_argument('--audit-retention', nargs='?', type=int,
+        metavar='INT', help='Audit log retention in seconds',
+        dest='APPUSERS_AUDIT_RETENTION')
+    parser.add_argument('--unit-of-work', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Commit Database changes once per Request',
+        dest='APPUSERS_UNIT_OF_WORK')
+    parser.add_argument('--db-replicas', nargs='?', type=str,
+        metavar='URI[,URI...]', help='Read replica Database URIs',
+        dest='APPUSERS_DATABASE_REPLICAS')
+    parser.add_argument('--replica-pin-timeout', nargs='?', type=int,
+        metavar='INT',
+        help='Seconds client reads from primary Database after write',
+        dest='APPUSERS_REPLICA_PIN_TIMEOUT')
+    parser.add_argument('--count-cache-timeout', nargs='?', type=int,
+        metavar='INT', help='Cached count of all Users or Groups timeout in seconds',
+        dest='APPUSERS_COUNT_CACHE_TIMEOUT')
+    parser.add_argument('--fulltext-search', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Search Users with SQLite FTS5 index',
+        dest='APPUSERS_FULLTEXT_SEARCH')
+    parser.add_argument('--principal-cache', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Cache authenticated Users in worker',
+        dest='APPUSERS_PRINCIPAL_CACHE')
+    parser.add_argument('--principal-cache-size', nargs='?', type=int,
+        metavar='INT', help='Maximal number of cached authenticated Users',
+        dest='APPUSERS_PRINCIPAL_CACHE_SIZE')
+    parser.add_argument('--principal-cache-timeout', nargs='?', type=int,
+        metavar='INT',
+        help='Cached authenticated User timeout (revocation delay) in seconds',
+        dest='APPUSERS_PRINCIPAL_CACHE_TIMEOUT')
+    parser.add_argument('--response-cache', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Cache List Users and Groups Responses',
+        dest='APPUSERS_RESPONSE_CACHE')
+    parser.add_argument('--response-cache-size', nargs='?', type=int,
+        metavar='INT', help='Maximal size of cached Responses in bytes',
+        dest='APPUSERS_RESPONSE_CACHE_SIZE')
+    parser.add_argument('--response-cache-timeout', nargs='?', type=int,
+        metavar='INT', help='Cached Response timeout in seconds',
+        dest='APPUSERS_RESPONSE_CACHE_TIMEOUT')
+    parser.add_argument('--entity-cache', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Cache User and Group Representations',
+        dest='APPUSERS_ENTITY_CACHE')
+    parser.add_argument('--entity-cache-size', nargs='?', type=int,
+        metavar='INT', help='Maximal number of cached Representations',
+        dest='APPUSERS_ENTITY_CACHE_SIZE')
+    parser.add_argument('--entity-cache-timeout', nargs='?', type=int,
+        metavar='INT', help='Cached Representation timeout in seconds',
+        dest='APPUSERS_ENTITY_CACHE_TIMEOUT')
+    parser.add_argument('--json-provider', nargs='?', type=str,
+        metavar='auto|orjson|stdlib', help='JSON encoder and decoder',
+        dest='APPUSERS_JSON_PROVIDER')
+    parser.add_argument('--sqlite-journal-mode', nargs='?', type=str,
+        metavar='DELETE|TRUNCATE|PERSIST|MEMORY|WAL|OFF',
+        help='SQLite journal_mode pragma', dest='APPUSERS_SQLITE_JOURNAL_MODE')
+    parser.add_argument('--sqlite-synchronous', nargs='?', type=str,
+        metavar='OFF|NORMAL|FULL|EXTRA', help='SQLite synchronous pragma',
+        dest='APPUSERS_SQLITE_SYNCHRONOUS')
+    parser.add_argument('--sqlite-mmap-size', nargs='?', type=int,
+        metavar='INT', help='SQLite mmap_size pragma in bytes',
+        dest='APPUSERS_SQLITE_MMAP_SIZE')
+    parser.add_argument('--sqlite-cache-size', nargs='?', type=int,
+        metavar='INT', help='SQLite cache_size pragma, pages or -KiB',
+        dest='APPUSERS_SQLITE_CACHE_SIZE')
+    parser.add_argument('--sqlite-busy-timeout', nargs='?', type=int,
+        metavar='INT', help='SQLite busy_timeout pragma in milliseconds',
+        dest='APPUSERS_SQLITE_BUSY_TIMEOUT')
+    parser.add_argument('--db-pool-size', nargs='?', type=int,
+        metavar='INT', help='Database connection pool size',
+        dest='APPUSERS_DATABASE_POOL_SIZE')
+    parser.add_argument('--db-max-overflow', nargs='?', type=int,
+        metavar='INT', help='Database connections allowed over pool size',
+        dest='APPUSERS_DATABASE_MAX_OVERFLOW')
+    parser.add_argument('--db-pool-recycle', nargs='?', type=int,
+        metavar='INT', help='Database connection recycle time in seconds',
+        dest='APPUSERS_DATABASE_POOL_RECYCLE')
+    parser.add_argument('--db-pool-pre-ping', nargs='?', type=ast.literal_eval,
+        metavar='True|False', help='Test Database connections on checkout',
+        dest='APPUSERS_DATABASE_POOL_PRE_PING')
 
     parsed_args, unknown = parser.parse_known_args()
     parsed_args = vars(parsed_args) # convert Namespace to dict
@@ -146,3 +394,39 @@ def configure(app):
         app.logger.warning(f'Command Line options errors:\n{e}')
         app.logger.warning('Skipping all Coommand Line options!')
         # exit(1)
+
+    """ Merge DATABASE_POOL_* Configuration Variables to
+        SQLALCHEMY_ENGINE_OPTIONS used by Flask-SQLAlchemy to create engine.
+    """
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    pool_options = {
+        'pool_size': 'DATABASE_POOL_SIZE',
+        'max_overflow': 'DATABASE_MAX_OVERFLOW',
+        'pool_recycle': 'DATABASE_POOL_RECYCLE',
+        'pool_pre_ping': 'DATABASE_POOL_PRE_PING'
+        }
+    for option, key in pool_options.items():
+        if app.config.get(key) is not None:
+            engine_options[option] = app.config[key]
+    if (app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') and
+            ('pool_size' in engine_options or 'max_overflow' in engine_options)):
+        # SQLite file Database uses NullPool by default, which has no size.
+        # Pooled connections are used by many threads one at a time.
+        engine_options.setdefault('poolclass', QueuePool)
+        engine_options['connect_args'] = dict(
+            engine_options.get('connect_args', {}), check_same_thread=False)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    """ Add read replicas from DATABASE_REPLICAS to SQLALCHEMY_BINDS
+        with keys 'replica0', 'replica1', ... and 'audit' bind
+    """
+    replicas = app.config['DATABASE_REPLICAS']
+    if isinstance(replicas, str):
+        replicas = [uri.strip() for uri in replicas.split(',') if uri.strip()]
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for i, uri in enumerate(replicas):
+        binds[f'replica{i}'] = uri
+    # Login audit log table is always in 'audit' bind
+    binds['audit'] = (app.config['AUDIT_DATABASE_URI'] or
+        app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = binds
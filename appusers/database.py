@@ -12,69 +12,593 @@ db uses following Application Config variables declared in Application Factory:
 - SQLALCHEMY_DATABASE_URI - Database URI used for connection
 - SQLALCHEMY_TRACK_MODIFICATIONS - set acording to Flask-SQLAlchemy documentation
 
+Model methods commit changes by calling commit() function. With UNIT_OF_WORK
+Application Config variable set, commit() only flushes changes during
+a Request and single commit (or rollback on error) is executed at the end of
+Request by hooks registered with init_unit_of_work(app).
+
+Read replicas are SQLALCHEMY_BINDS with 'replica' key prefix, created from
+DATABASE_REPLICAS Application Config variable. Sessions route reads of GET
+Requests to replicas, round-robin, after init_read_replicas(app) is called.
+Writes always go to primary Database and client which has just written is
+pinned to primary Database for REPLICA_PIN_TIMEOUT (read-your-writes).
+
+SQLite pragmas are set on every new connection from SQLITE_* Application
+Config variables by connect event hook registered with init_sqlite_pragmas(app).
+
+Full-text search of Users (q filter) is backed by SQLite FTS5 virtual table
+user_fts, created and kept in sync with user table by triggers installed with
+init_fulltext_search(app). On other Databases, or if FTS5 is not available,
+q filter falls back to prefix LIKE matching.
+
+User and Group rows carry version column incremented by every UPDATE
+(SQLAlchemy version_id_col, Core statements increment it explicitly).
+Concurrent update of the same row fails with StaleDataError, Resource
+Representations are tagged with version (ETag).
+
+Principals (userid, admin and lock status, authorization epoch) of
+authenticated Users are cached by load_principal(), in per worker cache
+invalidated by User methods. Serialized User and Group Representations are
+cached in entity_cache by Retrieve operations, entries of Users and Groups
+written in a transaction are evicted when it commits.
+
+Login attempts audit records (LoginEvent) are stored in 'audit' bind, by
+default in primary Database. Binds with primary Database URI share primary
+engine.
+
+Indexes and other schema changes are applied to existing Databases with
+Flask-Migrate revisions in migrations folder: python manage.py db upgrade
+
 Check all Flask-SQLAlchemy configration options at:
     https://flask-sqlalchemy.palletsprojects.com/en/2.x/config/
 """
+import re
+from collections import defaultdict
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from itertools import chain, cycle
+from threading import Lock
+from flask import current_app, has_request_context, g, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import (and_, or_, case, event, exc, orm, func, text, table,
+    column, inspect)
 from sqlalchemy.orm import load_only
 from sqlalchemy.sql import expression
-
+from sqlalchemy.sql.dml import UpdateBase
+from appusers.cache import LRUCache
+from appusers.passwords import hasher
+
+
+class RoutingSession(SignallingSession):
+    """Session routing reads to read replica chosen for current Request"""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('read_replica') if has_request_context() else None
+        if (replica is None or self._flushing
+                or isinstance(clause, UpdateBase)
+                or (mapper is not None
+                    and mapper.persist_selectable.info.get('bind_key'))):
+            return super().get_bind(mapper, clause)
+        return db.get_engine(self.app, bind=replica)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy object creating RoutingSession sessions"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_engine(self, app=None, bind=None):
+        """Return engine of bind, binds with primary Database URI share
+           primary engine (one transaction and SQLite lock per session)
+        """
+        app = self.get_app(app)
+        if bind is not None:
+            binds = app.config.get('SQLALCHEMY_BINDS') or {}
+            if binds.get(bind) == app.config['SQLALCHEMY_DATABASE_URI']:
+                bind = None
+        return super().get_engine(app, bind)
 
 # Database object is initialized in Application Factory
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+# Clients pinned to primary Database after write, see init_read_replicas()
+primary_pins = LRUCache(maxsize=10000)
+
+# Generation counters of tables, incremented after commit of every write
+# to table, see mark_written()
+table_generations = defaultdict(int)
+
+# Counts of all rows of tables, with generation of table, see table_count()
+count_cache = LRUCache(maxsize=64)
+
+# Principals of authenticated Users, see load_principal()
+principal_cache = LRUCache(maxsize=10000)
+
+# Serialized Representations of Users and Groups, populated by Retrieve
+# operations: (table, primary key) -> (version, JSON bytes). Entries of
+# written rows are evicted after commit, see mark_entity_written()
+entity_cache = LRUCache(maxsize=10000)
+
+def init_caches(app):
+    """Configure Database caches from Application Config variables"""
+    count_cache.configure(ttl=app.config['COUNT_CACHE_TIMEOUT'].total_seconds())
+    principal_cache.configure(
+        maxsize=app.config['PRINCIPAL_CACHE_SIZE'],
+        ttl=app.config['PRINCIPAL_CACHE_TIMEOUT'].total_seconds())
+    entity_cache.configure(
+        maxsize=app.config['ENTITY_CACHE_SIZE'],
+        ttl=app.config['ENTITY_CACHE_TIMEOUT'].total_seconds())
+
+def mark_written(*tables):
+    """Record tables written in current session, their generation counters
+       are incremented after commit. ORM writes are recorded automatically,
+       Core statements must call this function.
+    """
+    db.session.info.setdefault('written_tables', set()).update(tables)
+
+def mark_entity_written(obj, session=None):
+    """Record User or Group written in current session, its entity_cache
+       entry is evicted after commit. ORM writes are recorded automatically,
+       Core statements must call this function.
+    """
+    session = session or db.session
+    key = (obj.__table__.name, inspect(obj).identity[0])
+    session.info.setdefault('written_entities', set()).add(key)
+
+def get_generation(*tables):
+    """Return tuple of generation counters of tables, it changes after every
+       committed write to any of them in this worker
+    """
+    return tuple(table_generations[table] for table in tables)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_flushed_tables(session, flush_context):
+    """Record tables of flushed objects, including members of Users and Groups"""
+    tables = session.info.setdefault('written_tables', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        tables.add(obj.__table__.name)
+        if isinstance(obj, (User, Group)):
+            tables.add(members.name)
+            if obj not in session.new:
+                mark_entity_written(obj, session)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def increment_generations(session):
+    """Increment generation counters of tables written in committed
+       transaction, evict written Users and Groups from entity_cache and
+       Principals of written Users from principal_cache. Eviction after
+       commit (not after flush in Unit of Work mode) keeps concurrent
+       Requests from caching data of uncommitted transaction.
+    """
+    for table in session.info.pop('written_tables', ()):
+        table_generations[table] += 1
+    for key in session.info.pop('written_entities', ()):
+        entity_cache.pop(key)
+        if key[0] == User.__tablename__:
+            principal_cache.pop(key[1])
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def forget_written_tables(session, previous_transaction):
+    """Forget tables and entities written in rolled back transaction"""
+    session.info.pop('written_tables', None)
+    session.info.pop('written_entities', None)
+
+def table_count(model, estimate=False):
+    """Return number of all rows of model table
+
+    Exact count is cached until next write to table or COUNT_CACHE_TIMEOUT.
+    Counts read from a read replica are not cached, replica may lag behind
+    writes to table. If estimate is True and count is not cached, maximal
+    primary key value is returned instead, which is found without scanning
+    the table.
+    """
+    table = model.__table__
+    pk = table.primary_key.columns.values()[0]
+    generation = table_generations[table.name]
+    cached = count_cache.get(table.name)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    if estimate:
+        return db.session.query(func.max(pk)).scalar() or 0
+    count = db.session.query(func.count(pk)).scalar()
+    if not g.get('read_replica'):
+        count_cache.set(table.name, (generation, count))
+    return count
+
+class Principal:
+    """Authenticated User identity: userid, admin and lock status and
+    authorization epoch
+
+    Principal is cached by load_principal() in place of User Object and
+    provides the same get_admin() and get_lock() methods.
+    """
+    __slots__ = ('userid', 'admin', 'locked', 'authz_epoch')
+
+    def __init__(self, user):
+        self.userid = user.userid
+        self.admin = user.admin
+        self.locked = user.locked
+        self.authz_epoch = user.authz_epoch
+
+    def get_admin(self):
+        """Return admin status of this User"""
+        return self.admin
+
+    def get_lock(self):
+        """Return lock status of this User"""
+        return self.locked
+
+def load_principal(userid):
+    """Return Principal of User with userid or None if User does not exist
+
+    Principals are cached for PRINCIPAL_CACHE_TIMEOUT, committed writes to
+    User invalidate cached Principal (see increment_generations()).
+    Principals read from a read replica, or while user table was written,
+    are not cached, they may lag behind those writes.
+    With PRINCIPAL_CACHE disabled User Object is returned.
+    """
+    if not current_app.config.get('PRINCIPAL_CACHE'):
+        return User.retrieve(userid)
+    principal = principal_cache.get(userid)
+    if principal is None:
+        generation = get_generation(User.__tablename__)
+        user = User.retrieve(userid)
+        if user is None:
+            return None
+        principal = Principal(user)
+        if (not g.get('read_replica') and
+                get_generation(User.__tablename__) == generation):
+            principal_cache.set(userid, principal)
+    return principal
+
+def commit():
+    """Commit Database session, or only flush it in Unit of Work mode"""
+    if has_request_context() and current_app.config.get('UNIT_OF_WORK'):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+def init_unit_of_work(app):
+    """Register Request hooks committing Unit of Work once per Request
+
+    Changes staged by model methods are committed after Request is processed,
+    or rolled back if Request processing failed with Server Error.
+    """
+    @app.after_request
+    def commit_unit_of_work(response):
+        if app.config.get('UNIT_OF_WORK'):
+            if response.status_code >= 500:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        return response
+
+    @app.teardown_request
+    def rollback_unit_of_work(exc):
+        if exc is not None and app.config.get('UNIT_OF_WORK'):
+            db.session.rollback()
+
+# SQLite pragmas set from Application Config variables, busy_timeout goes
+# first, so that following pragmas wait for locks held by other connections
+SQLITE_PRAGMAS = {
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE'
+    }
+
+def init_sqlite_pragmas(app):
+    """Register connect event hook setting SQLITE_* pragmas on SQLite
+       Database (and binds) connections. Must be called before first
+       connection.
+    """
+    pragmas = [(pragma, app.config[key]) for pragma, key in SQLITE_PRAGMAS.items()
+        if app.config.get(key) is not None]
+    if not pragmas:
+        return
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
+
+    engines = {db.get_engine(app, bind=bind)
+        for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {})}
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', set_sqlite_pragmas)
+
+def init_read_replicas(app):
+    """Register Request hooks routing reads of GET Requests to replicas
+
+    Replicas are chosen round-robin, one for each Request. Client (its
+    Authorization header and address) which made successful write Request
+    is pinned to primary Database for REPLICA_PIN_TIMEOUT.
+    """
+    replicas = [key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+        if key.startswith('replica')]
+    if not replicas:
+        return
+    next_replica = cycle(sorted(replicas))
+    lock = Lock()
+    primary_pins.configure(
+        ttl=app.config['REPLICA_PIN_TIMEOUT'].total_seconds())
+
+    def client_keys():
+        keys = [request.remote_addr]
+        if 'Authorization' in request.headers:
+            keys.append(request.headers['Authorization'])
+        return keys
+
+    @app.before_request
+    def route_to_replica():
+        if request.method in ('GET', 'HEAD'):
+            if not any(primary_pins.get(key) for key in client_keys()):
+                with lock:
+                    g.read_replica = next(next_replica)
+
+    @app.after_request
+    def pin_to_primary(response):
+        if request.method not in ('GET', 'HEAD') and response.status_code < 400:
+            for key in client_keys():
+                primary_pins.set(key, True)
+        return response
+
+# user_fts is not part of Models metadata, it is created by
+# init_fulltext_search() and used only in q filter joins
+user_fts = table('user_fts', column('rowid'), column('rank'))
+
+FULLTEXT_COLUMNS = ['username', 'firstname', 'lastname', 'email']
+
+FULLTEXT_DDL = [
+    f"""CREATE VIRTUAL TABLE user_fts USING fts5(
+        {', '.join(FULLTEXT_COLUMNS)},
+        content='user', content_rowid='userid', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_fts_insert AFTER INSERT ON user BEGIN
+        INSERT INTO user_fts(rowid, {', '.join(FULLTEXT_COLUMNS)})
+        VALUES (new.userid, {', '.join('new.' + c for c in FULLTEXT_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_fts_delete AFTER DELETE ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, {', '.join(FULLTEXT_COLUMNS)})
+        VALUES ('delete', old.userid,
+            {', '.join('old.' + c for c in FULLTEXT_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_fts_update
+    AFTER UPDATE OF {', '.join(FULLTEXT_COLUMNS)} ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, {', '.join(FULLTEXT_COLUMNS)})
+        VALUES ('delete', old.userid,
+            {', '.join('old.' + c for c in FULLTEXT_COLUMNS)});
+        INSERT INTO user_fts(rowid, {', '.join(FULLTEXT_COLUMNS)})
+        VALUES (new.userid, {', '.join('new.' + c for c in FULLTEXT_COLUMNS)});
+    END"""
+    ]
+
+def init_fulltext_search(app):
+    """Create user_fts FTS5 table and triggers syncing it with user table
+
+    Index is built from existing Users when user_fts is created. Sets
+    FULLTEXT_SEARCH Application Config variable to False, if SQLite FTS5
+    can not be used. Must be called after db.create_all().
+    """
+    if not app.config.get('FULLTEXT_SEARCH'):
+        return
+    engine = db.get_engine(app)
+    if engine.dialect.name != 'sqlite':
+        app.config['FULLTEXT_SEARCH'] = False
+        return
+    try:
+        with engine.begin() as connection:
+            if not engine.dialect.has_table(connection, 'user_fts'):
+                connection.execute(text(FULLTEXT_DDL[0]))
+                connection.execute(
+                    text("INSERT INTO user_fts(user_fts) VALUES ('rebuild')"))
+            for ddl in FULLTEXT_DDL[1:]:
+                connection.execute(text(ddl))
+    except exc.OperationalError as e:
+        # SQLite compiled without FTS5
+        app.logger.warning(f'Full-text search disabled: {e}')
+        app.config['FULLTEXT_SEARCH'] = False
+
+def fulltext_filter(query, q):
+    """Return query filtered by tokenized, prefix matching search phrase q
+
+    Every token of q must prefix match a word of username, firstname,
+    lastname or email.
+    """
+    tokens = re.findall(r'\w+', q)
+    if not tokens:
+        return query.filter(expression.false())
+    if current_app.config.get('FULLTEXT_SEARCH'):
+        phrase = ' '.join(f'"{token}"*' for token in tokens)
+        query = query.join(user_fts, user_fts.c.rowid == User.userid)
+        return query.filter(text('user_fts MATCH :phrase').bindparams(
+            phrase=phrase))
+    columns = [User.__table__.c[name] for name in FULLTEXT_COLUMNS]
+    for token in tokens:
+        # '_' of \w tokens is LIKE wildcard
+        token = re.sub(r'([\\%_])', r'\\\1', token)
+        query = query.filter(or_(*[
+            c.ilike(f'{token}%', escape='\\') |
+            c.ilike(f'% {token}%', escape='\\')
+            for c in columns]))
+    return query
+
+def chunks(items, size=500):
+    """Split list of items to chunks fitting SQL IN clause parameter limits"""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def sort_keys(model, filters):
+    """Return list of (column, descending) pairs for sortBy filter
+
+    List is terminated with model's primary key, so that sort order is total
+    and can be used for keyset (cursor) pagination.
+    """
+    keys = []
+    names = []
+    for name in filters.get('sortBy', '').split(','):
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name and name not in names:
+            keys.append((model.__table__.c[name], descending))
+            names.append(name)
+    for column in model.__table__.primary_key:
+        if column.name not in names:
+            keys.append((column, False))
+    return keys
+
+def keyset_filter(keys, values):
+    """Return WHERE clause selecting rows placed after cursor values
+
+    keys is a list returned by sort_keys(), values is a list of sort key
+    values of last row on previous page. NULLs sort first in ascending order,
+    as in SQLite.
+    """
+    if len(keys) != len(values):
+        raise ValueError('Pagination cursor does not match sortBy')
+    clauses = []
+    for i, ((column, descending), value) in enumerate(zip(keys, values)):
+        if value is None:
+            if descending:
+                # nothing sorts after NULL in descending order
+                continue
+            after = column.isnot(None)
+        elif descending:
+            after = or_(column < value, column.is_(None))
+        else:
+            after = column > value
+        preceding = [c.is_(None) if v is None else c == v
+            for (c, _), v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*preceding, after))
+    return or_(*clauses)
 
 # This table stores Group-User membership records
 members = db.Table('members',
     db.Column('groupid', db.Integer, db.ForeignKey('group.groupid'),
         primary_key=True),
     db.Column('userid', db.Integer, db.ForeignKey('user.userid'),
-        primary_key=True)
+        primary_key=True),
+    # Reverse index for Group.get_list() 'member' filter
+    db.Index('ix_members_userid_groupid', 'userid', 'groupid')
     )
 
 class Group(db.Model):
     """Database Model of Group Resource"""
 
+    # Indexes for filter and sortBy columns, followed by primary key to serve
+    # keyset pagination. 'groupname' is covered by its unique constraint.
+    __table_args__ = (
+        db.Index('ix_group_description_groupid', 'description', 'groupid'),
+        )
+
     groupid = db.Column(db.Integer, primary_key=True)
     groupname = db.Column(db.String(20), unique=True, nullable=False)
     description = db.Column(db.Text)
+    # Incremented by every UPDATE (optimistic concurrency control), exposed
+    # as ETag of Group Resource
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     # 'users' value is a list of User objects
     users = db.relationship('User', back_populates='groups', secondary=members)
 
+    __mapper_args__ = {'version_id_col': version}
+
     def __init__(self, **kwargs):
         """Group Object constructor automatically inserts to Database"""
         super(Group, self).__init__(**kwargs)
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self, groupname=None, description=None, **kwargs):
-        """Update Group Object and commit to Database"""
+        """Update Group Object and commit to Database
+
+        Raises IntegrityError if groupname exists and StaleDataError if Group
+        was changed since it was loaded, after rolling back the session.
+        """
         if groupname:
             self.groupname = groupname
         if description:
             self.description = description
-        db.session.commit()
+        try:
+            commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
     def remove(self):
         """Permanently remove Group Object from Database"""
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
     def add_member(self, user):
         """Add user to this Group members"""
         if user:
             self.users.append(user)
-            db.session.commit()
+            commit()
 
     def remove_member(self, user):
         """Remove user from Group members"""
         if user and user in self.users:
             self.users.remove(user)
-            db.session.commit()
-
-    def list_members(self):
-        return User.query.filter(User.groups.any(groupid=self.groupid)).all()
+            commit()
+
+    def add_members(self, userids):
+        """Add Users with userids to this Group members with set-based insert
+
+        Returns tuple of counts: (added, already present, unknown userids).
+        """
+        userids = set(userids)
+        known = User.get_existing_userids(userids)
+        present = set()
+        for chunk in chunks(known):
+            query = db.session.query(members.c.userid).filter(
+                members.c.groupid == self.groupid,
+                members.c.userid.in_(chunk))
+            present.update(userid for userid, in query.all())
+        added = known - present
+        if added:
+            db.session.execute(
+                members.insert().prefix_with('OR IGNORE', dialect='sqlite'),
+                [{'groupid': self.groupid, 'userid': u} for u in added])
+            mark_written(members.name)
+        commit()
+        db.session.expire(self, ['users'])
+        return len(added), len(present), len(userids - known)
+
+    def remove_members(self, userids):
+        """Remove Users with userids from this Group with set-based delete
+
+        Returns tuple of counts: (removed, not a member, unknown userids).
+        """
+        userids = set(userids)
+        known = User.get_existing_userids(userids)
+        removed = 0
+        for chunk in chunks(known):
+            result = db.session.execute(members.delete().where(and_(
+                members.c.groupid == self.groupid,
+                members.c.userid.in_(chunk))))
+            removed += result.rowcount
+        mark_written(members.name)
+        commit()
+        db.session.expire(self, ['users'])
+        return removed, len(known) - removed, len(userids - known)
+
+    def list_members(self, filters=None):
+        """Retrieve a filtered list of this Group members from Database"""
+        return self.members_query(filters).all()
+
+    def count_members(self, filters=None, estimate=False):
+        """Return number of this Group members matching filters"""
+        return User.get_count(dict(filters or {}, group=self.groupid), estimate)
+
+    def members_query(self, filters=None):
+        """Return Query of a filtered list of this Group members"""
+        return User.get_query(dict(filters or {}, group=self.groupid))
+
+    def get_cursor(self, filters):
+        """Return pagination cursor values of this Group for filters sortBy"""
+        return [getattr(self, c.key) for c, _ in sort_keys(Group, filters)]
 
     @classmethod
     def retrieve(cls, groupid):
@@ -84,6 +608,46 @@ class Group(db.Model):
     @classmethod
     def get_list(cls, filters):
         """Retrieve a filtered list of Group Objects from Database"""
+        return cls.get_query(filters).all()
+
+    @classmethod
+    def get_query(cls, filters):
+        """Return Query of a filtered, sorted and paged list of Group Objects"""
+        query = cls.filter_query(filters)
+        # query.order_by() must be called before offset() or limit()
+        keys = sort_keys(cls, filters)
+        if 'return_fields' in filters:
+            # Select only returned columns, sort keys (with primary key) and
+            # version of page ETag
+            columns = set(filters['return_fields'].split(','))
+            columns.update(c.key for c, _ in keys)
+            columns.add('version')
+            query = query.options(load_only(*columns))
+        if 'after' in filters:
+            query = query.filter(keyset_filter(keys, filters['after']))
+        query = query.order_by(
+            *[c.desc() if descending else c for c, descending in keys])
+        if 'offset' in filters:
+            query = query.offset(filters['offset'])
+        if 'limit' in filters:
+            query = query.limit(filters['limit'])
+
+        return query
+
+    @classmethod
+    def get_count(cls, filters, estimate=False):
+        """Return number of Group Objects matching filters
+
+        Count of all Group Objects is cached, see table_count().
+        """
+        query = cls.filter_query(filters)
+        if query.whereclause is None:
+            return table_count(cls, estimate)
+        return query.with_entities(func.count(Group.groupid)).scalar()
+
+    @classmethod
+    def filter_query(cls, filters):
+        """Return Query of Group Objects matching filters"""
         query = cls.query
 
         if 'groupname' in filters:
@@ -91,22 +655,8 @@ class Group(db.Model):
             query = query.filter(Group.groupname.in_(groupnames))
         if 'member' in filters:
             query = query.filter(Group.users.any(userid=filters['member']))
-        if 'sortBy' in filters:
-            # query.order_by() must be called before offset() or limit()
-            sort_by = []
-            for col in filters['sortBy'].split(','):
-                if col[0] == '-':
-                    col = text(f'{col[1:]} DESC')
-                else:
-                    col = text(col)
-                sort_by.append(col)
-            query = query.order_by(*sort_by)
-        if 'offset' in filters:
-            query = query.offset(filters['offset'])
-        if 'limit' in filters:
-            query = query.limit(filters['limit'])
 
-        return query.all()
+        return query
 
     def __repr__(self):
         # Include 'groupid' in representation
@@ -115,6 +665,15 @@ class Group(db.Model):
 class User(db.Model):
     """Database Model of User Resource"""
 
+    # Indexes for filter and sortBy columns, followed by primary key to serve
+    # keyset pagination. 'username' is covered by its unique constraint.
+    __table_args__ = (
+        db.Index('ix_user_firstname_userid', 'firstname', 'userid'),
+        db.Index('ix_user_lastname_userid', 'lastname', 'userid'),
+        db.Index('ix_user_email_userid', 'email', 'userid'),
+        db.Index('ix_user_phone_userid', 'phone', 'userid'),
+        )
+
     userid = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
     firstname = db.Column(db.String(30), nullable=False)
@@ -128,12 +687,20 @@ class User(db.Model):
     failed_logins = db.Column(db.Integer, server_default='0')
     last_failed_login = db.Column(db.DateTime())
     admin = db.Column(db.Boolean, server_default=expression.false())
+    # Incremented when admin or lock status changes, Tokens carrying older
+    # epoch in claims lose admin privilege (see utils.admin_required)
+    authz_epoch = db.Column(db.Integer, nullable=False, server_default='0')
+    # Incremented by every UPDATE (optimistic concurrency control), exposed
+    # as ETag of User Resource
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, **kwargs):
         """User Object constructor automatically inserts to Database"""
         super(User, self).__init__(**kwargs)
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self,
             username=None,
@@ -142,7 +709,11 @@ class User(db.Model):
             email=None,
             phone=None,
             **kwargs):
-        """Update User Object and commit to Database"""
+        """Update User Object and commit to Database
+
+        Raises IntegrityError if username exists and StaleDataError if User
+        was changed since it was loaded, after rolling back the session.
+        """
         if username:
             self.username = username
         if firstname:
@@ -153,29 +724,36 @@ class User(db.Model):
             self.email = email
         if phone:
             self.phone = phone
-        db.session.commit()
+        try:
+            commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
     def remove(self):
         """Permanently remove User Object from Database"""
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
     def add_to_group(self, group):
         """Add this User to group"""
         if group:
             self.groups.append(group)
-            db.session.commit()
+            commit()
 
     def remove_from_group(self, group):
         """Remove this User from group"""
         if group and group in self.groups:
             self.groups.remove(group)
-            db.session.commit()
+            commit()
 
     def set_password(self, password):
-        """Set new password for this User"""
-        self.password = password
-        db.session.commit()
+        """Set new password for this User, stored as salted hash"""
+        self.update_columns(password=hasher.hash(password))
+
+    def check_password(self, password):
+        """Check if password matches password of this User"""
+        return hasher.verify(password, self.password or '')
 
     def get_lock(self):
         """Return lock status of this User"""
@@ -183,30 +761,123 @@ class User(db.Model):
 
     def set_lock(self):
         """Lock this User and record datetime of lock operation"""
-        self.locked = True
-        self.last_failed_login = datetime.now() # consider datetime.utcnow()
-        db.session.commit()
+        self.update_columns(
+            locked=True,
+            last_failed_login=datetime.now(), # consider datetime.utcnow()
+            authz_epoch=User.authz_epoch + 1
+            )
+
+    def record_failed_login(self, max_attempts):
+        """Count failed login of this User with single atomic UPDATE, lock
+           account when failed logins exceed max_attempts. Returns True
+           if account got locked.
+        """
+        failed_logins = User.failed_logins + 1
+        locks = and_(User.locked.isnot(True), failed_logins > max_attempts)
+        db.session.execute(
+            User.__table__.update()
+            .where(User.userid == self.userid)
+            .values(
+                failed_logins=failed_logins,
+                last_failed_login=datetime.now(),
+                locked=or_(User.locked.is_(True), failed_logins > max_attempts),
+                authz_epoch=User.authz_epoch + case([(locks, 1)], else_=0),
+                version=User.version + 1
+                )
+            )
+        # read new counter in the same transaction, which holds write lock
+        failed_logins = db.session.execute(
+            db.select([User.failed_logins]).where(User.userid == self.userid)
+            ).scalar()
+        mark_written(User.__tablename__)
+        mark_entity_written(self)
+        commit()
+        db.session.expire(self, ['failed_logins', 'last_failed_login',
+            'locked', 'authz_epoch', 'version'])
+        return failed_logins == max_attempts + 1
 
     def unlock(self):
         """Unlock this User and clear off failed login records"""
-        self.locked = False
-        self.failed_logins = 0
-        self.last_failed_login = None
-        db.session.commit()
+        self.update_columns(locked=False, failed_logins=0,
+            last_failed_login=None)
 
     def get_admin(self):
         """Return admin status of this User"""
         return self.admin
 
     def grant_admin(self):
-        """Grant admin status to this User"""
-        self.admin = True
-        db.session.commit()
+        """Grant admin status to this User, invalidate claims of Tokens
+           issued to this User
+        """
+        self.update_columns(admin=True, authz_epoch=User.authz_epoch + 1)
 
     def revoke_admin(self):
-        """Revoke admin status of this User"""
-        self.admin = False
-        db.session.commit()
+        """Revoke admin status of this User, invalidate claims of Tokens
+           issued to this User
+        """
+        self.update_columns(admin=False, authz_epoch=User.authz_epoch + 1)
+
+    def update_columns(self, **values):
+        """Update columns of this User with single atomic UPDATE, which
+           increments version instead of checking it, so that concurrent
+           lock, unlock, password and admin status changes do not fail with
+           StaleDataError (last writer wins)
+        """
+        db.session.execute(
+            User.__table__.update()
+            .where(User.userid == self.userid)
+            .values(version=User.version + 1, **values)
+            )
+        mark_written(User.__tablename__)
+        mark_entity_written(self)
+        commit()
+        db.session.expire(self, list(values) + ['version'])
+
+    def get_cursor(self, filters):
+        """Return pagination cursor values of this User for filters sortBy"""
+        return [getattr(self, c.key) for c, _ in sort_keys(User, filters)]
+
+    @classmethod
+    def create_many(cls, users):
+        """Insert list of User dictionaries to Database in one transaction
+
+        Returns dictionary mapping username to userid of inserted Users.
+        """
+        if not users:
+            return {}
+        try:
+            db.session.execute(cls.__table__.insert(), users)
+            mark_written(cls.__table__.name)
+            commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        usernames = [user['username'] for user in users]
+        userids = {}
+        for chunk in chunks(usernames):
+            query = db.session.query(cls.username, cls.userid).filter(
+                cls.username.in_(chunk))
+            userids.update(query.all())
+        return userids
+
+    @classmethod
+    def get_existing_usernames(cls, usernames):
+        """Return set of usernames already present in Database"""
+        existing = set()
+        for chunk in chunks(usernames):
+            query = db.session.query(cls.username).filter(
+                cls.username.in_(chunk))
+            existing.update(username for username, in query.all())
+        return existing
+
+    @classmethod
+    def get_existing_userids(cls, userids):
+        """Return set of userids already present in Database"""
+        existing = set()
+        for chunk in chunks(userids):
+            query = db.session.query(cls.userid).filter(cls.userid.in_(chunk))
+            existing.update(userid for userid, in query.all())
+        return existing
 
     @classmethod
     def retrieve(cls, userid):
@@ -216,6 +887,51 @@ class User(db.Model):
     @classmethod
     def get_list(cls, filters):
         """Retrieve a filtered list of User Objects from Database"""
+        return cls.get_query(filters).all()
+
+    @classmethod
+    def get_query(cls, filters):
+        """Return Query of a filtered, sorted and paged list of User Objects"""
+        query = cls.filter_query(filters)
+        # query.order_by() must be called before offset() or limit()
+        keys = sort_keys(cls, filters)
+        if 'return_fields' in filters:
+            # Select only returned columns, sort keys (with primary key) and
+            # version of page ETag
+            columns = set(filters['return_fields'].split(','))
+            columns.update(c.key for c, _ in keys)
+            columns.add('version')
+            query = query.options(load_only(*columns))
+        if 'after' in filters:
+            if 'q' in filters:
+                raise ValueError('Pagination cursor can not be used with q')
+            query = query.filter(keyset_filter(keys, filters['after']))
+        if 'q' in filters and current_app.config.get('FULLTEXT_SEARCH'):
+            # Best matching Users first, sortBy orders equally ranked Users
+            query = query.order_by(user_fts.c.rank)
+        query = query.order_by(
+            *[c.desc() if descending else c for c, descending in keys])
+        if 'offset' in filters:
+            query = query.offset(filters['offset'])
+        if 'limit' in filters:
+            query = query.limit(filters['limit'])
+
+        return query
+
+    @classmethod
+    def get_count(cls, filters, estimate=False):
+        """Return number of User Objects matching filters
+
+        Count of all User Objects is cached, see table_count().
+        """
+        query = cls.filter_query(filters)
+        if query.whereclause is None:
+            return table_count(cls, estimate)
+        return query.with_entities(func.count(User.userid)).scalar()
+
+    @classmethod
+    def filter_query(cls, filters):
+        """Return Query of User Objects matching filters"""
         query = cls.query
 
         if 'username' in filters:
@@ -231,23 +947,56 @@ class User(db.Model):
             query = query.filter(User.email == filters['email'])
         if 'phone' in filters:
             query = query.filter(User.phone == filters['phone'])
-        if 'sortBy' in filters:
-            # query.order_by() must be called before offset() or limit()
-            sort_by = []
-            for col in filters['sortBy'].split(','):
-                if col[0] == '-':
-                    col = text(f'{col[1:]} DESC')
-                else:
-                    col = text(col)
-                sort_by.append(col)
-            query = query.order_by(*sort_by)
-        if 'offset' in filters:
-            query = query.offset(filters['offset'])
-        if 'limit' in filters:
-            query = query.limit(filters['limit'])
+        if 'group' in filters:
+            query = query.join(members, members.c.userid == User.userid)
+            query = query.filter(members.c.groupid == filters['group'])
+        if 'q' in filters:
+            query = fulltext_filter(query, filters['q'])
 
-        return query.all()
+        return query
 
     def __repr__(self):
         # Include 'groupid' in Object representation
         return f'<User {self.username}, id={self.userid}>'
+
+
+class LoginEvent(db.Model):
+    """Database Model of Login attempt audit record
+
+    Table is stored in 'audit' bind, which may be a separate Database, so
+    userid is not a foreign key. Records are inserted in batches by
+    audit.AuditLog, never updated.
+    """
+    __bind_key__ = 'audit'
+    __tablename__ = 'login_event'
+    # Index serves paging of User's events and retention pruning
+    __table_args__ = (
+        db.Index('ix_login_event_userid_eventid', 'userid', 'eventid'),
+        db.Index('ix_login_event_time', 'time'),
+        )
+
+    eventid = db.Column(db.Integer, primary_key=True)
+    userid = db.Column(db.Integer)
+    username = db.Column(db.String(64))
+    address = db.Column(db.String(45))
+    result = db.Column(db.String(20), nullable=False)
+    time = db.Column(db.DateTime(), nullable=False)
+
+    @classmethod
+    def get_list(cls, userid, filters):
+        """Return list of LoginEvent Objects of User, newest first, paged
+           with 'after' cursor and 'limit'
+        """
+        query = cls.query.filter(cls.userid == userid)
+        keys = sort_keys(cls, {'sortBy': '-eventid'})
+        if 'after' in filters:
+            query = query.filter(keyset_filter(keys, filters['after']))
+        query = query.order_by(cls.eventid.desc())
+        return query.limit(filters['limit']).all()
+
+    def get_cursor(self, filters):
+        """Return pagination cursor values of this LoginEvent"""
+        return [self.eventid]
+
+    def __repr__(self):
+        return f'<LoginEvent {self.result}, userid={self.userid}, id={self.eventid}>'
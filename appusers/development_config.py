@@ -9,6 +9,12 @@ SERVER_NAME = 'localhost:5000'
 SQLALCHEMY_DATABASE_URI = 'sqlite:///appusers.sqlite3'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# SQLite pragmas for development, WAL journal lets readers run concurrently
+# with a writer
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_BUSY_TIMEOUT = 5000
+
 # X-API-Key value for development
 API_KEY = 'appusers' # change this!
 
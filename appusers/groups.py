@@ -10,14 +10,20 @@ as well as all Operations related to:
 Blueprint is registered in Application Factory function.
 """
 
-from flask import Blueprint, request, jsonify, make_response, url_for, current_app
+from flask import Blueprint, request, make_response, url_for, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
-from appusers.models import (group_schema, group_list_schema,
-    groups_filters_schema, GroupListSchema, group_members_filters_schema,
-    user_list_schema, UserListSchema)
-from appusers.database import Group, User
-from appusers.utils import json_body, api_key_required, admin_required
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from appusers.models import (group_schema, groups_filters_schema,
+    GroupListSchema, group_members_filters_schema, group_members_body_schema,
+    UserListSchema, list_serializer)
+from appusers.database import Group, User, members, get_generation
+from appusers.jsonprovider import jsonify
+from appusers.utils import (json_body, api_key_required, admin_required,
+    next_page_link, collection_etag, not_modified, precondition_failed,
+    response_cache_key, cached_response, cache_response, cached_entity,
+    cache_entity, stream_requested, stream_response)
 
 
 # Create Groups enpoint Blueprint
@@ -30,11 +36,21 @@ def list_groups():
     List and filter Groups Collection
 
     Args:
-        request.args - Query String parameters: filtering, sorting
-            and pagination
+        request.args - Query String parameters: filtering, sorting,
+            pagination (offset or 'after' cursor and limit) and
+            'links=false' omitting 'href' of Groups
         X-API-Key in request.headers
+        If-None-Match in request.headers - ETag of cached page
 
     Returns:
+        'ETag' Response Header of page, derived from groupids and versions
+            of Groups in page, total count and filters, or 304 if it matches
+            If-None-Match
+        Responses are served from response cache until next write to group
+        or members table
+        'Link' Response Header with URI of next page, when page is full
+        'X-Total-Count' Response Header with number of Groups matching
+            filters, if 'count' is 'exact' or 'estimate'
         JSON array of Group Resource Representations or Error Message
     """
     try:
@@ -45,13 +61,41 @@ def list_groups():
             )
         return make_response('Bad request', 400)
 
-    filtered_list = Group.get_list(filters)
-    if 'return_fields' in filters:
-        return_fields = filters['return_fields'].split(',') + ['href']
-        groups = GroupListSchema(many=True, only=return_fields).dump(filtered_list)
-    else:
-        groups = group_list_schema.dump(filtered_list)
-    return jsonify(groups)
+    cache_key = response_cache_key(filters)
+    generation = get_generation(Group.__tablename__, members.name)
+    response = cached_response(cache_key, generation)
+    if response is not None:
+        return response
+
+    try:
+        filtered_list = Group.get_list(filters)
+    except ValueError as e:
+        current_app.logger.warning(
+            f'list_groups() Query String validation failed.\nValueError: {e}'
+            )
+        return make_response('Bad request', 400)
+    count = None
+    if 'count' in filters:
+        count = Group.get_count(
+            filters, estimate=filters['count'] == 'estimate')
+
+    etag = collection_etag(filtered_list, filters, count)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    schema = list_serializer(GroupListSchema,
+        filters.get('return_fields'), filters.get('links', True))
+    groups = schema.dump(filtered_list)
+    response = jsonify(groups)
+    response.set_etag(etag)
+    if 'limit' in filters and len(filtered_list) == filters['limit']:
+        response.headers['Link'] = next_page_link(
+            filtered_list[-1].get_cursor(filters))
+    if count is not None:
+        response.headers['X-Total-Count'] = count
+    cache_response(cache_key, generation, etag, response)
+    return response
 
 @bp.route('', methods=['POST'])
 @jwt_required
@@ -96,13 +140,29 @@ def retrieve_group(groupid):
     Args:
         groupid: Path Parameter - Unique ID of Group Resource (int)
         X-API-Key in request.headers
+        If-None-Match in request.headers - ETag of cached Representation
 
     Returns:
         JSON Object with Group Resource Representation or Error Message
+        'ETag' Response Header with Group version, or 304 if it matches
+            If-None-Match
+        Representation is served from entity cache until Group is written
     """
+    key = (Group.__tablename__, groupid)
+    response = cached_entity(key)
+    if response is not None:
+        return response
+    generation = get_generation(Group.__tablename__)
     group = Group.retrieve(groupid)
     if group:
-        return jsonify(group_schema.dump(group))
+        etag = str(group.version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        response = jsonify(group_schema.dump(group))
+        response.set_etag(etag)
+        cache_entity(key, generation, group.version, response)
+        return response
     else:
         return("Not Found", 404)
 
@@ -119,21 +179,35 @@ def replace_group(groupid, data):
         data - dictionary with all Group Resource attributes, loaded from
             Request body JSON and validated with models.group_schema
         JWT Baerer Authorization in request.headers - admin privilege required
+        If-Match in request.headers - optional ETag of Group version, which
+            was modified
 
     Returns:
-        Confirmation or Error Message
+        Confirmation or Error Message, 412 if Group version does not match
+        If-Match or Group was changed concurrently
     """
     group = Group.retrieve(groupid)
     if not group:
         return make_response('Not found', 404)
 
-    if Group.get_list({'groupname': data['groupname']}):
+    if precondition_failed(str(group.version)):
         current_app.logger.warning(
-            f'create_group() failed. Groupname={data["groupname"]} already exists'
+            f'replace_group(groupid={groupid}) failed. Version {group.version} does not match If-Match'
             )
-        return make_response('Bad request', 400)
+        return make_response('Precondition Failed', 412)
 
-    group.update(**data)
+    try:
+        group.update(**data)
+    except IntegrityError as e:
+        current_app.logger.warning(
+            f'replace_group(groupid={groupid}) failed. Groupname={data.get("groupname")} already exists\nError: {e}'
+            )
+        return make_response('Bad request', 400)
+    except StaleDataError:
+        current_app.logger.warning(
+            f'replace_group(groupid={groupid}) failed. Group was changed concurrently'
+            )
+        return make_response('Precondition Failed', 412)
 
     return make_response('OK', 200)
 
@@ -150,21 +224,35 @@ def update_group(groupid, data):
         data - dictionary with partial Group Resource attributes, loaded from
             Request body JSON and validated with models.group_schema
         JWT Baerer Authorization in request.headers - admin privilege required
+        If-Match in request.headers - optional ETag of Group version, which
+            was modified
 
     Returns:
-        Confirmation or Error Message
+        Confirmation or Error Message, 412 if Group version does not match
+        If-Match or Group was changed concurrently
     """
     group = Group.retrieve(groupid)
     if not group:
         return make_response('Not found', 404)
 
-    if 'groupname' in data and Group.get_list({'groupname': data['groupname']}):
+    if precondition_failed(str(group.version)):
         current_app.logger.warning(
-            f'create_group() failed. Groupname={data["groupname"]} already exists'
+            f'update_group(groupid={groupid}) failed. Version {group.version} does not match If-Match'
             )
-        return make_response('Bad request', 400)
+        return make_response('Precondition Failed', 412)
 
-    group.update(**data)
+    try:
+        group.update(**data)
+    except IntegrityError as e:
+        current_app.logger.warning(
+            f'update_group(groupid={groupid}) failed. Groupname={data.get("groupname")} already exists\nError: {e}'
+            )
+        return make_response('Bad request', 400)
+    except StaleDataError:
+        current_app.logger.warning(
+            f'update_group(groupid={groupid}) failed. Group was changed concurrently'
+            )
+        return make_response('Precondition Failed', 412)
 
     return make_response('OK', 200)
 
@@ -204,11 +292,24 @@ def list_group_members(groupid):
 
     Args:
         groupid: Path Parameter - Unique ID of Group Resource (int)
-        request.args - Query String parameters: fields
+        request.args - Query String parameters: filtering, sorting,
+            pagination ('after' cursor and limit), streaming and
+            'links=false' omitting 'href' of Users
         X-API-Key in request.headers
+        Accept in request.headers - 'application/x-ndjson' requests
+            streamed NDJSON Response
+        If-None-Match in request.headers - ETag of cached page
 
     Returns:
-        JSON array of User Resource Representations or Error Message
+        'ETag' Response Header of page (not streamed), derived from userids
+            and versions of members in page, total count and filters, or 304
+            if it matches If-None-Match
+        'Link' Response Header with URI of next page, when page is full
+        'X-Total-Count' Response Header with number of members matching
+            filters, if 'count' is 'exact' or 'estimate'
+        JSON array of User Resource Representations, streamed in chunks
+        if 'stream' is true, or NDJSON stream of User Resource
+        Representations, or Error Message
     """
     group = Group.retrieve(groupid)
     if group == None:
@@ -225,13 +326,92 @@ def list_group_members(groupid):
             )
         return make_response('Bad request', 400)
 
-    filtered_list = group.list_members()
-    if 'return_fields' in filters:
-        return_fields = filters['return_fields'].split(',') + ['href']
-        users = UserListSchema(many=True, only=return_fields).dump(filtered_list)
-    else:
-        users = user_list_schema.dump(filtered_list)
-    return jsonify(users)
+    schema = list_serializer(UserListSchema,
+        filters.get('return_fields'), filters.get('links', True))
+
+    count = None
+    try:
+        query = group.members_query(filters)
+        if 'count' in filters:
+            count = group.count_members(
+                filters, estimate=filters['count'] == 'estimate')
+        if stream_requested(filters):
+            response = stream_response(query, schema)
+        else:
+            filtered_list = query.all()
+            etag = collection_etag(filtered_list, filters, count)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            response = jsonify(schema.dump(filtered_list))
+            response.set_etag(etag)
+            if 'limit' in filters and len(filtered_list) == filters['limit']:
+                response.headers['Link'] = next_page_link(
+                    filtered_list[-1].get_cursor(filters))
+    except ValueError as e:
+        current_app.logger.warning(
+            f'list_group_members() Query String validation failed.\nValueError: {e}'
+            )
+        return make_response('Bad request', 400)
+    if count is not None:
+        response.headers['X-Total-Count'] = count
+    return response
+
+@bp.route('/<int:groupid>/members', methods=['PUT'])
+@jwt_required
+@admin_required
+@json_body(schema=group_members_body_schema)
+def add_users_to_group(groupid, data):
+    """
+    Add many Users to Group
+
+    Args:
+        groupid: Path Parameter - Unique ID of Group Resource (int)
+        data - dictionary with 'userids' list, loaded from Request body JSON
+            and validated with models.group_members_body_schema
+        JWT Baerer Authorization in request.headers - admin privilege required
+
+    Returns:
+        JSON Object with counts of added, already present and unknown
+        userids or Error Message
+    """
+    group = Group.retrieve(groupid)
+    if group == None:
+        current_app.logger.warning(
+            f'add_users_to_group() Group with id={groupid} not found'
+            )
+        return make_response('Group not found', 404)
+
+    added, present, unknown = group.add_members(data['userids'])
+    return jsonify({'added': added, 'present': present, 'unknown': unknown})
+
+@bp.route('/<int:groupid>/members', methods=['DELETE'])
+@jwt_required
+@admin_required
+@json_body(schema=group_members_body_schema)
+def delete_users_from_group(groupid, data):
+    """
+    Delete many Users from Group
+
+    Args:
+        groupid: Path Parameter - Unique ID of Group Resource (int)
+        data - dictionary with 'userids' list, loaded from Request body JSON
+            and validated with models.group_members_body_schema
+        JWT Baerer Authorization in request.headers - admin privilege required
+
+    Returns:
+        JSON Object with counts of removed, not present and unknown
+        userids or Error Message
+    """
+    group = Group.retrieve(groupid)
+    if group == None:
+        current_app.logger.warning(
+            f'delete_users_from_group() Group with id={groupid} not found'
+            )
+        return make_response('Group not found', 404)
+
+    removed, absent, unknown = group.remove_members(data['userids'])
+    return jsonify({'removed': removed, 'absent': absent, 'unknown': unknown})
 
 @bp.route('/<int:groupid>/members/<int:userid>', methods=['PUT'])
 @jwt_required
@@ -0,0 +1,109 @@
+"""JSON encoding module
+
+This module declares JSONProvider class, which encodes Response bodies and
+decodes Request bodies with orjson when it is installed, or with Flask JSON
+functions (stdlib json) otherwise. orjson is an optional dependency, it
+encodes large List Collection Responses several times faster.
+Views return jsonify(obj) declared here instead of flask.jsonify(obj).
+
+Both encoders produce equal JSON documents, orjson does not escape non-ASCII
+characters (JSON_AS_ASCII is ignored). Types unknown to orjson, and dates,
+are encoded with Flask JSONEncoder, like stdlib encoder does.
+
+json_provider, an instance of JSONProvider is declared here and is initialized
+in Application Factory function.
+json_provider uses following Application Config variables:
+
+- JSON_PROVIDER - 'auto' uses orjson when installed, 'orjson' or 'stdlib'
+- JSON_SORT_KEYS - sort keys of JSON objects (Flask default True)
+- JSONIFY_PRETTYPRINT_REGULAR - indent Responses, also indented in debug
+    mode (Flask default False)
+- JSONIFY_MIMETYPE - mimetype of Responses (Flask default application/json)
+"""
+from flask import current_app, request, json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+ORJSON = 'orjson'
+STDLIB = 'stdlib'
+
+# Marks Request body not decoded yet, see JSONProvider.get_json()
+MISSING = object()
+
+class JSONProvider:
+    """Encoder of Response bodies and decoder of Request bodies"""
+
+    def __init__(self):
+        self.name = STDLIB
+
+    def init_app(self, app):
+        """Select encoder by JSON_PROVIDER, fall back to stdlib"""
+        name = app.config['JSON_PROVIDER']
+        if name == 'auto':
+            name = ORJSON if orjson else STDLIB
+        elif name == ORJSON and orjson is None:
+            app.logger.warning(
+                'JSON_PROVIDER orjson is not installed, using stdlib')
+            name = STDLIB
+        self.name = name
+
+    def dumps(self, obj, pretty=False):
+        """Return obj encoded to JSON bytes"""
+        if self.name == ORJSON:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if current_app.config['JSON_SORT_KEYS']:
+                option |= orjson.OPT_SORT_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option)
+        if pretty:
+            return json.dumps(obj, indent=2, separators=(',', ': ')).encode(
+                'utf-8')
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def default(self, obj):
+        """Encode object unknown to orjson with Flask JSONEncoder"""
+        return current_app.json_encoder().default(obj)
+
+    def loads(self, data):
+        """Return object decoded from JSON bytes or string"""
+        if self.name == ORJSON:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def response(self, obj, status=None):
+        """Return Response with obj encoded to JSON, like flask.jsonify()"""
+        config = current_app.config
+        pretty = config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug
+        return current_app.response_class(self.dumps(obj, pretty) + b'\n',
+            status=status, mimetype=config['JSONIFY_MIMETYPE'])
+
+    def get_json(self, silent=False):
+        """Return Request body JSON decoded once per Request, None if Request
+           is not JSON. Invalid body raises ValueError, or returns None
+           if silent.
+        """
+        if not request.is_json:
+            return None
+        # cached on Request object, like flask.Request.get_json() does, g may
+        # be shared by Requests handled in one application context
+        body = getattr(request, '_json_body', MISSING)
+        if body is MISSING:
+            try:
+                body = self.loads(request.get_data(cache=True))
+            except ValueError:
+                if silent:
+                    return None
+                raise
+            request._json_body = body
+        return body
+
+# JSON provider object is initialized in Application Factory
+json_provider = JSONProvider()
+
+def jsonify(obj):
+    """Return Response with obj encoded to JSON by json_provider"""
+    return json_provider.response(obj)
@@ -15,12 +15,15 @@ Check all Flask-JWT-Extended configration options at:
     https://flask-jwt-extended.readthedocs.io/en/stable/options/
 """
 from datetime import datetime
-from flask import Blueprint, url_for, jsonify, current_app, make_response
+from flask import Blueprint, url_for, current_app, make_response, request
 from flask_jwt_extended import JWTManager, create_access_token
-from werkzeug.security import safe_str_cmp
-from appusers.database import User
+from appusers.database import User, load_principal
 from appusers.models import login_body_schema
-from appusers.utils import json_body
+from appusers.passwords import hasher
+from appusers.throttle import throttle
+from appusers.audit import audit
+from appusers.jsonprovider import jsonify
+from appusers.utils import json_body, login_rate_limited
 
 
 # JWT Manager object is initialized in Application Factory
@@ -30,6 +33,7 @@ jwt = JWTManager()
 bp = Blueprint('login', __name__, url_prefix='/login')
 
 @bp.route('', methods=['POST'])
+@login_rate_limited
 @json_body(schema=login_body_schema)
 def login(data):
     """
@@ -40,15 +44,21 @@ def login(data):
             Request body JSON and validated with models.login_body_schema
 
     Returns:
-        JSON with JWT Token and User link or Error Message. Token contains
-        'identity' field set to userid of authenticated User.
+        JSON with JWT Token and User link or Error Message (429 with
+        Retry-After header when login rate limit is exceeded). Token contains
+        'identity' field set to userid of authenticated User and
+        'user_claims' with 'admin' status and 'authz_epoch' of User.
         Token expires after JWT_ACCESS_TOKEN_EXPIRES.
     """
     user_list = User.get_list({'username': data['username']})
     if len(user_list) == 0:
+        # spend the same time as password check of existing User
+        hasher.verify_dummy(data['password'])
         current_app.logger.warning(
             f'authenticate_user() failed. No such user: {data["username"]}'
             )
+        audit.record('unknown_user', username=data['username'],
+            address=request.remote_addr)
         return make_response('Unathorized', 401)
     else:
         user = user_list[0]
@@ -56,6 +66,7 @@ def login(data):
     # check if User account is locked, lift lock if lock interval passed
     if user.last_failed_login and datetime.now() > user.last_failed_login + current_app.config['LOCK_TIMEOUT']:
         user.unlock()
+        throttle.clear(user.userid)
         current_app.logger.info(
             f'authenticate_user() - userid={user.userid} unlocked due to lock timeout'
             )
@@ -64,12 +75,23 @@ def login(data):
         current_app.logger.warning(
             f'authenticate_user() failed. Userid={user.userid} is locked'
             )
+        audit.record('locked', user.userid, user.username, request.remote_addr)
         return make_response('Unathorized', 401)
 
-    if safe_str_cmp(user.password.encode('utf-8'), data['password'].encode('utf-8')):
-        # clear lock info on successful login
-        user.unlock()
-        access_token = create_access_token(identity=user.userid)
+    if user.check_password(data['password']):
+        if hasher.needs_rehash(user.password):
+            # upgrade plaintext or outdated hash to current method and cost
+            user.set_password(data['password'])
+        # clear lock info on successful login, without write if there is
+        # nothing to clear
+        if user.failed_logins or user.last_failed_login:
+            user.unlock()
+        throttle.clear(user.userid)
+        # admin_required decides from claims, valid until authz_epoch changes
+        access_token = create_access_token(
+            identity=user.userid,
+            user_claims={'admin': user.admin, 'authz_epoch': user.authz_epoch}
+            )
         response = {'jwtToken': access_token,
             'userHref': url_for(
                 'users.retrieve_user',
@@ -79,28 +101,27 @@ def login(data):
         current_app.logger.info(
             f'authenticate_user() successful. {user.username} logged in'
             )
+        audit.record('success', user.userid, user.username, request.remote_addr)
         return(jsonify(response), 200)
     else:
         current_app.logger.warning(
             f'authenticate_user() failed. Incorrect password for userid={user.userid}'
             )
-        # update lock status
-        user.failed_logins = user.failed_logins + 1
-        user.last_failed_login = datetime.now() # consider datetime.utcnow()
-        if user.failed_logins > current_app.config['MAX_FAILED_LOGIN_ATTEMPTS']:
-            user.set_lock()
+        audit.record('bad_password', user.userid, user.username,
+            request.remote_addr)
+        # count failed login in throttle store, persist only lock transition
+        if throttle.failed_login(user):
             current_app.logger.warning(
                 f'Too many failed logins for userid={user.userid}, account locked'
                 )
-        user.update()
         return make_response('Unauthorized', 401)
 
 # Callback functions for JWTManager
 
 @jwt.user_loader_callback_loader
 def load_current_user(identity):
-    """Load User object for JWTManager, using Token's identity"""
-    return User.retrieve(identity)
+    """Load User Principal (cached) for JWTManager, using Token's identity"""
+    return load_principal(identity)
 
 @jwt.user_loader_error_loader
 def current_user_not_found(identity):
@@ -20,6 +20,12 @@ user_list_schema object provides serialization of arrays
 of User objects to Data Model of List Users Collection operation
 Response Body.
 
+list_serializer() function returns cached ListSerializer of List schema
+limited to 'fields' projection (and optionally without 'href' links), which
+dumps the same Data Model directly from row attributes, without per-field
+Marshmallow processing. Links are filled in URL templates built once per
+Request by url_template().
+
 groups_filters_schema object provides deserialization and validation of
 List Groups Collection operation Query String parameters.
 
@@ -29,6 +35,17 @@ List users Collection operation Query String parameters.
 group_members_filters_schema object provides deserialization and validation of
 Retrieve Group Members operation Query String parameters.
 
+Cursor field and encode_cursor() function provide opaque keyset pagination
+cursors used by List Collection operations ('after' Query String parameter
+and 'next' link in Response Link header).
+
+group_members_body_schema object provides deserialization and validation of
+Add and Delete many Group members operations Request body.
+
+login_event_list_schema object provides serialization of arrays of Login
+attempt audit records, login_events_filters_schema object provides
+deserialization and validation of their Query String parameters.
+
 set_password_body_schema object provides deserialization and
 validation of Set new password for User account operation Request body.
 
@@ -38,16 +55,45 @@ validation of Login operation Request body.
 config_variables_schema object provides deserialization and
 validation of Applicaition Configuration variables.
 """
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from copy import copy
+from operator import attrgetter
 from string import ascii_letters, digits
+from flask import url_for, g
 from flask_marshmallow import Marshmallow
 from marshmallow import (Schema, fields, pre_load, post_dump, validate,
     validates, validates_schema, ValidationError, EXCLUDE)
+from appusers.cache import LRUCache
 
 
 # Marshmallow object is initialized in Application Factory
 ma = Marshmallow()
 
+def encode_cursor(values):
+    """Encode list of sort key values to opaque pagination cursor string"""
+    data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+class Cursor(fields.Field):
+    """Opaque keyset pagination cursor, deserialized to list of sort key values"""
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        return encode_cursor(value)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            padding = '=' * (-len(value) % 4)
+            values = json.loads(urlsafe_b64decode(value + padding))
+        except (TypeError, ValueError):
+            raise ValidationError('Invalid pagination cursor')
+        if (not isinstance(values, list) or not values or not all(
+                v is None or isinstance(v, (str, int, float)) for v in values)):
+            raise ValidationError('Invalid pagination cursor')
+        return values
+
 class GroupSchema(Schema):
     """Data Model (schema) of external representation of Group Resource"""
     groupid = fields.Integer()
@@ -73,7 +119,10 @@ class GroupsQueryStringSchema(Schema):
     groupname = fields.Str()
     offset = fields.Integer(validate=validate.Range(min=0), missing=0)
     limit = fields.Integer(validate=validate.Range(min=1))
+    after = Cursor()
+    count = fields.Str(validate=validate.OneOf(['exact', 'estimate']))
     return_fields = fields.Str(data_key='fields')
+    links = fields.Boolean(truthy={'true'}, falsy={'false'})
     sortBy = fields.Str()
     member = fields.Integer(validate=validate.Range(min=0))
 
@@ -150,6 +199,9 @@ class UserSchema(Schema):
             ]
         )
 
+    # Fields moved to nested object by from_user_class(), see ListSerializer
+    dump_nesting = {'email': 'contactInfo', 'phone': 'contactInfo'}
+
     @post_dump
     def from_user_class(self, dump_data, **kwargs):
         """Convert email and phone fields to contactInfo"""
@@ -187,22 +239,171 @@ class UserListSchema(UserSchema):
 
 user_list_schema = UserListSchema(many=True)
 
+# Integer URL parameter value marking its place in URL template
+URL_PLACEHOLDER = 918273645546372819
+
+def url_template(endpoint, param, values):
+    """Return (prefix, suffix) pair of URLs built by url_for(endpoint,
+       **values) with integer param, which is placed between them.
+       Template is built once per Request (application context) by url_for,
+       so it follows SERVER_NAME, APPLICATION_ROOT and Request URL root.
+       Returns None if param is not found in URL once.
+    """
+    templates = g.setdefault('url_templates', {})
+    key = (endpoint, param, tuple(sorted(values.items())))
+    if key not in templates:
+        url = url_for(endpoint, **values, **{param: URL_PLACEHOLDER})
+        parts = url.split(str(URL_PLACEHOLDER))
+        templates[key] = tuple(parts) if len(parts) == 2 else None
+    return templates[key]
+
+def link_builder(endpoint, attrs, values):
+    """Return function building URL of endpoint for row, like URLFor field:
+       url_for(endpoint, **values) with parameters attrs (param -> attribute
+       name) taken from row, None if any of them is None. URL with single
+       integer parameter is filled in url_template() of current Request.
+    """
+    def build(row):
+        params = dict(values)
+        for param, attr in attrs.items():
+            params[param] = getattr(row, attr)
+        if None in params.values():
+            return None
+        return url_for(endpoint, **params)
+
+    if len(attrs) != 1:
+        return build
+    (param, attr), = attrs.items()
+    template = url_template(endpoint, param, values)
+    if template is None:
+        return build
+    prefix, suffix = template
+    getter = attrgetter(attr)
+
+    def build_from_template(row):
+        value = getter(row)
+        if type(value) is int:
+            return prefix + str(value) + suffix
+        return build(row)
+    return build_from_template
+
+def tuple_getter(names):
+    """Return function returning tuple of attributes of object"""
+    if len(names) == 1:
+        getter = attrgetter(names[0])
+        return lambda obj: (getter(obj),)
+    return attrgetter(*names)
+
+class ListSerializer:
+    """Serializer of List Collection rows, compiled from List schema
+
+    Dumps the same data as schema, reading row attributes at once with
+    attrgetter, instead of running Marshmallow field by field. Schema may
+    only have Integer and Str fields, URLFor fields and post_dump hook
+    moving fields to nested objects, described by dump_nesting attribute.
+    Other schemas are dumped by Marshmallow.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.many = schema.many
+        nesting = getattr(schema, 'dump_nesting', {})
+        plain = {}
+        self.urls = []
+        for name, field in schema.dump_fields.items():
+            key = field.data_key or name
+            if isinstance(field, ma.URLFor):
+                self.urls.append((key, field.endpoint, {
+                    param: value[1:-1] for param, value in field.values.items()
+                    if isinstance(value, str) and value.startswith('<')}, {
+                    param: value for param, value in field.values.items()
+                    if not (isinstance(value, str) and value.startswith('<'))}))
+            elif isinstance(field, (fields.Integer, fields.Str)):
+                plain.setdefault(nesting.get(key), []).append(
+                    (key, field.attribute or name))
+            else:
+                self.urls = []
+                self.dump_row = lambda row, links: schema.dump(row, many=False)
+                return
+        flat = plain.pop(None, [])
+        self.keys = [key for key, _ in flat]
+        self.getter = tuple_getter([attr for _, attr in flat]) if flat else None
+        self.nested = [(nested, [key for key, _ in items],
+            tuple_getter([attr for _, attr in items]))
+            for nested, items in plain.items()]
+
+    def link_builders(self):
+        """Return (key, link_builder()) pairs of URL fields, for current
+           Request
+        """
+        return [(key, link_builder(endpoint, attrs, values))
+            for key, endpoint, attrs, values in self.urls]
+
+    def dump_row(self, row, links):
+        """Return dictionary with Data Model of row, links are
+           link_builders() of current Request
+        """
+        data = dict(zip(self.keys, self.getter(row))) if self.getter else {}
+        for nested, keys, getter in self.nested:
+            data[nested] = dict(zip(keys, getter(row)))
+        for key, build in links:
+            data[key] = build(row)
+        return data
+
+    def dump(self, obj, many=None):
+        """Dump obj (list of rows if many) like Schema.dump()"""
+        many = self.many if many is None else many
+        links = self.link_builders()
+        if many:
+            return [self.dump_row(row, links) for row in obj]
+        return self.dump_row(obj, links)
+
+# ListSerializers of List schemas and 'fields' projections, see list_serializer()
+serializer_cache = LRUCache(maxsize=256)
+
+def list_serializer(schema_class, return_fields=None, links=True):
+    """Return cached ListSerializer of schema_class(many=True) instance,
+       limited to return_fields (comma separated string) and 'href', if
+       links is True
+    """
+    only = None
+    if return_fields:
+        only = tuple(sorted(set(return_fields.split(','))))
+        if links:
+            only += ('href',)
+    exclude = () if links else ('href',)
+    key = (schema_class, only, exclude)
+    serializer = serializer_cache.get(key)
+    if serializer is None:
+        serializer = ListSerializer(
+            schema_class(many=True, only=only, exclude=exclude))
+        serializer_cache.set(key, serializer)
+    return serializer
+
 class UsersQueryStringSchema(Schema):
     """Data Model of List Users Collection operation Query String parameters"""
     username = fields.Str()
-    first = fields.Str()
-    last = fields.Str()
+    firstname = fields.Str(data_key='first')
+    lastname = fields.Str(data_key='last')
     email = fields.Email(validate=validate.Email())
     phone = fields.Str(validate=[
         validate.Length(min=6, max=20),
         validate.Regexp("^[0-9\+][0-9\-\.]+$")
         ])
+    q = fields.Str(validate=[
+        validate.Length(min=1, max=100),
+        validate.Regexp(r'.*\w', error='Search phrase must contain a word')
+        ])
     offset = fields.Integer(validate=validate.Range(min=0), missing=0)
     limit = fields.Integer(validate=validate.Range(min=1))
+    after = Cursor()
+    count = fields.Str(validate=validate.OneOf(['exact', 'estimate']))
     return_fields = fields.Str(data_key='fields')
+    links = fields.Boolean(truthy={'true'}, falsy={'false'})
     sortBy = fields.Str(missing='userid')
     locked = fields.Boolean(truthy={'true'}, falsy={'false'})
     admin = fields.Boolean(truthy={'true'}, falsy={'false'})
+    stream = fields.Boolean(truthy={'true'}, falsy={'false'})
 
     @validates('username')
     def validate_username(self, data, **kwargs):
@@ -215,7 +416,7 @@ class UsersQueryStringSchema(Schema):
                     )
         return True
 
-    @validates('first')
+    @validates('firstname')
     def validate_first(self, data, **kwargs):
         """Validate first Query String parameter value"""
         names = data.split(',')
@@ -226,14 +427,14 @@ class UsersQueryStringSchema(Schema):
                     )
         return True
 
-    @validates('last')
-    def validate_first(self, data, **kwargs):
-        """Validate first Query String parameter value"""
+    @validates('lastname')
+    def validate_last(self, data, **kwargs):
+        """Validate last Query String parameter value"""
         names = data.split(',')
         for n in names:
             if n == '' or set(n).difference(ascii_letters + digits + '-'):
                 raise ValidationError(
-                    f'Unexpected string in Query String "first": "{n}"'
+                    f'Unexpected string in Query String "last": "{n}"'
                     )
         return True
 
@@ -266,24 +467,24 @@ class UsersQueryStringSchema(Schema):
 
 users_filters_schema = UsersQueryStringSchema()
 
-class GroupMembersQueryStringSchema(Schema):
+class GroupMembersQueryStringSchema(UsersQueryStringSchema):
     """Data Model of Retrieve Group Members operation Query String parameters"""
-    return_fields = fields.Str(data_key='fields')
-
-    @validates('return_fields')
-    def validate_return_fields(self, data, **kwargs):
-        """Validate fields Query String parameter value"""
-        fields_list = set(['userid', 'username', 'firstname',
-                'lastname', 'email', 'phone'])
-        return_fields = set(data.split(','))
-        if return_fields.difference(fields_list):
-            raise ValidationError(
-                f'Unexpected names in Query String "field": {return_fields.difference(fields_list)}'
-                )
-        return True
+    class Meta:
+        # Group members are paged with 'after' cursor only, so ranked
+        # full-text search is not available
+        exclude = ('offset', 'q')
 
 group_members_filters_schema = GroupMembersQueryStringSchema()
 
+class GroupMembersBodySchema(Schema):
+    """Data Model for Add and Delete many Group members operations"""
+    userids = fields.List(
+        fields.Integer(validate=validate.Range(min=0)),
+        required=True
+        )
+
+group_members_body_schema = GroupMembersBodySchema()
+
 class SetPasswordBodySchema(Schema):
     """Data Model for Set new password for User account operation"""
     password = fields.Str(required=True)
@@ -298,6 +499,23 @@ class SetPasswordBodySchema(Schema):
 
 set_password_body_schema = SetPasswordBodySchema()
 
+class LoginEventSchema(Schema):
+    """Data Model of Login attempt audit record"""
+    eventid = fields.Integer()
+    username = fields.Str()
+    address = fields.Str()
+    result = fields.Str()
+    time = fields.DateTime()
+
+login_event_list_schema = LoginEventSchema(many=True)
+
+class LoginEventsQueryStringSchema(Schema):
+    """Data Model of List User Login attempts operation Query String parameters"""
+    after = Cursor()
+    limit = fields.Integer(validate=validate.Range(min=1, max=1000), missing=100)
+
+login_events_filters_schema = LoginEventsQueryStringSchema()
+
 class LoginBodySchema(Schema):
     """Data Model for Login operation Request body"""
     username = fields.Str(required=True,
@@ -325,5 +543,81 @@ class ConfigVariablesSchema(Schema):
         data_key='APPUSERS_MAX_FAILED_LOGIN_ATTEMPTS')
     LOCK_TIMEOUT = fields.TimeDelta(precision='seconds',
         data_key='APPUSERS_LOCK_TIMEOUT')
+    PASSWORD_HASH = fields.Str(
+        validate=validate.OneOf(['pbkdf2-sha256', 'scrypt']),
+        data_key='APPUSERS_PASSWORD_HASH')
+    PASSWORD_COST = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_PASSWORD_COST')
+    PASSWORD_POOL = fields.Str(validate=validate.OneOf(['thread', 'process']),
+        data_key='APPUSERS_PASSWORD_POOL')
+    PASSWORD_WORKERS = fields.Integer(validate=validate.Range(min=0),
+        data_key='APPUSERS_PASSWORD_WORKERS')
+    THROTTLE_STORE = fields.Str(
+        validate=validate.OneOf(['memory', 'sqlite', 'database']),
+        data_key='APPUSERS_THROTTLE_STORE')
+    THROTTLE_STORE_PATH = fields.Str(data_key='APPUSERS_THROTTLE_STORE_PATH')
+    THROTTLE_STORE_SIZE = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_THROTTLE_STORE_SIZE')
+    LOGIN_IP_RATE = fields.Float(validate=validate.Range(min=0),
+        data_key='APPUSERS_LOGIN_IP_RATE')
+    LOGIN_IP_BURST = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_LOGIN_IP_BURST')
+    LOGIN_USERNAME_RATE = fields.Float(validate=validate.Range(min=0),
+        data_key='APPUSERS_LOGIN_USERNAME_RATE')
+    LOGIN_USERNAME_BURST = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_LOGIN_USERNAME_BURST')
+    AUDIT_LOG = fields.Boolean(data_key='APPUSERS_AUDIT_LOG')
+    AUDIT_DATABASE_URI = fields.Str(data_key='APPUSERS_AUDIT_DATABASE_URI')
+    AUDIT_FLUSH_INTERVAL = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_AUDIT_FLUSH_INTERVAL')
+    AUDIT_BATCH_SIZE = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_AUDIT_BATCH_SIZE')
+    AUDIT_RETENTION = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_AUDIT_RETENTION')
+    UNIT_OF_WORK = fields.Boolean(data_key='APPUSERS_UNIT_OF_WORK')
+    DATABASE_REPLICAS = fields.Str(data_key='APPUSERS_DATABASE_REPLICAS')
+    REPLICA_PIN_TIMEOUT = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_REPLICA_PIN_TIMEOUT')
+    COUNT_CACHE_TIMEOUT = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_COUNT_CACHE_TIMEOUT')
+    FULLTEXT_SEARCH = fields.Boolean(data_key='APPUSERS_FULLTEXT_SEARCH')
+    PRINCIPAL_CACHE = fields.Boolean(data_key='APPUSERS_PRINCIPAL_CACHE')
+    PRINCIPAL_CACHE_SIZE = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_PRINCIPAL_CACHE_SIZE')
+    PRINCIPAL_CACHE_TIMEOUT = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_PRINCIPAL_CACHE_TIMEOUT')
+    RESPONSE_CACHE = fields.Boolean(data_key='APPUSERS_RESPONSE_CACHE')
+    RESPONSE_CACHE_SIZE = fields.Integer(validate=validate.Range(min=0),
+        data_key='APPUSERS_RESPONSE_CACHE_SIZE')
+    RESPONSE_CACHE_TIMEOUT = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_RESPONSE_CACHE_TIMEOUT')
+    ENTITY_CACHE = fields.Boolean(data_key='APPUSERS_ENTITY_CACHE')
+    ENTITY_CACHE_SIZE = fields.Integer(validate=validate.Range(min=1),
+        data_key='APPUSERS_ENTITY_CACHE_SIZE')
+    ENTITY_CACHE_TIMEOUT = fields.TimeDelta(precision='seconds',
+        data_key='APPUSERS_ENTITY_CACHE_TIMEOUT')
+    JSON_PROVIDER = fields.Str(
+        validate=validate.OneOf(['auto', 'orjson', 'stdlib']),
+        data_key='APPUSERS_JSON_PROVIDER')
+    SQLITE_JOURNAL_MODE = fields.Str(
+        validate=validate.OneOf(
+            ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']),
+        data_key='APPUSERS_SQLITE_JOURNAL_MODE')
+    SQLITE_SYNCHRONOUS = fields.Str(
+        validate=validate.OneOf(['OFF', 'NORMAL', 'FULL', 'EXTRA']),
+        data_key='APPUSERS_SQLITE_SYNCHRONOUS')
+    SQLITE_MMAP_SIZE = fields.Integer(validate=validate.Range(min=0),
+        data_key='APPUSERS_SQLITE_MMAP_SIZE')
+    SQLITE_CACHE_SIZE = fields.Integer(data_key='APPUSERS_SQLITE_CACHE_SIZE')
+    SQLITE_BUSY_TIMEOUT = fields.Integer(validate=validate.Range(min=0),
+        data_key='APPUSERS_SQLITE_BUSY_TIMEOUT')
+    DATABASE_POOL_SIZE = fields.Integer(validate=validate.Range(min=0),
+        data_key='APPUSERS_DATABASE_POOL_SIZE')
+    DATABASE_MAX_OVERFLOW = fields.Integer(validate=validate.Range(min=-1),
+        data_key='APPUSERS_DATABASE_MAX_OVERFLOW')
+    DATABASE_POOL_RECYCLE = fields.Integer(validate=validate.Range(min=-1),
+        data_key='APPUSERS_DATABASE_POOL_RECYCLE')
+    DATABASE_POOL_PRE_PING = fields.Boolean(
+        data_key='APPUSERS_DATABASE_POOL_PRE_PING')
 
 config_variables_schema = ConfigVariablesSchema()
@@ -0,0 +1,186 @@
+"""Password hashing module
+
+This module declares password hashing functions and PasswordHasher class,
+which hashes and verifies User passwords on a thread or process pool, so
+that CPU heavy key derivation does not block the Request handling thread.
+
+Hashes are stored in versioned format:
+
+    $<method>$<cost>$<salt>$<hash>
+
+- method - 'pbkdf2-sha256' or 'scrypt'
+- cost - number of iterations for pbkdf2-sha256, log2 of N for scrypt
+- salt, hash - URL safe base64 without padding
+
+Passwords stored before hashing was introduced (plaintext), that is values
+not in exact hash format, are verified in constant time and rehashed on
+successful login, like hashes made with other method or cost than
+configured.
+
+hasher, an instance of PasswordHasher is declared here and is initialized
+in Application Factory function.
+hasher uses following Application Config variables:
+
+- PASSWORD_HASH - key derivation method of new hashes
+- PASSWORD_COST - cost of new hashes, see calibrate()
+- PASSWORD_POOL - 'thread' or 'process' pool running key derivation
+- PASSWORD_WORKERS - number of pool workers, 0 runs key derivation in
+    Request handling thread
+"""
+import hashlib, hmac, os, re, time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+PBKDF2_SHA256 = 'pbkdf2-sha256'
+SCRYPT = 'scrypt'
+
+# Default cost of methods: pbkdf2-sha256 iterations and scrypt log2(N)
+DEFAULT_COST = {PBKDF2_SHA256: 600000, SCRYPT: 15}
+
+SALT_SIZE = 16
+
+# $<method>$<cost>$<salt>$<hash>, other stored values are plaintext
+HASH_FORMAT = re.compile(r'\$(pbkdf2-sha256|scrypt)\$([1-9][0-9]*)'
+    r'\$([A-Za-z0-9_-]+)\$([A-Za-z0-9_-]+)')
+
+def b64encode(data):
+    """Encode bytes to URL safe base64 string without padding"""
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def b64decode(data):
+    """Decode URL safe base64 string without padding"""
+    return urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+def derive_key(password, method, cost, salt):
+    """Return key derived from password with method, cost and salt"""
+    password = password.encode('utf-8')
+    if method == PBKDF2_SHA256:
+        return hashlib.pbkdf2_hmac('sha256', password, salt, cost)
+    if method == SCRYPT:
+        n = 2 ** cost
+        # scrypt needs 128 * r * N bytes, r=8
+        return hashlib.scrypt(password, salt=salt, n=n, r=8, p=1,
+            maxmem=2 * 128 * 8 * n, dklen=32)
+    raise ValueError(f'Unknown password hash method: {method}')
+
+def make_hash(password, method=PBKDF2_SHA256, cost=None):
+    """Return password hash string with random salt"""
+    cost = cost or DEFAULT_COST[method]
+    salt = os.urandom(SALT_SIZE)
+    key = derive_key(password, method, cost, salt)
+    return f'${method}${cost}${b64encode(salt)}${b64encode(key)}'
+
+def parse_hash(hashed):
+    """Return (method, cost, salt, key) of password hash, or None for
+       plaintext, that is any value not in exact hash format with known
+       method and integer cost
+    """
+    match = HASH_FORMAT.fullmatch(hashed)
+    if match is None:
+        return None
+    method, cost, salt, key = match.groups()
+    if len(salt) % 4 == 1 or len(key) % 4 == 1:
+        # not valid base64 without padding
+        return None
+    return method, int(cost), b64decode(salt), b64decode(key)
+
+def hash_parameters(hashed):
+    """Return (method, cost) of password hash or None for plaintext"""
+    parsed = parse_hash(hashed)
+    return parsed and parsed[:2]
+
+def check_hash(password, hashed):
+    """Check if password matches password hash (or plaintext) in constant time"""
+    parsed = parse_hash(hashed)
+    if parsed is None:
+        return hmac.compare_digest(
+            password.encode('utf-8'), hashed.encode('utf-8'))
+    method, cost, salt, key = parsed
+    return hmac.compare_digest(derive_key(password, method, cost, salt), key)
+
+def calibrate(method=PBKDF2_SHA256, target=0.25):
+    """Return lowest cost of method taking at least target seconds to hash
+       password on this machine
+    """
+    salt = os.urandom(SALT_SIZE)
+
+    def duration(cost):
+        start = time.perf_counter()
+        derive_key('calibration password', method, cost, salt)
+        return time.perf_counter() - start
+
+    if method == SCRYPT:
+        cost = 10
+        while duration(cost) < target:
+            cost += 1
+        return cost
+    # pbkdf2 time is linear in iterations, measure and scale
+    cost = 10000
+    elapsed = duration(cost)
+    while elapsed < 0.05:
+        cost *= 4
+        elapsed = duration(cost)
+    return max(1000, int(cost * target / elapsed) // 1000 * 1000)
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords with configured method and cost, on
+       thread or process pool
+    """
+
+    def __init__(self):
+        self.method = PBKDF2_SHA256
+        self.cost = DEFAULT_COST[PBKDF2_SHA256]
+        self.executor = None
+        self._dummy_hash = None
+
+    def init_app(self, app):
+        """Set method and cost, create pool from Application Config"""
+        self.method = app.config.get('PASSWORD_HASH') or PBKDF2_SHA256
+        self.cost = app.config.get('PASSWORD_COST') or DEFAULT_COST[self.method]
+        self._dummy_hash = None
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        workers = app.config.get('PASSWORD_WORKERS')
+        if workers:
+            if app.config.get('PASSWORD_POOL') == 'process':
+                self.executor = ProcessPoolExecutor(workers)
+            else:
+                self.executor = ThreadPoolExecutor(
+                    workers, thread_name_prefix='password')
+
+    def run(self, func, *args):
+        """Run func on pool and wait for result"""
+        if self.executor is None:
+            return func(*args)
+        return self.executor.submit(func, *args).result()
+
+    def hash(self, password):
+        """Return hash of password"""
+        return self.run(make_hash, password, self.method, self.cost)
+
+    def verify(self, password, hashed):
+        """Check if password matches stored password hash"""
+        return self.run(check_hash, password, hashed)
+
+    def verify_dummy(self, password):
+        """Verify password against hash of random password made with current
+           method and cost, so that login of unknown username takes as long
+           as login of existing User. Returns False.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = make_hash(
+                b64encode(os.urandom(SALT_SIZE)), self.method, self.cost)
+        self.verify(password, self._dummy_hash)
+        return False
+
+    def needs_rehash(self, hashed):
+        """Check if stored password hash was not made with current method
+           and cost (or password is stored in plaintext)
+        """
+        return hash_parameters(hashed) != (self.method, self.cost)
+
+# Password hasher object is initialized in Application Factory
+hasher = PasswordHasher()
@@ -7,6 +7,7 @@ import os, unittest, time, datetime, pytest, flask_jwt_extended
 from flask import url_for
 from appusers import create_app
 from appusers.database import db, User, Group
+from appusers.models import encode_cursor
 
 
 class TestApplicationClass(unittest.TestCase):
@@ -562,3 +563,212 @@ class TestApplicationClass(unittest.TestCase):
         members = resp.get_json()
         self.assertGreater(len(members), 0)
         self.assertTrue(any(m['username'] == 'johne' for m in members))
+
+    def test_5_list_users_pagination(self):
+        """Test List Users Collection keyset pagination with Link header"""
+        # This test assumes there are 6 Users in Database
+        headers = {'X-API-Key': self.app.config['API_KEY']}
+        url = '/users?sortBy=-username&limit=4'
+        usernames = []
+        while url:
+            resp = self.client.get(url, headers=headers)
+            self.assertEqual(resp.status_code, 200)
+            usernames += [u['username'] for u in resp.get_json()]
+            link = resp.headers.get('Link')
+            url = link[1:link.index('>')] if link else None
+        self.assertEqual(usernames, sorted(usernames, reverse=True))
+        self.assertEqual(len(usernames), 6)
+
+        # Test invalid cursor - 400
+        resp = self.client.get(
+            '/users',
+            query_string={'after': 'invalid!'},
+            headers=headers
+            )
+        self.assertEqual(resp.status_code, 400)
+        # Cursor values other than str, number or null - 400
+        for values in [[{'a': 1}], [[1]], [1, ['x']]]:
+            for url in ['/users', '/groups']:
+                resp = self.client.get(
+                    url,
+                    query_string={'after': encode_cursor(values)},
+                    headers=headers
+                    )
+                self.assertEqual(resp.status_code, 400, msg=values)
+
+    def test_6_create_users_batch(self):
+        """Test Create many User Resources operation"""
+        # This test assumes 'admin' is in Database with password 'pass',
+        # is unlocked and can log in, has admin privilege
+        # Test assumes User 'johne' is in Database and there are no Users
+        # 'batcha' and 'batchb'
+        jwt_token = self.login('admin', 'pass')
+        batch = [
+            {
+                'username': 'batcha',
+                'firstname': 'Batch',
+                'lastname': 'User',
+                'contactInfo': {
+                    'email': 'batcha@example.com',
+                    'phone': '123-444-0001'
+                    }
+            },
+            {
+                'username': 'batcha', # duplicate in request
+                'firstname': 'Batch',
+                'lastname': 'User',
+                'contactInfo': {
+                    'email': 'batcha@example.com',
+                    'phone': '123-444-0001'
+                    }
+            },
+            {
+                'username': 'johne', # already exists
+                'firstname': 'John',
+                'lastname': 'Example',
+                'contactInfo': {
+                    'email': 'johne@example.com',
+                    'phone': '123-444-6666'
+                    }
+            },
+            {
+                'username': 'batchb',
+                'firstname': 'Batch',
+                'lastname': 'User',
+                'contactInfo': {
+                    'email': 'wrong_email_address',
+                    'phone': '123-444-0002'
+                    }
+            }
+            ]
+        resp = self.client.post(
+            '/users/batch',
+            json=batch,
+            headers={'Authorization': f'Bearer {jwt_token}'}
+            )
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()
+        self.assertEqual(
+            [r['status'] for r in results],
+            ['created', 'conflict', 'conflict', 'invalid']
+            )
+        # Assert created User is available under returned URI
+        resp = self.client.get(
+            results[0]['href'],
+            headers={'X-API-Key': self.app.config['API_KEY']}
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['username'], 'batcha')
+
+        # Test Request body which is not an array - 400
+        resp = self.client.post(
+            '/users/batch',
+            json=batch[0],
+            headers={'Authorization': f'Bearer {jwt_token}'}
+            )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_7_bulk_group_members(self):
+        """Test Add and Delete many Group members operations"""
+        # This test assumes following Database state:
+        # admin, johne, lindas and lin in Users; admin can login and has
+        # admin privilege; testers in Groups; testers has no members
+        with self.app.app_context():
+            userids = {u.userid: u.username for u in User.get_list({})}
+            testers_groupid = Group.get_list({'groupname': 'testers'})[0].groupid
+        ids = {name: userid for userid, name in userids.items()}
+        unknown_userid = max(userids) + 1000
+        jwt_token = self.login('admin', 'pass')
+        headers = {'Authorization': f'Bearer {jwt_token}'}
+        url = f'/groups/{testers_groupid}/members'
+
+        body = {'userids': [ids['johne'], ids['lin'], unknown_userid]}
+        resp = self.client.put(url, json=body, headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertDictEqual(
+            resp.get_json(), {'added': 2, 'present': 0, 'unknown': 1})
+        # Repeat operation, Users are already members
+        resp = self.client.put(url, json=body, headers=headers)
+        self.assertDictEqual(
+            resp.get_json(), {'added': 0, 'present': 2, 'unknown': 1})
+
+        body = {'userids': [ids['johne'], ids['lindas'], unknown_userid]}
+        resp = self.client.delete(url, json=body, headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertDictEqual(
+            resp.get_json(), {'removed': 1, 'absent': 1, 'unknown': 1})
+        # Assert only lin remains a member of testers
+        resp = self.client.get(
+            url, headers={'X-API-Key': self.app.config['API_KEY']})
+        self.assertEqual([m['username'] for m in resp.get_json()], ['lin'])
+
+        # Test incorrect Request body - 400
+        resp = self.client.put(url, json=[ids['lin']], headers=headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_8_unit_of_work(self):
+        """Test Unit of Work commits staged changes at the end of Request"""
+        # This test assumes 'admin' is in Database with password 'pass',
+        # is unlocked and can log in, has admin privilege
+        # Test assumes User 'lin' is in Database with lastname 'Nerd'
+        self.app.config['UNIT_OF_WORK'] = True
+        try:
+            jwt_token = self.login('admin', 'pass')
+            with self.app.app_context():
+                lin_userid = User.get_list({'username': 'lin'})[0].userid
+            resp = self.client.patch(
+                f'/users/{lin_userid}',
+                json={'lastname': 'Staged'},
+                headers={'Authorization': f'Bearer {jwt_token}'}
+                )
+            self.assertEqual(resp.status_code, 200)
+            with self.app.app_context():
+                self.assertEqual(User.retrieve(lin_userid).lastname, 'Staged')
+                User.retrieve(lin_userid).update(lastname='Nerd')
+        finally:
+            self.app.config['UNIT_OF_WORK'] = False
+
+    def test_9_list_group_members_pagination(self):
+        """Test Retrieve Group members filtering and keyset pagination"""
+        # This test assumes following Database state:
+        # admin, johne, lindas and lin in Users; admin can login and has
+        # admin privilege; devs in Groups; johne is the only member of devs
+        with self.app.app_context():
+            ids = {u.username: u.userid for u in User.get_list({})}
+            devs_groupid = Group.get_list({'groupname': 'devs'})[0].groupid
+        jwt_token = self.login('admin', 'pass')
+        url = f'/groups/{devs_groupid}/members'
+        resp = self.client.put(
+            url,
+            json={'userids': [ids['lindas'], ids['lin']]},
+            headers={'Authorization': f'Bearer {jwt_token}'}
+            )
+        self.assertEqual(resp.status_code, 200)
+
+        headers = {'X-API-Key': self.app.config['API_KEY']}
+        next_url = f'{url}?sortBy=username&limit=2&fields=username'
+        usernames = []
+        while next_url:
+            resp = self.client.get(next_url, headers=headers)
+            self.assertEqual(resp.status_code, 200)
+            usernames += [u['username'] for u in resp.get_json()]
+            link = resp.headers.get('Link')
+            next_url = link[1:link.index('>')] if link else None
+        self.assertEqual(usernames, ['johne', 'lin', 'lindas'])
+
+        # Test User filters
+        resp = self.client.get(
+            url,
+            query_string={'first': 'Linda,Li'},
+            headers=headers
+            )
+        self.assertEqual(
+            [u['username'] for u in resp.get_json()], ['lindas', 'lin'])
+
+        # Test offset is not supported - 400
+        resp = self.client.get(
+            url,
+            query_string={'offset': 1},
+            headers=headers
+            )
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,535 @@
+"""Unit tests for Collection operations
+
+This module provides Unit tests of List Users, List Groups and Retrieve
+Group members operations features: streaming, counting, searching,
+conditional requests, caching and JSON encoding, tested with Flask Test Client.
+"""
+import os, json, unittest, datetime
+from flask import g
+from itertools import combinations
+from types import SimpleNamespace
+from sqlalchemy import event
+from sqlalchemy.orm.exc import StaleDataError
+from appusers import create_app, utils
+from appusers.database import db, User, Group
+from appusers.models import UserListSchema, GroupListSchema, list_serializer
+from appusers.utils import response_cache
+from appusers.jsonprovider import json_provider, orjson
+
+
+class TestCollectionsClass(unittest.TestCase):
+    """Test Collection operations of full Application"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initialize app, create test_client and test Users"""
+
+        if 'APPUSERS_CONFIG' not in os.environ:
+            os.environ['APPUSERS_CONFIG'] = 'test_config.py'
+
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+        cls.headers = {'X-API-Key': cls.app.config['API_KEY']}
+
+        with cls.app.app_context():
+            # Clear existing data in test database
+            meta = db.metadata
+            for table in reversed(meta.sorted_tables):
+                db.session.execute(table.delete())
+            db.session.commit()
+            # Create 25 Users, members of group 'odd' have odd userids
+            odd = Group(groupname='odd', description='Odd Users')
+            for i in range(25):
+                user = User(
+                    username=f'user{i:02}',
+                    firstname='Test',
+                    lastname=f'User{i % 5}',
+                    email=f'user{i:02}@example.com',
+                    phone=f'123-444-{i:04}'
+                    )
+                if i % 2:
+                    odd.add_member(user)
+            cls.odd_groupid = odd.groupid
+
+    def test_01_list_users_stream_ndjson(self):
+        """Test List Users streamed as NDJSON"""
+        resp = self.client.get(
+            '/users',
+            headers=dict(self.headers, Accept='application/x-ndjson')
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 25)
+        # Assert streamed items equal items of regular JSON array Response
+        resp = self.client.get('/users', headers=self.headers)
+        self.assertEqual([json.loads(l) for l in lines], resp.get_json())
+
+    def test_02_list_users_stream_json_array(self):
+        """Test List Users streamed as chunked JSON array"""
+        query_string = {'sortBy': '-username', 'fields': 'username'}
+        resp = self.client.get(
+            '/users',
+            query_string=dict(query_string, stream='true'),
+            headers=self.headers
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        streamed = resp.get_json()
+        resp = self.client.get(
+            '/users', query_string=query_string, headers=self.headers)
+        self.assertEqual(streamed, resp.get_json())
+        # Assert empty collection is streamed as empty array
+        resp = self.client.get(
+            '/users',
+            query_string={'username': 'nosuchuser', 'stream': 'true'},
+            headers=self.headers
+            )
+        self.assertEqual(resp.get_json(), [])
+
+    def test_03_list_group_members_stream(self):
+        """Test Retrieve Group members streamed as NDJSON"""
+        resp = self.client.get(
+            f'/groups/{self.odd_groupid}/members',
+            query_string={'fields': 'userid'},
+            headers=dict(self.headers, Accept='application/x-ndjson')
+            )
+        self.assertEqual(resp.status_code, 200)
+        members = [json.loads(l) for l in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(members), 12)
+
+    def test_04_total_count(self):
+        """Test X-Total-Count Response header of List operations"""
+        resp = self.client.get(
+            '/users',
+            query_string={'last': 'User1', 'limit': 2, 'count': 'exact'},
+            headers=self.headers
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.get_json()), 2)
+        self.assertEqual(resp.headers['X-Total-Count'], '5')
+        # Count of all Users is cached and invalidated by writes
+        for count in ['exact', 'estimate']:
+            resp = self.client.get(
+                '/users', query_string={'count': count}, headers=self.headers)
+            self.assertEqual(resp.headers['X-Total-Count'], '25')
+        with self.app.app_context():
+            extra = User(
+                username='extra',
+                firstname='Extra',
+                lastname='User',
+                email='extra@example.com',
+                phone='123-444-9999'
+                )
+        resp = self.client.get(
+            '/users', query_string={'count': 'exact'}, headers=self.headers)
+        self.assertEqual(resp.headers['X-Total-Count'], '26')
+        with self.app.app_context():
+            User.get_list({'username': 'extra'})[0].remove()
+        resp = self.client.get(
+            '/users', query_string={'count': 'exact'}, headers=self.headers)
+        self.assertEqual(resp.headers['X-Total-Count'], '25')
+        # Test Group members and Groups count
+        resp = self.client.get(
+            f'/groups/{self.odd_groupid}/members',
+            query_string={'count': 'exact', 'limit': 1},
+            headers=self.headers
+            )
+        self.assertEqual(resp.headers['X-Total-Count'], '12')
+        resp = self.client.get(
+            '/groups', query_string={'count': 'exact'}, headers=self.headers)
+        self.assertEqual(resp.headers['X-Total-Count'], '1')
+        # Test no header without 'count' and invalid 'count' value - 400
+        resp = self.client.get('/users', headers=self.headers)
+        self.assertNotIn('X-Total-Count', resp.headers)
+        resp = self.client.get(
+            '/users', query_string={'count': 'some'}, headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_05_search_users(self):
+        """Test full-text search of Users with 'q' Query String parameter"""
+        resp = self.client.get(
+            '/users', query_string={'q': 'user1'}, headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        usernames = [u['username'] for u in resp.get_json()]
+        # Prefix of username and email (user10-19) or lastname User1
+        expected = {f'user{i:02}' for i in [1, 6, 21] + list(range(10, 20))}
+        self.assertEqual(set(usernames), expected)
+        # Users matching in all columns are ranked first
+        self.assertEqual(set(usernames[:2]), {'user11', 'user16'})
+        # All tokens must match, in any column
+        resp = self.client.get(
+            '/users', query_string={'q': 'USER1 user2'}, headers=self.headers)
+        self.assertEqual({u['username'] for u in resp.get_json()},
+            {'user12', 'user17', 'user21'})
+        # Search index follows User updates
+        with self.app.app_context():
+            user = User.get_list({'username': 'user03'})[0]
+            user.update(firstname='Searchable')
+        resp = self.client.get(
+            '/users', query_string={'q': 'search'}, headers=self.headers)
+        self.assertEqual(
+            [u['username'] for u in resp.get_json()], ['user03'])
+        # Search results are paged with limit and offset
+        resp = self.client.get(
+            '/users',
+            query_string={'q': 'user1', 'limit': 10, 'count': 'exact'},
+            headers=self.headers
+            )
+        self.assertEqual(
+            [u['username'] for u in resp.get_json()], usernames[:10])
+        self.assertEqual(resp.headers['X-Total-Count'], '13')
+        self.assertIn('offset=10', resp.headers['Link'])
+        resp = self.client.get(
+            resp.headers['Link'][1:-len('>; rel="next"')], headers=self.headers)
+        self.assertEqual(
+            [u['username'] for u in resp.get_json()], usernames[10:])
+        # Test cursor with 'q' and phrase without words - 400
+        resp = self.client.get(
+            '/users', query_string={'q': 'user1', 'after': 'WzFd'},
+            headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(
+            '/users', query_string={'q': '"*'}, headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+        # LIKE matching without search index, '_' is not a wildcard
+        self.app.config['FULLTEXT_SEARCH'] = False
+        try:
+            for q, expected in [('user1 user2', {'user12', 'user17', 'user21'}),
+                    ('use_1', set())]:
+                resp = self.client.get(
+                    '/users', query_string={'q': q}, headers=self.headers)
+                self.assertEqual(
+                    {u['username'] for u in resp.get_json()}, expected, msg=q)
+        finally:
+            self.app.config['FULLTEXT_SEARCH'] = True
+
+    def test_06_conditional_requests(self):
+        """Test ETag, If-None-Match and If-Match of Resources and Collections"""
+        with self.app.app_context():
+            admin = User(
+                username='etagadmin',
+                firstname='Admin',
+                lastname='Etag',
+                email='etagadmin@example.com',
+                phone='123-444-9999'
+                )
+            admin.set_password('pass')
+            admin.grant_admin()
+            admin_userid = admin.userid
+            userid = User.get_list({'username': 'user04'})[0].userid
+        resp = self.client.post(
+            '/login', json={'username': 'etagadmin', 'password': 'pass'})
+        jwt = {'Authorization': f'Bearer {resp.get_json()["jwtToken"]}'}
+        url = f'/users/{userid}'
+        # Retrieve User answers 304 while User version is not changed
+        resp = self.client.get(url, headers=self.headers)
+        etag = resp.headers['ETag']
+        resp = self.client.get(
+            url, headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+        # Collection page ETag does not depend on Query String order
+        resp = self.client.get(
+            '/users?limit=5&username=user04,user05', headers=self.headers)
+        list_etag = resp.headers['ETag']
+        resp = self.client.get(
+            '/users?username=user04,user05&limit=5',
+            headers=dict(self.headers, **{'If-None-Match': list_etag}))
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get('/users?limit=2', headers=self.headers)
+        first_page_etag = resp.headers['ETag']
+        # Update with matching If-Match changes version
+        resp = self.client.patch(
+            url, json={'firstname': 'Tagged'},
+            headers=dict(jwt, **{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(
+            url, headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        resp = self.client.get(
+            '/users?limit=5&username=user04,user05',
+            headers=dict(self.headers, **{'If-None-Match': list_etag}))
+        self.assertEqual(resp.status_code, 200)
+        # Page ETag depends only on its rows
+        resp = self.client.get('/users?limit=2',
+            headers=dict(self.headers, **{'If-None-Match': first_page_etag}))
+        self.assertEqual(resp.status_code, 304)
+        # Stale If-Match - 412, existing username - 400
+        resp = self.client.patch(
+            url, json={'firstname': 'Test'},
+            headers=dict(jwt, **{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 412)
+        resp = self.client.put(
+            url,
+            json={'username': 'user05', 'firstname': 'Test',
+                'lastname': 'User4', 'contactInfo': {
+                    'email': 'user04@example.com', 'phone': '123-444-0004'}},
+            headers=jwt)
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.patch(
+            url, json={'firstname': 'Test'}, headers=jwt)
+        self.assertEqual(resp.status_code, 200)
+        # Group Resource and Group members Collection
+        url = f'/groups/{self.odd_groupid}'
+        resp = self.client.get(url, headers=self.headers)
+        etag = resp.headers['ETag']
+        resp = self.client.patch(
+            url, json={'description': 'Odd'},
+            headers=dict(jwt, **{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.put(
+            url, json={'groupname': 'odd', 'description': 'Odd Users'},
+            headers=dict(jwt, **{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 412)
+        resp = self.client.get(f'{url}/members', headers=self.headers)
+        members_etag = resp.headers['ETag']
+        self.client.put(f'{url}/members/{userid}', headers=jwt)
+        resp = self.client.get(f'{url}/members',
+            headers=dict(self.headers, **{'If-None-Match': members_etag}))
+        self.assertEqual(resp.status_code, 200)
+        self.client.delete(f'{url}/members/{userid}', headers=jwt)
+        with self.app.app_context():
+            # Concurrent update of loaded User fails
+            user = User.retrieve(userid)
+            db.session.execute(User.__table__.update()
+                .where(User.userid == userid)
+                .values(version=User.version + 1))
+            with self.assertRaises(StaleDataError):
+                user.update(firstname='Stale')
+            self.assertEqual(User.retrieve(userid).firstname, 'Test')
+            User.retrieve(admin_userid).remove()
+
+    def test_07_response_cache(self):
+        """Test List Users and Groups served from response cache"""
+        response_cache.clear()
+        query_string = {'limit': 5, 'count': 'exact', 'sortBy': '-username'}
+        resp1 = self.client.get(
+            '/users', query_string=query_string, headers=self.headers)
+        stats = response_cache.stats()
+        resp2 = self.client.get(
+            '/users', query_string=query_string, headers=self.headers)
+        self.assertEqual(response_cache.stats()['hits'], stats['hits'] + 1)
+        self.assertEqual(resp2.get_data(), resp1.get_data())
+        for header in ['ETag', 'Link', 'X-Total-Count']:
+            self.assertEqual(resp2.headers[header], resp1.headers[header])
+        resp = self.client.get('/users', query_string=query_string,
+            headers=dict(self.headers, **{'If-None-Match': resp1.headers['ETag']}))
+        self.assertEqual(resp.status_code, 304)
+        # Write to user table invalidates cached Responses
+        with self.app.app_context():
+            User.get_list({'username': 'user24'})[0].update(firstname='Cached')
+        resp = self.client.get(
+            '/users', query_string=query_string, headers=self.headers)
+        self.assertEqual(resp.get_json()[0]['firstname'], 'Cached')
+        self.assertNotEqual(resp.headers['ETag'], resp1.headers['ETag'])
+        with self.app.app_context():
+            User.get_list({'username': 'user24'})[0].update(firstname='Test')
+        # Membership change invalidates List Groups with member filter
+        with self.app.app_context():
+            userid = User.get_list({'username': 'user02'})[0].userid
+        query_string = {'member': userid}
+        resp = self.client.get(
+            '/groups', query_string=query_string, headers=self.headers)
+        self.assertEqual(resp.get_json(), [])
+        with self.app.app_context():
+            Group.retrieve(self.odd_groupid).add_members([userid])
+        resp = self.client.get(
+            '/groups', query_string=query_string, headers=self.headers)
+        self.assertEqual(len(resp.get_json()), 1)
+        with self.app.app_context():
+            Group.retrieve(self.odd_groupid).remove_members([userid])
+        # Memory use is bounded
+        stats = response_cache.stats()
+        self.assertGreater(stats['bytes'], 0)
+        response_cache.configure(maxbytes=stats['bytes'] + 100,
+            ttl=self.app.config['RESPONSE_CACHE_TIMEOUT'].total_seconds())
+        for limit in range(1, 25):
+            self.client.get(
+                '/users', query_string={'limit': limit}, headers=self.headers)
+        stats = response_cache.stats()
+        self.assertLessEqual(stats['bytes'], stats['maxbytes'])
+        self.assertGreater(stats['evictions'], 0)
+        utils.init_response_cache(self.app)
+        # Stats are logged at most once per CACHE_STATS_INTERVAL
+        utils.cache_stats_logged = 0.0
+        with self.assertLogs(self.app.logger, 'INFO') as logs:
+            for i in range(2):
+                self.client.get('/users', headers=self.headers)
+        self.assertEqual(len([m for m in logs.output
+            if 'response_cache stats' in m and 'hit_rate' in m]), 1)
+
+    def test_08_entity_cache(self):
+        """Test Retrieve User and Group served from entity cache"""
+        statements = []
+
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            user = User.get_list({'username': 'user07'})[0]
+            userid = user.userid
+            engine = db.get_engine(self.app)
+        url = f'/users/{userid}'
+        resp1 = self.client.get(url, headers=self.headers)
+        event.listen(engine, 'before_cursor_execute', count_statements)
+        try:
+            resp2 = self.client.get(url, headers=self.headers)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statements)
+        # Cached Representation is served without Database access
+        self.assertEqual(statements, [])
+        self.assertEqual(resp2.get_data(), resp1.get_data())
+        self.assertEqual(resp2.headers['ETag'], resp1.headers['ETag'])
+        resp = self.client.get(url,
+            headers=dict(self.headers, **{'If-None-Match': resp1.headers['ETag']}))
+        self.assertEqual(resp.status_code, 304)
+        # ORM and Core writes evict cached Representation
+        with self.app.app_context():
+            User.retrieve(userid).update(lastname='Evicted')
+        resp = self.client.get(url, headers=self.headers)
+        self.assertEqual(resp.get_json()['lastname'], 'Evicted')
+        etag = resp.headers['ETag']
+        with self.app.app_context():
+            User.retrieve(userid).record_failed_login(100)
+        resp = self.client.get(url, headers=self.headers)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        with self.app.app_context():
+            user = User.retrieve(userid)
+            user.unlock()
+            user.update(lastname='User2')
+        # Deleted Group is not served from cache
+        with self.app.app_context():
+            groupid = Group(groupname='cached', description='Cached').groupid
+        url = f'/groups/{groupid}'
+        self.assertEqual(self.client.get(url, headers=self.headers).status_code, 200)
+        with self.app.app_context():
+            Group.retrieve(groupid).update(description='Evicted')
+        resp = self.client.get(url, headers=self.headers)
+        self.assertEqual(resp.get_json()['description'], 'Evicted')
+        with self.app.app_context():
+            Group.retrieve(groupid).remove()
+        self.assertEqual(self.client.get(url, headers=self.headers).status_code, 404)
+
+    def test_09_list_serializer(self):
+        """Test compiled ListSerializer dumps the same data as Marshmallow"""
+        user_fields = ['userid', 'username', 'firstname', 'lastname',
+            'email', 'phone']
+        with self.app.test_request_context():
+            users = User.get_list({})
+            # User without contact info and without userid (no href)
+            users.append(SimpleNamespace(userid=None, username='nobody',
+                firstname='No', lastname='Body', email=None, phone=None))
+            for n in range(len(user_fields) + 1):
+                for subset in combinations(user_fields, n):
+                    return_fields = ','.join(subset) or None
+                    serializer = list_serializer(UserListSchema, return_fields)
+                    only = subset + ('href',) if subset else None
+                    schema = UserListSchema(many=True, only=only)
+                    self.assertEqual(serializer.dump(users), schema.dump(users))
+                    self.assertEqual(serializer.dump(users[0], many=False),
+                        schema.dump(users[0], many=False))
+            groups = Group.get_list({})
+            for return_fields in [None, 'groupname', 'description,groupid']:
+                only = return_fields and return_fields.split(',') + ['href']
+                self.assertEqual(
+                    list_serializer(GroupListSchema, return_fields).dump(groups),
+                    GroupListSchema(many=True, only=only).dump(groups))
+        # Serializers are cached for field set, in any order
+        self.assertIs(list_serializer(UserListSchema, 'email,userid'),
+            list_serializer(UserListSchema, 'userid,email'))
+
+    def test_10_list_links(self):
+        """Test links filled in URL templates and links=false option"""
+        config = self.app.config
+        saved = {k: config[k] for k in
+            ['SERVER_NAME', 'APPLICATION_ROOT', 'PREFERRED_URL_SCHEME']}
+        contexts = [
+            lambda: self.app.test_request_context(),
+            lambda: self.app.test_request_context(
+                base_url='https://api.example.com:8443/prefix/'),
+            lambda: self.app.app_context()
+            ]
+        try:
+            config.update(SERVER_NAME='example.com', APPLICATION_ROOT='/root',
+                PREFERRED_URL_SCHEME='https')
+            for context in contexts:
+                with context():
+                    users = User.get_list({})
+                    groups = Group.get_list({})
+                    for return_fields in [None, 'username']:
+                        only = return_fields and [return_fields, 'href']
+                        self.assertEqual(
+                            list_serializer(UserListSchema, return_fields).dump(users),
+                            UserListSchema(many=True, only=only).dump(users))
+                    self.assertEqual(
+                        list_serializer(GroupListSchema).dump(groups),
+                        GroupListSchema(many=True).dump(groups))
+                    # URLs were built from templates
+                    self.assertTrue(all(g.url_templates.values()))
+        finally:
+            config.update(saved)
+        # links=false omits href
+        resp = self.client.get(
+            '/users', query_string={'links': 'false', 'limit': 3},
+            headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(all('href' not in u for u in resp.get_json()))
+        self.assertIn('links=false', resp.headers['Link'])
+        resp = self.client.get(
+            '/users', query_string={'links': 'false', 'fields': 'username'},
+            headers=self.headers)
+        self.assertEqual(set(resp.get_json()[0]), {'username'})
+        resp = self.client.get(
+            '/groups', query_string={'links': 'false'}, headers=self.headers)
+        self.assertEqual(set(resp.get_json()[0]),
+            {'groupid', 'groupname', 'description'})
+        resp = self.client.get(f'/groups/{self.odd_groupid}/members',
+            query_string={'links': 'false', 'stream': 'true'},
+            headers=self.headers)
+        self.assertTrue(all('href' not in u for u in resp.get_json()))
+        resp = self.client.get(
+            '/users', query_string={'links': 'no'}, headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_11_json_provider(self):
+        """Test Responses and Request bodies of stdlib and orjson providers"""
+        config = self.app.config
+        saved = {k: config[k] for k in
+            ['JSON_PROVIDER', 'RESPONSE_CACHE', 'ENTITY_CACHE']}
+        config.update(RESPONSE_CACHE=False, ENTITY_CACHE=False)
+        bodies = {}
+        try:
+            for name in ['stdlib', 'orjson'] if orjson else ['stdlib']:
+                config['JSON_PROVIDER'] = name
+                json_provider.init_app(self.app)
+                self.assertEqual(json_provider.name, name)
+                resp = self.client.get('/users', headers=self.headers)
+                self.assertEqual(resp.mimetype, 'application/json')
+                self.assertTrue(resp.data.endswith(b'\n'))
+                bodies[name] = resp.data
+                users = resp.get_json()
+                self.assertEqual(list(users[0]), sorted(users[0]))
+                resp = self.client.get('/users', query_string={'stream': 'true'},
+                    headers=self.headers)
+                self.assertEqual(resp.get_json(), users)
+                with self.app.test_request_context():
+                    # Dates and non-string keys are encoded like stdlib does
+                    date = datetime.datetime(2020, 1, 2, 3, 4, 5)
+                    self.assertEqual(
+                        json.loads(json_provider.dumps({1: [date, None]})),
+                        {'1': ['Thu, 02 Jan 2020 03:04:05 GMT', None]})
+                # Invalid Request body is Bad request
+                resp = self.client.post('/login', data='{"username": ',
+                    content_type='application/json')
+                self.assertEqual(resp.status_code, 400)
+                resp = self.client.post('/login',
+                    json={'username': 'nosuchuser', 'password': 'x'})
+                self.assertEqual(resp.status_code, 401)
+            if orjson:
+                self.assertEqual(json.loads(bodies['orjson']),
+                    json.loads(bodies['stdlib']))
+        finally:
+            config.update(saved)
+            json_provider.init_app(self.app)
@@ -33,3 +33,6 @@ LOCK_TIMEOUT = timedelta(
     minutes=5,
     seconds=0
     )
+
+# Low password hashing cost keeps tests fast
+PASSWORD_COST = 1000
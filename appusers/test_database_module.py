@@ -4,9 +4,12 @@ This module provides example Unit tests of one Application module - database.py.
 Test class is based on unittest.TestCase.
 Tests are prepared to be run with PyTest.
 """
-import os, unittest, pytest
+import os, unittest, pytest, tempfile, threading
+from unittest import mock
 from flask import Flask
-from appusers.database import db, User, Group
+from appusers.database import db, User, Group, init_sqlite_pragmas
+from appusers.passwords import hasher
+from appusers import create_app
 
 
 class TestDatabaseModuleClass(unittest.TestCase):
@@ -22,8 +25,11 @@ class TestDatabaseModuleClass(unittest.TestCase):
         # SQLAlchemy configuration for testing
         cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
         cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        # Low password hashing cost keeps tests fast
+        cls.app.config['PASSWORD_COST'] = 1000
 
         with cls.app.app_context():
+            hasher.init_app(cls.app)
             db.init_app(cls.app)
             db.create_all()
 
@@ -152,7 +158,10 @@ class TestDatabaseModuleClass(unittest.TestCase):
             self.assertEqual(len(users), 1)
             users[0].set_password('pass')
             user = User.retrieve(users[0].userid)
-            self.assertEqual(user.password, 'pass')
+            # Password is stored as salted hash
+            self.assertTrue(user.password.startswith('$pbkdf2-sha256$1000$'))
+            self.assertTrue(user.check_password('pass'))
+            self.assertFalse(user.check_password('pass1'))
 
     def test_10_lock(self):
         """Test User lock methods"""
@@ -190,3 +199,108 @@ class TestDatabaseModuleClass(unittest.TestCase):
             users = User.get_list(filters)
             self.assertEqual(len(users), 2)
             self.assertEqual(users[0].username, 'lin')
+
+    def test_13_user_get_list_keyset_pagination(self):
+        """Test User.get_list() keyset pagination with 'after' cursor"""
+        with self.app.app_context():
+            # Database should contain johne, lindas and lin
+            filters = {'sortBy': '-lastname', 'limit': 1}
+            users = User.get_list(filters)
+            self.assertEqual(users[0].username, 'lindas')
+            filters['after'] = users[0].get_cursor(filters)
+            users = User.get_list(filters)
+            self.assertEqual(users[0].username, 'lin')
+            filters['after'] = users[0].get_cursor(filters)
+            users = User.get_list(filters)
+            self.assertEqual(users[0].username, 'johne')
+            filters['after'] = users[0].get_cursor(filters)
+            self.assertEqual(len(User.get_list(filters)), 0)
+            # Cursor must match sortBy columns
+            with self.assertRaises(ValueError):
+                User.get_list({'sortBy': 'lastname', 'after': [1]})
+
+    def test_14_unit_of_work(self):
+        """Test model methods only stage changes in Unit of Work mode"""
+        self.app.config['UNIT_OF_WORK'] = True
+        try:
+            with self.app.test_request_context():
+                user = User.get_list({'username': 'johne'})[0]
+                user.update(lastname='Staged')
+                # Request failed, staged change is rolled back
+                db.session.rollback()
+            with self.app.app_context():
+                user = User.get_list({'username': 'johne'})[0]
+                self.assertEqual(user.lastname, 'Example')
+        finally:
+            self.app.config['UNIT_OF_WORK'] = False
+
+    def test_15_user_get_list_return_fields(self):
+        """Test User.get_list() loads only return_fields columns"""
+        with self.app.app_context():
+            filters = {'return_fields': 'username', 'sortBy': 'lastname'}
+            users = User.get_list(filters)
+            self.assertEqual(len(users), 3)
+            unloaded = db.inspect(users[0]).unloaded
+            self.assertNotIn('username', unloaded)
+            self.assertNotIn('userid', unloaded)
+            self.assertNotIn('lastname', unloaded)
+            self.assertIn('password', unloaded)
+            self.assertIn('email', unloaded)
+
+    def test_16_sqlite_pragmas(self):
+        """Test SQLITE_* config variables are set on new connections"""
+        app = Flask(__name__, instance_relative_config=False)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'pragmas.sqlite3')
+            app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+            app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+            app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+            app.config['SQLITE_BUSY_TIMEOUT'] = 1234
+            with app.app_context():
+                db.init_app(app)
+                init_sqlite_pragmas(app)
+                connection = db.get_engine(app).connect()
+                journal_mode = connection.execute('PRAGMA journal_mode').scalar()
+                busy_timeout = connection.execute('PRAGMA busy_timeout').scalar()
+                connection.close()
+                db.get_engine(app).dispose()
+        self.assertEqual(journal_mode, 'wal')
+        self.assertEqual(busy_timeout, 1234)
+
+    def test_17_sqlite_queue_pool_threads(self):
+        """Test pooled SQLite connections are shared by Request threads"""
+        errors = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            environ = {
+                'APPUSERS_CONFIG': 'test_config.py',
+                'APPUSERS_DATABASE_URI':
+                    f'sqlite:///{os.path.join(tmpdir, "pool.sqlite3")}',
+                'APPUSERS_DATABASE_POOL_SIZE': '2',
+                'APPUSERS_ENTITY_CACHE': 'False',
+                'APPUSERS_AUDIT_LOG': 'False'
+                }
+            with mock.patch.dict(os.environ, environ):
+                app = create_app()
+            with app.app_context():
+                userid = User(username='pooluser', firstname='Pool',
+                    lastname='User').userid
+            headers = {'X-API-Key': app.config['API_KEY']}
+
+            def retrieve():
+                client = app.test_client()
+                for i in range(30):
+                    try:
+                        resp = client.get(f'/users/{userid}', headers=headers)
+                        if resp.status_code != 200:
+                            errors.append(resp.status_code)
+                    except Exception as e:
+                        errors.append(e)
+
+            threads = [threading.Thread(target=retrieve) for i in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            with app.app_context():
+                db.get_engine(app).dispose()
+        self.assertEqual(errors, [])
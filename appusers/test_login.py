@@ -0,0 +1,405 @@
+"""Unit tests for Login operation
+
+This module provides Unit tests of Login operation features: rate limiting,
+throttling and token claims, tested with Flask Test Client.
+"""
+import os, unittest, threading, datetime, flask_jwt_extended
+from sqlalchemy import event
+from appusers import create_app
+from appusers.database import db, User, principal_cache, load_principal
+from appusers.throttle import throttle
+from appusers.passwords import hash_parameters
+from appusers.audit import audit
+
+
+class TestLoginClass(unittest.TestCase):
+    """Test Login operation of full Application"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initialize app, create test_client and test Users"""
+
+        if 'APPUSERS_CONFIG' not in os.environ:
+            os.environ['APPUSERS_CONFIG'] = 'test_config.py'
+
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            # Clear existing data in test database
+            meta = db.metadata
+            for table in reversed(meta.sorted_tables):
+                db.session.execute(table.delete())
+            db.session.commit()
+            admin = User(
+                username='admin',
+                firstname='Admin',
+                lastname='User',
+                email='admin@example.com',
+                phone='123-444-5555'
+                )
+            admin.set_password('pass')
+            admin.grant_admin()
+            johne = User(
+                username='johne',
+                firstname='John',
+                lastname='Example',
+                email='johne@example.com',
+                phone='123-444-6666'
+                )
+            johne.set_password('pass')
+            cls.admin_userid = admin.userid
+            cls.johne_userid = johne.userid
+
+    def setUp(self):
+        """Start every test with empty throttle store"""
+        throttle.init_app(self.app)
+
+    def test_01_rate_limit(self):
+        """Test 429 Response of Login operation exceeding rate limits"""
+        config = self.app.config
+        saved = {k: config[k] for k in
+            ['LOGIN_USERNAME_BURST', 'LOGIN_IP_BURST', 'LOGIN_IP_RATE']}
+        config['LOGIN_USERNAME_BURST'] = 3
+        config['LOGIN_IP_BURST'] = 5
+        try:
+            # Username bucket is checked before Database lookup
+            for i in range(3):
+                resp = self.client.post(
+                    '/login', json={'username': 'nosuchuser', 'password': 'x'})
+                self.assertEqual(resp.status_code, 401)
+            resp = self.client.post(
+                '/login', json={'username': 'nosuchuser', 'password': 'x'})
+            self.assertEqual(resp.status_code, 429)
+            self.assertGreaterEqual(int(resp.headers['Retry-After']), 1)
+            # Other username still can log in
+            resp = self.client.post(
+                '/login', json={'username': 'johne', 'password': 'pass'})
+            self.assertEqual(resp.status_code, 200)
+            # Rejected attempt did not take address token, one is left
+            resp = self.client.post(
+                '/login', json={'username': 'admin', 'password': 'pass'})
+            self.assertEqual(resp.status_code, 200)
+            resp = self.client.post(
+                '/login', json={'username': 'admin', 'password': 'pass'})
+            self.assertEqual(resp.status_code, 429)
+            # Limits are disabled with rate 0
+            config['LOGIN_IP_RATE'] = 0
+            resp = self.client.post(
+                '/login', json={'username': 'admin', 'password': 'pass'})
+            self.assertEqual(resp.status_code, 200)
+        finally:
+            config.update(saved)
+
+    def login(self, username):
+        """Login User with password 'pass', return Authorization header"""
+        resp = self.client.post(
+            '/login', json={'username': username, 'password': 'pass'})
+        self.assertEqual(resp.status_code, 200)
+        return {'Authorization': f'Bearer {resp.get_json()["jwtToken"]}'}
+
+    def test_02_principal_cache(self):
+        """Test cached User Principals of authenticated Requests"""
+        admin = self.login('admin')
+        johne = self.login('johne')
+        stats = principal_cache.stats()
+        for i in range(3):
+            resp = self.client.get(
+                f'/users/{self.johne_userid}/admin', headers=admin)
+            self.assertEqual(resp.status_code, 200)
+        self.assertEqual(principal_cache.stats()['hits'], stats['hits'] + 2)
+        # Granting admin status invalidates cached Principal
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/grant', headers=admin)
+        self.assertEqual(resp.status_code, 200)
+        stats = principal_cache.stats()
+        resp = self.client.get(
+            f'/users/{self.admin_userid}/admin', headers=self.login('johne'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(principal_cache.stats()['misses'], stats['misses'] + 1)
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/revoke', headers=admin)
+        self.assertEqual(resp.status_code, 200)
+        # Cache can be disabled
+        self.app.config['PRINCIPAL_CACHE'] = False
+        try:
+            stats = principal_cache.stats()
+            resp = self.client.get(
+                f'/users/{self.johne_userid}/admin', headers=admin)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(principal_cache.stats(), stats)
+        finally:
+            self.app.config['PRINCIPAL_CACHE'] = True
+
+    def test_03_admin_claims(self):
+        """Test admin authorization with Token claims and authz_epoch"""
+        admin = self.login('admin')
+        johne = self.login('johne')
+        with self.app.app_context():
+            claims = flask_jwt_extended.decode_token(
+                admin['Authorization'][7:])['user_claims']
+        self.assertTrue(claims['admin'])
+        # Token issued before admin status was granted has no admin claim
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/grant', headers=admin)
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(
+            f'/users/{self.admin_userid}/admin', headers=johne)
+        self.assertEqual(resp.status_code, 401)
+        johne = self.login('johne')
+        resp = self.client.get(
+            f'/users/{self.admin_userid}/admin', headers=johne)
+        self.assertEqual(resp.status_code, 200)
+        # Revoked admin status and lock invalidate issued admin Tokens
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/revoke', headers=admin)
+        resp = self.client.get(
+            f'/users/{self.admin_userid}/admin', headers=johne)
+        self.assertEqual(resp.status_code, 401)
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/grant', headers=admin)
+        johne = self.login('johne')
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/lock/set', headers=admin)
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(
+            f'/users/{self.admin_userid}/admin', headers=johne)
+        self.assertEqual(resp.status_code, 401)
+        # Restore johne
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/lock/unset', headers=admin)
+        resp = self.client.post(
+            f'/users/{self.johne_userid}/admin/revoke', headers=admin)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_04_password_rehash(self):
+        """Test plaintext and outdated password hashes rehashed on login"""
+        with self.app.app_context():
+            user = User.retrieve(self.johne_userid)
+            user.password = 'legacy'
+            db.session.commit()
+        resp = self.client.post(
+            '/login', json={'username': 'johne', 'password': 'legacy'})
+        self.assertEqual(resp.status_code, 200)
+        with self.app.app_context():
+            hashed = User.retrieve(self.johne_userid).password
+        self.assertEqual(hash_parameters(hashed),
+            ('pbkdf2-sha256', self.app.config['PASSWORD_COST']))
+        # Hash is not changed by next login
+        resp = self.client.post(
+            '/login', json={'username': 'johne', 'password': 'legacy'})
+        self.assertEqual(resp.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(User.retrieve(self.johne_userid).password, hashed)
+            User.retrieve(self.johne_userid).set_password('pass')
+
+    def test_05_zero_write_login(self):
+        """Test successful logins do not write to Database"""
+        writes = []
+
+        def count_writes(conn, cursor, statement, *args):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                writes.append(statement)
+
+        self.login('johne')
+        with self.app.app_context():
+            engine = db.get_engine(self.app)
+        event.listen(engine, 'before_cursor_execute', count_writes)
+        try:
+            for i in range(3):
+                self.login('johne')
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_writes)
+        self.assertEqual(writes, [])
+
+    def test_06_database_failure_counters(self):
+        """Test atomic failed logins counters in user table"""
+        self.app.config['THROTTLE_STORE'] = 'database'
+        throttle.init_app(self.app)
+        max_attempts = self.app.config['MAX_FAILED_LOGIN_ATTEMPTS']
+        locked = []
+
+        def fail_logins():
+            with self.app.app_context():
+                user = User.retrieve(self.johne_userid)
+                for i in range(max_attempts):
+                    locked.append(throttle.failed_login(user))
+                db.session.remove()
+
+        try:
+            threads = [threading.Thread(target=fail_logins) for i in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            with self.app.app_context():
+                user = User.retrieve(self.johne_userid)
+                # No lost increments, single lock transition
+                self.assertEqual(user.failed_logins, 3 * max_attempts)
+                self.assertTrue(user.get_lock())
+                self.assertEqual(locked.count(True), 1)
+                user.unlock()
+        finally:
+            self.app.config['THROTTLE_STORE'] = 'memory'
+            throttle.init_app(self.app)
+        self.login('johne')
+
+    def test_07_login_audit_log(self):
+        """Test Login attempts audit log and List User Login attempts"""
+        audit.flush()
+        admin = self.login('admin')
+        for password in ['pass1', 'pass', 'pass2']:
+            self.client.post(
+                '/login', json={'username': 'johne', 'password': password})
+        self.client.post(
+            '/login', json={'username': 'nosuchuser', 'password': 'pass'})
+        # Attempts are visible after buffer flush
+        audit.flush()
+        resp = self.client.get(
+            f'/users/{self.johne_userid}/logins', query_string={'limit': 2},
+            headers=admin)
+        self.assertEqual(resp.status_code, 200)
+        events = resp.get_json()
+        self.assertEqual([e['result'] for e in events],
+            ['bad_password', 'success'])
+        self.assertEqual(events[0]['address'], '127.0.0.1')
+        self.assertEqual(events[0]['username'], 'johne')
+        resp = self.client.get(
+            resp.headers['Link'][1:-len('>; rel="next"')], headers=admin)
+        self.assertEqual(resp.get_json()[0]['result'], 'bad_password')
+        # Admin privilege is required
+        johne = self.login('johne')
+        resp = self.client.get(
+            f'/users/{self.johne_userid}/logins', headers=johne)
+        self.assertEqual(resp.status_code, 401)
+        resp = self.client.get('/users/0/logins', headers=admin)
+        self.assertEqual(resp.status_code, 404)
+        # Records older than AUDIT_RETENTION are deleted
+        retention = self.app.config['AUDIT_RETENTION']
+        self.app.config['AUDIT_RETENTION'] = datetime.timedelta(0)
+        try:
+            audit.last_prune = None
+            audit.flush()
+        finally:
+            self.app.config['AUDIT_RETENTION'] = retention
+        resp = self.client.get(
+            f'/users/{self.johne_userid}/logins', headers=admin)
+        self.assertEqual(resp.get_json(), [])
+
+    def test_08_concurrent_lock_transitions(self):
+        """Test concurrent lock, unlock and rehash do not fail"""
+        config = self.app.config
+        saved = config['MAX_FAILED_LOGIN_ATTEMPTS']
+        config['MAX_FAILED_LOGIN_ATTEMPTS'] = 1
+        statuses = []
+        errors = []
+
+        def bad_login(barrier):
+            client = self.app.test_client()
+            barrier.wait()
+            resp = client.post(
+                '/login', json={'username': 'johne', 'password': 'bad'})
+            statuses.append(resp.status_code)
+
+        def transitions(barrier, method):
+            with self.app.app_context():
+                user = User.retrieve(self.johne_userid)
+                barrier.wait()
+                try:
+                    for i in range(5):
+                        getattr(user, method)()
+                except Exception as e:
+                    errors.append(e)
+                db.session.remove()
+
+        try:
+            for i in range(5):
+                throttle.init_app(self.app)
+                barrier = threading.Barrier(4)
+                threads = [threading.Thread(target=bad_login, args=(barrier,))
+                    for j in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                with self.app.app_context():
+                    user = User.retrieve(self.johne_userid)
+                    self.assertTrue(user.get_lock())
+                    user.unlock()
+            self.assertEqual(set(statuses), {401})
+            # Stale loaded User objects are updated without StaleDataError
+            barrier = threading.Barrier(3)
+            threads = [threading.Thread(target=transitions,
+                args=(barrier, method)) for method in
+                ['set_lock', 'unlock', 'revoke_admin']]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            with self.app.app_context():
+                User.retrieve(self.johne_userid).unlock()
+        finally:
+            config['MAX_FAILED_LOGIN_ATTEMPTS'] = saved
+        self.login('johne')
+
+    def test_09_audit_flush_retry(self):
+        """Test records of failed audit log flush are retried"""
+        audit.flush()
+        with self.app.app_context():
+            engine = db.get_engine(self.app, bind='audit')
+            count = lambda: engine.execute(
+                'SELECT count(*) FROM login_event').scalar()
+            before = count()
+
+        def database_locked(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith('INSERT'):
+                raise RuntimeError('database is locked')
+
+        event.listen(engine, 'before_cursor_execute', database_locked)
+        try:
+            self.login('johne')
+            with self.assertRaises(RuntimeError):
+                audit.flush()
+            self.login('johne')
+        finally:
+            event.remove(engine, 'before_cursor_execute', database_locked)
+        audit.flush()
+        self.assertEqual(count(), before + 2)
+
+    def test_10_request_body_per_request(self):
+        """Test Requests sharing application context do not share body"""
+        with self.app.app_context():
+            self.login('admin')
+            resp = self.client.post(
+                '/login', json={'username': 'johne', 'password': 'bad'})
+            self.assertEqual(resp.status_code, 401)
+        with self.app.app_context():
+            User.retrieve(self.johne_userid).unlock()
+        throttle.init_app(self.app)
+
+    def test_11_principal_evicted_after_commit(self):
+        """Test Principal loaded before Unit of Work commit is not kept"""
+        self.app.config['UNIT_OF_WORK'] = True
+
+        def load():
+            with self.app.test_request_context():
+                load_principal(self.admin_userid)
+                db.session.remove()
+
+        try:
+            with self.app.test_request_context():
+                load_principal(self.admin_userid)
+                User.retrieve(self.admin_userid).revoke_admin()
+                # concurrent Request loads Principal before commit
+                thread = threading.Thread(target=load)
+                thread.start()
+                thread.join()
+                db.session.commit()
+            self.assertIsNone(principal_cache.get(self.admin_userid))
+            with self.app.test_request_context():
+                self.assertFalse(load_principal(self.admin_userid).admin)
+                User.retrieve(self.admin_userid).grant_admin()
+                db.session.commit()
+        finally:
+            self.app.config['UNIT_OF_WORK'] = False
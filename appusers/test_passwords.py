@@ -0,0 +1,63 @@
+"""Unit tests for appusers.passwords module
+
+This module provides Unit tests of password hashing functions and of
+PasswordHasher pools.
+Tests are prepared to be run with PyTest.
+"""
+import unittest
+from flask import Flask
+from appusers.passwords import (PasswordHasher, make_hash, check_hash,
+    hash_parameters, calibrate, PBKDF2_SHA256, SCRYPT)
+
+
+class TestPasswordsModuleClass(unittest.TestCase):
+    """Test password hashing and verification"""
+
+    def test_1_hash_format(self):
+        """Test versioned hash format of both methods"""
+        for method, cost in [(PBKDF2_SHA256, 1000), (SCRYPT, 10)]:
+            hashed = make_hash('secret', method, cost)
+            self.assertEqual(hash_parameters(hashed), (method, cost))
+            self.assertLessEqual(len(hashed), 120)
+            self.assertTrue(check_hash('secret', hashed))
+            self.assertFalse(check_hash('Secret', hashed))
+            # Salt is random
+            self.assertNotEqual(hashed, make_hash('secret', method, cost))
+        # Plaintext passwords stored before hashing are still verified
+        self.assertIsNone(hash_parameters('secret'))
+        self.assertTrue(check_hash('secret', 'secret'))
+        self.assertFalse(check_hash('secret1', 'secret'))
+        # Values not in exact hash format are plaintext
+        hashed = make_hash('secret', PBKDF2_SHA256, 1000)
+        for plaintext in ['$ecret', '$', '$pbkdf2-sha256$1000$abc',
+                '$md5$1000$abcd$abcd', '$scrypt$ten$abcd$abcd',
+                hashed + '$x', hashed.replace('$1000$', '$01000$')]:
+            self.assertIsNone(hash_parameters(plaintext), msg=plaintext)
+            self.assertTrue(check_hash(plaintext, plaintext))
+            self.assertFalse(check_hash('secret', plaintext))
+
+    def test_2_hasher(self):
+        """Test PasswordHasher pools and rehash decision"""
+        app = Flask(__name__)
+        app.config['PASSWORD_COST'] = 1000
+        for pool, workers in [('thread', 0), ('thread', 2), ('process', 1)]:
+            app.config['PASSWORD_POOL'] = pool
+            app.config['PASSWORD_WORKERS'] = workers
+            hasher = PasswordHasher()
+            hasher.init_app(app)
+            hashed = hasher.hash('secret')
+            self.assertTrue(hasher.verify('secret', hashed), msg=pool)
+            self.assertFalse(hasher.verify('secret1', hashed))
+            self.assertFalse(hasher.needs_rehash(hashed))
+            # Dummy hash of unknown usernames has current method and cost
+            self.assertFalse(hasher.verify_dummy('secret'))
+            self.assertFalse(hasher.needs_rehash(hasher._dummy_hash))
+            hasher.executor and hasher.executor.shutdown()
+        self.assertTrue(hasher.needs_rehash('secret'))
+        self.assertTrue(hasher.needs_rehash(make_hash('secret', SCRYPT, 10)))
+        self.assertTrue(hasher.needs_rehash(make_hash('secret', cost=2000)))
+
+    def test_3_calibrate(self):
+        """Test calibrated cost meets target latency"""
+        self.assertGreaterEqual(calibrate(PBKDF2_SHA256, 0.01), 1000)
+        self.assertGreaterEqual(calibrate(SCRYPT, 0.001), 10)
@@ -0,0 +1,145 @@
+"""Unit tests for read replica routing
+
+This module provides Unit tests of routing GET Requests to read replica
+Database. Replica is a copy of SQLite test Database file, kept in sync by
+copy step in tests.
+"""
+import os, shutil, tempfile, unittest
+from appusers import create_app
+from appusers.database import db, User, principal_cache
+
+
+class TestReadReplicasClass(unittest.TestCase):
+    """Test read replica routing of full Application"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initialize app with one read replica and create test_client"""
+
+        if 'APPUSERS_CONFIG' not in os.environ:
+            os.environ['APPUSERS_CONFIG'] = 'test_config.py'
+
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.tmpdir, 'replica.sqlite3')
+        os.environ['APPUSERS_DATABASE_REPLICAS'] = f'sqlite:///{cls.replica_path}'
+        try:
+            cls.app = create_app()
+        finally:
+            del os.environ['APPUSERS_DATABASE_REPLICAS']
+        # Cached Representations would hide which Database was read
+        cls.app.config['ENTITY_CACHE'] = False
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            cls.primary_path = db.engine.url.database
+            # Clear existing data in test database
+            meta = db.metadata
+            for table in reversed(meta.sorted_tables):
+                db.session.execute(table.delete())
+            db.session.commit()
+            admin_user = User(
+                username='admin',
+                firstname='Admin',
+                lastname='User',
+                email='admin@example.com',
+                phone='123-444-5555'
+                )
+            admin_user.set_password('pass')
+            admin_user.grant_admin()
+            cls.admin_userid = admin_user.userid
+        cls.sync_replica()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @classmethod
+    def sync_replica(cls):
+        """Copy primary Database file to replica"""
+        shutil.copyfile(cls.primary_path, cls.replica_path)
+
+    def get_lastname(self, remote_addr):
+        """Retrieve admin lastname as client with remote_addr"""
+        resp = self.client.get(
+            f'/users/{self.admin_userid}',
+            headers={'X-API-Key': self.app.config['API_KEY']},
+            environ_base={'REMOTE_ADDR': remote_addr}
+            )
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()['lastname']
+
+    def test_1_read_your_writes(self):
+        """Test reads go to replica, except for client which has written"""
+        resp = self.client.post(
+            '/login',
+            json={'username': 'admin', 'password': 'pass'},
+            environ_base={'REMOTE_ADDR': '10.0.0.1'}
+            )
+        self.assertEqual(resp.status_code, 200)
+        jwt_token = resp.get_json()['jwtToken']
+        resp = self.client.patch(
+            f'/users/{self.admin_userid}',
+            json={'lastname': 'Changed'},
+            headers={'Authorization': f'Bearer {jwt_token}'},
+            environ_base={'REMOTE_ADDR': '10.0.0.1'}
+            )
+        self.assertEqual(resp.status_code, 200)
+        # Writing client is pinned to primary Database
+        self.assertEqual(self.get_lastname('10.0.0.1'), 'Changed')
+        # Other client reads stale data from replica until it gets synced
+        self.assertEqual(self.get_lastname('10.0.0.2'), 'User')
+        self.sync_replica()
+        self.assertEqual(self.get_lastname('10.0.0.2'), 'Changed')
+
+    def test_2_principal_not_cached_from_replica(self):
+        """Test Principals read from replica are not cached"""
+        resp = self.client.post(
+            '/login',
+            json={'username': 'admin', 'password': 'pass'},
+            environ_base={'REMOTE_ADDR': '10.0.0.3'}
+            )
+        headers = {'Authorization': f'Bearer {resp.get_json()["jwtToken"]}'}
+        url = f'/users/{self.admin_userid}/admin'
+        principal_cache.clear()
+        resp = self.client.get(url, headers=headers,
+            environ_base={'REMOTE_ADDR': '10.0.0.4'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(principal_cache.get(self.admin_userid))
+        # Principal read from primary Database is cached
+        resp = self.client.post(f'{url}/grant', headers=headers,
+            environ_base={'REMOTE_ADDR': '10.0.0.4'})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(url, headers=headers,
+            environ_base={'REMOTE_ADDR': '10.0.0.4'})
+        self.assertIsNotNone(principal_cache.get(self.admin_userid))
+
+    def test_3_count_not_cached_from_replica(self):
+        """Test total count read from replica is not cached for writer"""
+        resp = self.client.post(
+            '/login',
+            json={'username': 'admin', 'password': 'pass'},
+            environ_base={'REMOTE_ADDR': '10.0.0.5'}
+            )
+        headers = {'Authorization': f'Bearer {resp.get_json()["jwtToken"]}'}
+        self.sync_replica()
+        resp = self.client.post(
+            '/users',
+            json={'username': 'counted', 'firstname': 'Counted',
+                'lastname': 'User', 'contactInfo': {
+                    'email': 'counted@example.com', 'phone': '123-444-7777'}},
+            headers=headers,
+            environ_base={'REMOTE_ADDR': '10.0.0.5'}
+            )
+        self.assertEqual(resp.status_code, 201)
+        api_key = {'X-API-Key': self.app.config['API_KEY']}
+        # Other client counts lagging replica
+        resp = self.client.get('/users', query_string={'count': 'exact'},
+            headers=api_key, environ_base={'REMOTE_ADDR': '10.0.0.6'})
+        self.assertEqual(int(resp.headers['X-Total-Count']),
+            len(resp.get_json()))
+        # Writer counts primary Database
+        resp = self.client.get('/users', query_string={'count': 'exact'},
+            headers=api_key, environ_base={'REMOTE_ADDR': '10.0.0.5'})
+        self.assertEqual(int(resp.headers['X-Total-Count']),
+            len(resp.get_json()))
+        self.assertIn('counted', [u['username'] for u in resp.get_json()])
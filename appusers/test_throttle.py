@@ -0,0 +1,157 @@
+"""Unit tests for appusers.throttle module
+
+This module provides Unit tests of login throttle stores and of account
+lock decision made by LoginThrottle.
+Tests are prepared to be run with PyTest.
+"""
+import os, time, unittest, tempfile
+from datetime import timedelta
+from flask import Flask
+from appusers.cache import LRUCache
+from appusers.throttle import LoginThrottle, SQLiteStore
+
+
+class LockableUser:
+    """User lock status and lock writes counter"""
+
+    def __init__(self, userid):
+        self.userid = userid
+        self.locked = False
+        self.lock_writes = 0
+
+    def get_lock(self):
+        return self.locked
+
+    def set_lock(self):
+        self.locked = True
+        self.lock_writes += 1
+
+
+class TestThrottleModuleClass(unittest.TestCase):
+    """Test throttle stores and LoginThrottle"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initialize app with short LOCK_TIMEOUT and temporary folder"""
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.app = Flask(__name__, instance_relative_config=False)
+        cls.app.config['TESTING'] = True
+        cls.app.config['MAX_FAILED_LOGIN_ATTEMPTS'] = 2
+        cls.app.config['LOCK_TIMEOUT'] = timedelta(seconds=0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_1_memory_store(self):
+        """Test counters with expiry in LRUCache"""
+        store = LRUCache(maxsize=2)
+        self.assertEqual(store.incr('a', ttl=0.1), 1)
+        self.assertEqual(store.incr('a', ttl=0.1), 2)
+        time.sleep(0.15)
+        # expired counter starts again
+        self.assertEqual(store.incr('a', ttl=0.1), 1)
+        store.incr('b')
+        store.incr('c')
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_2_sqlite_store(self):
+        """Test counters with expiry shared through SQLite sidecar file"""
+        path = os.path.join(self.tmpdir.name, 'throttle.sqlite3')
+        worker1, worker2 = SQLiteStore(path), SQLiteStore(path)
+        self.assertEqual(worker1.incr('a', ttl=0.1), 1)
+        self.assertEqual(worker2.incr('a', ttl=0.1), 2)
+        self.assertEqual(worker1.get('a'), 2)
+        time.sleep(0.15)
+        self.assertIsNone(worker2.get('a'))
+        self.assertEqual(worker2.incr('a', ttl=0.1), 1)
+        self.assertEqual(worker1.pop('a'), 1)
+        self.assertEqual(worker2.get('a', 0), 0)
+
+    def test_3_login_throttle(self):
+        """Test account lock decision of LoginThrottle for both stores"""
+        for store in ['memory', 'sqlite']:
+            self.app.config['THROTTLE_STORE'] = store
+            self.app.config['THROTTLE_STORE_PATH'] = os.path.join(
+                self.tmpdir.name, 'login.sqlite3')
+            throttle = LoginThrottle()
+            throttle.init_app(self.app)
+            user, other = LockableUser(1), LockableUser(2)
+            with self.app.app_context():
+                # lock when failed logins exceed MAX_FAILED_LOGIN_ATTEMPTS
+                self.assertFalse(throttle.failed_login(user))
+                self.assertFalse(throttle.failed_login(user))
+                self.assertTrue(throttle.failed_login(user), msg=store)
+                self.assertEqual(throttle.failures(user), 3)
+                self.assertEqual(throttle.failures(other), 0)
+                # only lock transition is persisted
+                self.assertFalse(throttle.failed_login(user))
+                self.assertEqual(user.lock_writes, 1)
+                user.locked = False
+                throttle.clear(user.userid)
+                self.assertFalse(throttle.failed_login(user))
+                # counter expires LOCK_TIMEOUT after last failed login
+                throttle.failed_login(user)
+                time.sleep(0.25)
+                self.assertEqual(throttle.failures(user), 0)
+                self.assertFalse(throttle.failed_login(user))
+
+    def test_4_token_bucket(self):
+        """Test token buckets of LoginThrottle for both stores"""
+        for store in ['memory', 'sqlite']:
+            self.app.config['THROTTLE_STORE'] = store
+            self.app.config['THROTTLE_STORE_PATH'] = os.path.join(
+                self.tmpdir.name, 'bucket.sqlite3')
+            throttle = LoginThrottle()
+            throttle.init_app(self.app)
+            # burst of 3 tokens, then one token every 0.1 sec
+            for i in range(3):
+                self.assertEqual(throttle.take_token('a', 10, 3), 0)
+            wait = throttle.take_token('a', 10, 3)
+            self.assertGreater(wait, 0, msg=store)
+            self.assertLessEqual(wait, 0.1)
+            # rejected request does not take token, other keys are separate
+            self.assertGreater(throttle.take_token('a', 10, 3), 0)
+            self.assertEqual(throttle.take_token('b', 10, 3), 0)
+            time.sleep(wait)
+            self.assertEqual(throttle.take_token('a', 10, 3), 0)
+
+    def test_5_buckets_do_not_evict_counters(self):
+        """Test many token buckets do not evict failed login counters"""
+        for store in ['memory', 'sqlite']:
+            self.app.config['THROTTLE_STORE'] = store
+            self.app.config['THROTTLE_STORE_SIZE'] = 10
+            self.app.config['THROTTLE_STORE_PATH'] = os.path.join(
+                self.tmpdir.name, 'evict.sqlite3')
+            throttle = LoginThrottle()
+            throttle.init_app(self.app)
+            user = LockableUser(1)
+            with self.app.app_context():
+                throttle.failed_login(user)
+                throttle.failed_login(user)
+                for i in range(100):
+                    throttle.take_token(f'ip:10.0.0.{i}', 10, 3)
+                self.assertEqual(throttle.failures(user), 2, msg=store)
+        del self.app.config['THROTTLE_STORE_SIZE']
+
+    def test_6_rejected_login_keeps_address_tokens(self):
+        """Test login rejected by username limit does not take address token"""
+        self.app.config.update(LOGIN_IP_RATE=60, LOGIN_IP_BURST=3,
+            LOGIN_USERNAME_RATE=60, LOGIN_USERNAME_BURST=1)
+        for store in ['memory', 'sqlite']:
+            self.app.config['THROTTLE_STORE'] = store
+            self.app.config['THROTTLE_STORE_PATH'] = os.path.join(
+                self.tmpdir.name, 'login_buckets.sqlite3')
+            throttle = LoginThrottle()
+            throttle.init_app(self.app)
+            with self.app.app_context():
+                self.assertEqual(throttle.login_retry_after('10.0.0.1', 'a'), 0)
+                for i in range(5):
+                    self.assertGreater(
+                        throttle.login_retry_after('10.0.0.1', 'a'), 0)
+                # Address bucket still has 2 tokens
+                self.assertEqual(throttle.login_retry_after('10.0.0.1', 'b'), 0)
+                self.assertEqual(throttle.login_retry_after('10.0.0.1', 'c'), 0)
+                self.assertGreater(
+                    throttle.login_retry_after('10.0.0.1', 'd'), 0, msg=store)
@@ -0,0 +1,276 @@
+"""Login throttling module
+
+This module declares LoginThrottle class, which counts failed logins of
+User accounts and decides when an account gets locked. Counters are held
+in throttle store, outside of user table, so that failed logins do not
+write to Database. Only lock transitions are persisted to User Objects.
+
+LoginThrottle also limits rate of login attempts with token buckets,
+keyed by client address and by username, before Database is accessed
+(see utils.login_rate_limited). Buckets are kept in a separate store
+(LRUCache or SQLite table), so that traffic creating many buckets can not
+evict failed login counters.
+
+throttle, an instance of LoginThrottle is declared here and is initialized
+in Application Factory function.
+throttle uses following Application Config variables:
+
+- THROTTLE_STORE - 'memory' keeps counters in worker process (LRUCache),
+    'sqlite' keeps counters in SQLite sidecar file shared by workers,
+    'database' counts failed logins in user table with atomic UPDATE
+- THROTTLE_STORE_PATH - SQLite sidecar file path, relative paths are
+    resolved in Application root folder
+- THROTTLE_STORE_SIZE - maximal number of counters, and of token buckets,
+    in 'memory' store
+- MAX_FAILED_LOGIN_ATTEMPTS - account is locked when number of failed
+    logins exceeds this value
+- LOCK_TIMEOUT - failed logins counter expires after this period without
+    failed login
+- LOGIN_IP_RATE, LOGIN_USERNAME_RATE - login attempts per minute allowed
+    from client address and for username, 0 disables limit
+- LOGIN_IP_BURST, LOGIN_USERNAME_BURST - login attempts allowed at once
+"""
+import os, sqlite3, time
+from threading import local
+from flask import current_app
+from appusers.cache import LRUCache
+
+
+class SQLiteStore:
+    """Throttle store keeping counters with expiry in SQLite file
+
+    Counters are shared by all processes using the same file. Store has
+    the same interface as LRUCache: incr(), update(), get() and pop().
+    Stores with other table names in the same file are independent.
+    """
+
+    # Expired counters are deleted every PRUNE_INTERVAL writes
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, path, table='throttle', timeout=5.0):
+        self.path = path
+        self.table = table
+        self.timeout = timeout
+        self._local = local()
+        self._writes = 0
+        self._connection().execute(
+            f'''CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                expires REAL
+                )'''
+            )
+
+    def _connection(self):
+        """Return SQLite connection of current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def incr(self, key, delta=1, ttl=None):
+        """Atomically add delta to counter of key (0 if missing or expired),
+           restart its time to live and return new value
+        """
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        connection = self._connection()
+        # IMMEDIATE transaction takes write lock before reading counter
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                f'''INSERT INTO {self.table} (key, value, expires)
+                VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = CASE WHEN expires IS NULL OR expires > ?
+                        THEN value + excluded.value
+                        ELSE excluded.value END,
+                    expires = excluded.expires''',
+                (key, delta, expires, now)
+                )
+            value = connection.execute(
+                f'SELECT value FROM {self.table} WHERE key = ?', (key,)
+                ).fetchone()[0]
+            self._prune(connection, now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def update(self, key, func, ttl=None):
+        """Atomically replace counter of key with func(value)
+
+        func gets current value (None if missing or expired) and returns
+        (new value, result) pair. new value None keeps current counter.
+        Returns result.
+        """
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                f'''SELECT value FROM {self.table}
+                WHERE key = ? AND (expires IS NULL OR expires > ?)''',
+                (key, now)
+                ).fetchone()
+            value, result = func(None if row is None else row[0])
+            if value is not None:
+                connection.execute(
+                    f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)',
+                    (key, value, expires)
+                    )
+                self._prune(connection, now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return result
+
+    def _prune(self, connection, now):
+        """Delete expired counters every PRUNE_INTERVAL writes"""
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            connection.execute(
+                f'DELETE FROM {self.table} WHERE expires <= ?', (now,))
+
+    def get(self, key, default=None):
+        """Return counter of key or default if missing or expired"""
+        row = self._connection().execute(
+            f'''SELECT value FROM {self.table}
+            WHERE key = ? AND (expires IS NULL OR expires > ?)''',
+            (key, time.time())
+            ).fetchone()
+        return default if row is None else row[0]
+
+    def pop(self, key, default=None):
+        """Remove counter of key and return its value"""
+        value = self.get(key)
+        if value is None:
+            # no write for missing key
+            return default
+        self._connection().execute(
+            f'DELETE FROM {self.table} WHERE key = ?', (key,))
+        return value
+
+
+class LoginThrottle:
+    """Failed login counters kept in throttle store and login token
+       buckets kept in separate buckets store
+    """
+
+    def __init__(self):
+        self.store = LRUCache(maxsize=10000)
+        self.buckets = LRUCache(maxsize=10000)
+        self.count_in_database = False
+
+    def init_app(self, app):
+        """Create throttle store configured by THROTTLE_STORE"""
+        # 'database' store counts failed logins in user table, token
+        # buckets are kept in memory
+        self.count_in_database = app.config.get('THROTTLE_STORE') == 'database'
+        if app.config.get('THROTTLE_STORE') == 'sqlite':
+            path = os.path.join(app.root_path, app.config['THROTTLE_STORE_PATH'])
+            self.store = SQLiteStore(path)
+            self.buckets = SQLiteStore(path, table='throttle_bucket')
+        else:
+            size = app.config.get('THROTTLE_STORE_SIZE') or 10000
+            self.store = LRUCache(maxsize=size)
+            self.buckets = LRUCache(maxsize=size)
+
+    def failed_login(self, user):
+        """Count failed login of User and lock account when failed logins
+           exceed MAX_FAILED_LOGIN_ATTEMPTS. Returns True if account got locked.
+        """
+        max_attempts = current_app.config['MAX_FAILED_LOGIN_ATTEMPTS']
+        if self.count_in_database:
+            return user.record_failed_login(max_attempts)
+        failures = self.store.incr(
+            f'failures:{user.userid}',
+            ttl=current_app.config['LOCK_TIMEOUT'].total_seconds()
+            )
+        if failures > max_attempts and not user.get_lock():
+            # only lock transition is written to Database
+            user.set_lock()
+            return True
+        return False
+
+    def failures(self, user):
+        """Return number of recent failed logins of User"""
+        if self.count_in_database:
+            return user.failed_logins or 0
+        return self.store.get(f'failures:{user.userid}', 0)
+
+    def clear(self, userid):
+        """Clear failed logins counter of User, counters in Database are
+           cleared by User.unlock()
+        """
+        self.store.pop(f'failures:{userid}')
+
+    def take_token(self, key, rate, burst):
+        """Take token from bucket of key, refilled with rate tokens per second
+           up to burst tokens. Returns 0 if token was taken, otherwise number
+           of seconds until next token is available.
+        """
+        # Bucket is stored as theoretical arrival time of next request
+        # (GCRA), so a single value per key is enough for any store
+        interval = 1 / rate
+        now = time.time()
+
+        def take(arrival):
+            arrival = max(arrival or now, now) + interval
+            wait = arrival - burst * interval - now
+            if wait > 0:
+                return None, wait
+            return arrival, 0
+
+        return self.buckets.update(key, take, ttl=burst * interval)
+
+    def token_wait(self, key, rate, burst):
+        """Return 0 if bucket of key has a token, otherwise number of seconds
+           until next token is available, without taking token
+        """
+        interval = 1 / rate
+        now = time.time()
+        arrival = max(self.buckets.get(key) or now, now) + interval
+        return max(arrival - burst * interval - now, 0)
+
+    def login_retry_after(self, address, username=None):
+        """Take login tokens from buckets of client address and username
+
+        Returns 0 if login may proceed, otherwise number of seconds
+        client should wait. Rates are configured in requests per minute
+        by LOGIN_IP_RATE and LOGIN_USERNAME_RATE (0 disables limit),
+        bucket sizes by LOGIN_IP_BURST and LOGIN_USERNAME_BURST.
+        Tokens are taken only if all buckets have one, so that login
+        rejected by username limit does not drain client address bucket.
+        """
+        config = current_app.config
+        buckets = [
+            (f'ip:{address}', config['LOGIN_IP_RATE'],
+                config['LOGIN_IP_BURST']),
+            (f'username:{username}', config['LOGIN_USERNAME_RATE'],
+                config['LOGIN_USERNAME_BURST'])
+            ]
+        if username is None:
+            buckets.pop()
+        buckets = [(key, rate / 60, burst) for key, rate, burst in buckets
+            if rate]
+        wait = max([self.token_wait(*bucket) for bucket in buckets], default=0)
+        if wait:
+            return wait
+        for bucket in buckets:
+            # concurrent login may take last token after check
+            wait = self.take_token(*bucket)
+            if wait:
+                return wait
+        return 0
+
+# Login throttle object is initialized in Application Factory
+throttle = LoginThrottle()
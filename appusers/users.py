@@ -10,13 +10,21 @@ as well as all Operations related to:
 Blueprint is registered in Application Factory function.
 """
 
-from flask import Blueprint, request, jsonify, make_response, url_for, current_app
+from flask import Blueprint, request, make_response, url_for, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from marshmallow import ValidationError
-from appusers.models import (user_schema, user_list_schema,
-    users_filters_schema, UserListSchema, set_password_body_schema)
-from appusers.database import User
-from appusers.utils import json_body, api_key_required, admin_required
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from appusers.models import (user_schema, users_filters_schema,
+    UserListSchema, list_serializer, set_password_body_schema,
+    login_event_list_schema, login_events_filters_schema)
+from appusers.database import User, LoginEvent, get_generation
+from appusers.throttle import throttle
+from appusers.jsonprovider import jsonify
+from appusers.utils import (json_body, api_key_required, admin_required,
+    next_page_link, collection_etag, not_modified, precondition_failed,
+    response_cache_key, cached_response, cache_response, cached_entity,
+    cache_entity, stream_requested, stream_response)
 
 
 # Create Users enpoint Blueprint
@@ -29,12 +37,27 @@ def list_users():
     List and filter Users Collection
 
     Args:
-        request.args - Query String parameters: filtering, sorting
-            and pagination
+        request.args - Query String parameters: filtering, full-text search
+            ('q'), sorting, pagination (offset or 'after' cursor and limit),
+            streaming and 'links=false' omitting 'href' of Users
         X-API-Key in request.headers
+        Accept in request.headers - 'application/x-ndjson' requests
+            streamed NDJSON Response
+        If-None-Match in request.headers - ETag of cached page
 
     Returns:
-        JSON array of User Resource Representations
+        'ETag' Response Header of page (not streamed), derived from userids
+            and versions of Users in page, total count and filters, or 304
+            if it matches If-None-Match
+        Not streamed Responses are served from response cache until next
+        write to user table
+        'Link' Response Header with URI of next page, when page is full
+        (search results matching 'q' are ranked and paged with offset)
+        'X-Total-Count' Response Header with number of Users matching
+            filters, if 'count' is 'exact' or 'estimate'
+        JSON array of User Resource Representations, streamed in chunks
+        if 'stream' is true, or NDJSON stream of User Resource
+        Representations
     """
     try:
         filters = users_filters_schema.load(request.args)
@@ -44,13 +67,52 @@ def list_users():
             )
         return make_response('Bad request', 400)
 
-    filtered_list = User.get_list(filters)
-    if 'return_fields' in filters:
-        return_fields = filters['return_fields'].split(',') + ['href']
-        users = UserListSchema(many=True, only=return_fields).dump(filtered_list)
-    else:
-        users = user_list_schema.dump(filtered_list)
-    return jsonify(users)
+    schema = list_serializer(UserListSchema,
+        filters.get('return_fields'), filters.get('links', True))
+
+    cache_key = None
+    count = None
+    try:
+        query = User.get_query(filters)
+        if stream_requested(filters):
+            response = stream_response(query, schema)
+            if 'count' in filters:
+                count = User.get_count(
+                    filters, estimate=filters['count'] == 'estimate')
+        else:
+            cache_key = response_cache_key(filters)
+            generation = get_generation(User.__tablename__)
+            response = cached_response(cache_key, generation)
+            if response is not None:
+                return response
+            filtered_list = query.all()
+            if 'count' in filters:
+                count = User.get_count(
+                    filters, estimate=filters['count'] == 'estimate')
+            etag = collection_etag(filtered_list, filters, count)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            response = jsonify(schema.dump(filtered_list))
+            response.set_etag(etag)
+            if 'limit' in filters and len(filtered_list) == filters['limit']:
+                if 'q' in filters:
+                    # Ranked search results are paged with offset
+                    response.headers['Link'] = next_page_link(
+                        offset=filters['offset'] + filters['limit'])
+                else:
+                    response.headers['Link'] = next_page_link(
+                        filtered_list[-1].get_cursor(filters))
+    except ValueError as e:
+        current_app.logger.warning(
+            f'list_users() Query String validation failed.\nValueError: {e}'
+            )
+        return make_response('Bad request', 400)
+    if count is not None:
+        response.headers['X-Total-Count'] = count
+    if cache_key is not None:
+        cache_response(cache_key, generation, etag, response)
+    return response
 
 @bp.route('', methods=['POST'])
 @jwt_required
@@ -90,6 +152,75 @@ def create_user(data):
 
     return response
 
+@bp.route('/batch', methods=['POST'])
+@jwt_required
+@admin_required
+@json_body
+def create_users_batch(data):
+    """
+    Create many User Resources in one transaction
+
+    Args:
+        data - JSON array of User Resources, each item is validated
+            with models.user_schema
+        JWT Baerer Authorization in request.headers - admin privilege required
+
+    Returns:
+        JSON array of results, one for each Request body item: 'created'
+        with 'userid' and 'href', or 'conflict'/'invalid' with 'reason'.
+        Error Message if Request body is not an array.
+    """
+    if not isinstance(data, list):
+        current_app.logger.warning(
+            'create_users_batch() failed. Request body is not an array'
+            )
+        return make_response('Bad request', 400)
+
+    results = [None] * len(data)
+    # valid new Users: username -> (index in Request body, User data)
+    new_users = {}
+    for i, item in enumerate(data):
+        if not isinstance(item, dict):
+            results[i] = {'status': 'invalid', 'reason': 'Not an object'}
+            continue
+        try:
+            user = user_schema.load(item)
+        except ValidationError as e:
+            results[i] = {'status': 'invalid', 'reason': e.messages}
+            continue
+        # Ignore 'userid' if present in request data
+        user.pop('userid', None)
+        if user['username'] in new_users:
+            results[i] = {'status': 'conflict',
+                'reason': 'Duplicate username in Request body'}
+        else:
+            new_users[user['username']] = (i, user)
+
+    for username in User.get_existing_usernames(new_users.keys()):
+        i, _ = new_users.pop(username)
+        results[i] = {'status': 'conflict', 'reason': 'Username already exists'}
+
+    try:
+        userids = User.create_many([user for _, user in new_users.values()])
+    except IntegrityError as e:
+        current_app.logger.warning(
+            f'create_users_batch() failed. Database integrity error\nError: {e}'
+            )
+        return make_response('Bad request', 400)
+
+    for username, (i, _) in new_users.items():
+        results[i] = {
+            'status': 'created',
+            'userid': userids[username],
+            'href': url_for(
+                'users.retrieve_user',
+                userid=userids[username],
+                _external=True
+                )
+            }
+
+    return jsonify(results)
+
 @bp.route('/<int:userid>', methods=['GET'])
 @api_key_required
 def retrieve_user(userid):
@@ -99,13 +230,29 @@ def retrieve_user(userid):
     Args:
         userid: Path Parameter - Unique ID of User Resource (int)
         X-API-Key in request.headers
+        If-None-Match in request.headers - ETag of cached Representation
 
     Returns:
         JSON Object with User Resource Representation or Error Message
+        'ETag' Response Header with User version, or 304 if it matches
+            If-None-Match
+        Representation is served from entity cache until User is written
     """
+    key = (User.__tablename__, userid)
+    response = cached_entity(key)
+    if response is not None:
+        return response
+    generation = get_generation(User.__tablename__)
     user = User.retrieve(userid)
     if user:
-        return jsonify(user_schema.dump(user))
+        etag = str(user.version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        response = jsonify(user_schema.dump(user))
+        response.set_etag(etag)
+        cache_entity(key, generation, user.version, response)
+        return response
     else:
         return("Not Found", 404)
 
@@ -122,27 +269,41 @@ def replace_user(userid, data):
             Request body JSON and validated with models.user_schema
         JWT Baerer Authorization in request.headers - account owner or
             admin privilege required
+        If-Match in request.headers - optional ETag of User version, which
+            was modified
 
     Returns:
-        Confirmation or Error Message
+        Confirmation or Error Message, 412 if User version does not match
+        If-Match or User was changed concurrently
     """
     user = User.retrieve(userid)
     if not user:
         return make_response('Not found', 404)
 
-    if User.get_list({'username': data['username']}):
-        current_app.logger.warning(
-            f'create_user() failed. Username={data["username"]} already exists'
-            )
-        return make_response('Bad request', 400)
-
     if current_user.userid != userid and not current_user.get_admin():
         current_app.logger.warning(
             f'replace_user(userid={userid}) failed. Userid={current_user.userid} not authorized'
             )
         return make_response('Unauthorized', 401)
 
-    user.update(**data)
+    if precondition_failed(str(user.version)):
+        current_app.logger.warning(
+            f'replace_user(userid={userid}) failed. Version {user.version} does not match If-Match'
+            )
+        return make_response('Precondition Failed', 412)
+
+    try:
+        user.update(**data)
+    except IntegrityError as e:
+        current_app.logger.warning(
+            f'replace_user(userid={userid}) failed. Username={data.get("username")} already exists\nError: {e}'
+            )
+        return make_response('Bad request', 400)
+    except StaleDataError:
+        current_app.logger.warning(
+            f'replace_user(userid={userid}) failed. User was changed concurrently'
+            )
+        return make_response('Precondition Failed', 412)
 
     return make_response('OK', 200)
 
@@ -159,27 +320,41 @@ def update_user(userid, data):
             Request body JSON and validated with models.user_schema
         JWT Baerer Authorization in request.headers - account owner or
             admin privilege required
+        If-Match in request.headers - optional ETag of User version, which
+            was modified
 
     Returns:
-        Confirmation or Error Message
+        Confirmation or Error Message, 412 if User version does not match
+        If-Match or User was changed concurrently
     """
     user = User.retrieve(userid)
     if not user:
         return make_response('Not found', 404)
 
-    if 'username' in data and User.get_list({'username': data['username']}):
-        current_app.logger.warning(
-            f'create_user() failed. Username={data["username"]} already exists'
-            )
-        return make_response('Bad request', 400)
-
     if current_user.userid != userid and not current_user.get_admin():
         current_app.logger.warning(
             f'update_user(userid={userid}) failed. Userid={current_user.userid} not authorized'
             )
         return make_response('Unauthorized', 401)
 
-    user.update(**data)
+    if precondition_failed(str(user.version)):
+        current_app.logger.warning(
+            f'update_user(userid={userid}) failed. Version {user.version} does not match If-Match'
+            )
+        return make_response('Precondition Failed', 412)
+
+    try:
+        user.update(**data)
+    except IntegrityError as e:
+        current_app.logger.warning(
+            f'update_user(userid={userid}) failed. Username={data.get("username")} already exists\nError: {e}'
+            )
+        return make_response('Bad request', 400)
+    except StaleDataError:
+        current_app.logger.warning(
+            f'update_user(userid={userid}) failed. User was changed concurrently'
+            )
+        return make_response('Precondition Failed', 412)
 
     return make_response('OK', 200)
 
@@ -301,6 +476,7 @@ def clear_lock(userid):
         return('Not Found', 404)
 
     user.unlock()
+    throttle.clear(userid)
     return('OK', 200)
 
 @bp.route('/<int:userid>/admin', methods=['GET'])
@@ -364,3 +540,39 @@ def remoke_admin_status(userid):
 
     user.revoke_admin()
     return('OK', 200)
+
+@bp.route('/<int:userid>/logins', methods=['GET'])
+@jwt_required
+@admin_required
+def list_user_logins(userid):
+    """
+    List Login attempts of User account, newest first
+
+    Args:
+        userid: Path Parameter - Unique ID of User Resource (int)
+        request.args - Query String parameters: pagination ('after' cursor
+            and limit)
+        JWT Baerer Authorization in request.headers - admin privilege required
+
+    Returns:
+        'Link' Response Header with URI of next page, when page is full
+        JSON array of Login attempt records or Error Message. Attempts are
+        recorded with delay of up to AUDIT_FLUSH_INTERVAL.
+    """
+    try:
+        filters = login_events_filters_schema.load(request.args)
+    except ValidationError as e:
+        current_app.logger.warning(
+            f'list_user_logins() Query String validation failed.\nValidationError: {e}'
+            )
+        return make_response('Bad request', 400)
+
+    user = User.retrieve(userid)
+    if not user:
+        return('Not Found', 404)
+
+    events = LoginEvent.get_list(userid, filters)
+    response = jsonify(login_event_list_schema.dump(events))
+    if len(events) == filters['limit']:
+        response.headers['Link'] = next_page_link(events[-1].get_cursor(filters))
+    return response
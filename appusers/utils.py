@@ -8,19 +8,67 @@ This module declares utility functions and decorators:
                          compares its value to Application Configuration
                          variable API_KEY (declared in Application Factory)
     - admin_required - checks if JWT Bearer token in current Request has
-                       identity of User with admin privilege
+                       admin claim or identity of User with admin privilege
+    - login_rate_limited - answers 429 when client address or username
+                           exceeds login rate limits
+    - next_page_link - builds Link Response header value pointing to next
+                       page of List Collection operation
+    - collection_etag - builds ETag of List Collection operation page
+    - not_modified - builds 304 Response if ETag matches If-None-Match
+    - precondition_failed - checks if ETag does not match If-Match
+    - cached_response, cache_response - serve List Collection Responses
+                                        from response_cache
+    - log_cache_stats - logs hit rate and memory use of caches
+    - cached_entity, cache_entity - serve Retrieve Resource Responses from
+                                    database.entity_cache
+    - stream_requested - checks if streamed List Collection Response is
+                         requested
+    - stream_response - builds Response streaming rows of a Query serialized
+                        one by one, as NDJSON or chunked JSON array
 """
+import time
 from functools import wraps
+from hashlib import sha1
+from math import ceil
 from werkzeug.security import safe_str_cmp
-from flask import request, make_response, current_app
-from flask_jwt_extended import get_current_user
-from appusers.database import User
+from sqlalchemy import inspect
+from flask import (request, make_response, current_app, url_for, Response,
+    stream_with_context, g)
+from flask_jwt_extended import get_current_user, get_jwt_claims
+from appusers.cache import LRUCache
+from appusers.database import User, entity_cache, get_generation
+from appusers.jsonprovider import json_provider
+from appusers.models import encode_cursor
+from appusers.throttle import throttle
+
+
+# Number of rows fetched from Database at once by streamed Responses
+STREAM_BATCH_SIZE = 1000
+
+# Headers of List Collection Responses stored in response_cache
+CACHED_HEADERS = ('Link', 'X-Total-Count')
+
+# Serialized List Collection Responses: key -> (generation of tables,
+# ETag, headers, JSON body bytes), see cached_response()
+response_cache = LRUCache(maxsize=10000, maxbytes=64 * 1024 * 1024,
+    sizeof=lambda entry: len(entry[3]))
+
+# Cache stats are logged at most this often (seconds), see log_cache_stats()
+CACHE_STATS_INTERVAL = 60
+cache_stats_logged = 0.0
+
+def init_response_cache(app):
+    """Configure response_cache from Application Config variables"""
+    response_cache.configure(
+        maxbytes=app.config['RESPONSE_CACHE_SIZE'],
+        ttl=app.config['RESPONSE_CACHE_TIMEOUT'].total_seconds())
 
 
 def json_body(_func=None, *, schema=None, partial=False):
-    """Checks if Request Body is a JSON and loads it to data parameter added to
-       invocation of wrapped function. Wrapped function must accept data
-       parameter, which has a dictionary type value.
+    """Checks if Request Body is a JSON and loads it with json_provider
+       to data parameter added to invocation of wrapped function. Wrapped
+       function must accept data parameter, which has a dictionary type
+       value.
        Optionaly validates data with Marshmallow schema (model).
        Validation may be partial.
     """
@@ -30,7 +78,7 @@ def json_body(_func=None, *, schema=None, partial=False):
             if not request.is_json:
                 return make_response('Unsupported Media Type', 415)
             try:
-                raw_data = request.get_json()
+                raw_data = json_provider.get_json()
                 if schema:
                     data = schema.load(raw_data, partial=partial)
                 else:
@@ -61,14 +109,212 @@ def api_key_required(f):
     return decorated_function
 
 def admin_required(f):
-    """Checks if User with JWT Identity has admin privilege"""
+    """Checks if User with JWT Identity has admin privilege
+
+    Tokens issued by login() carry 'admin' claim, which is trusted while
+    'authz_epoch' claim equals authorization epoch of current User (cached
+    Principal). Older Tokens without claims use admin status of User.
+    Principals are cached per worker, so revoked admin status or lock
+    reaches other workers after up to PRINCIPAL_CACHE_TIMEOUT.
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
         user = get_current_user()
-        if not user.get_admin():
+        claims = get_jwt_claims()
+        if 'authz_epoch' in claims:
+            admin = (claims.get('admin', False) and
+                claims['authz_epoch'] == user.authz_epoch)
+        else:
+            admin = user.get_admin()
+        if not admin:
             current_app.logger.warning(
                 f'{f.__name__}() failed. userid={user.userid} is not admin'
                 )
             return make_response('Unathorized', 401)
         return f(*args, **kwargs)
     return decorated_function
+
+def login_rate_limited(f):
+    """Checks login rate limits of client address and username from Request
+       body JSON, before Database is accessed. Answers 429 with Retry-After
+       header if limit is exceeded. Must be applied before json_body.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        body = json_provider.get_json(silent=True)
+        username = body.get('username') if isinstance(body, dict) else None
+        if not isinstance(username, str):
+            username = None
+        retry_after = throttle.login_retry_after(
+            request.remote_addr, username and username[:64])
+        if retry_after:
+            current_app.logger.warning(
+                f'{f.__name__}() rate limit exceeded by {request.remote_addr}'
+                )
+            response = make_response('Too Many Requests', 429)
+            response.headers['Retry-After'] = ceil(retry_after)
+            return response
+        return f(*args, **kwargs)
+    return decorated_function
+
+def next_page_link(cursor=None, offset=None):
+    """Return Link header value with URI of next page of current Request.
+       Next page starts after row with cursor values (list of sort keys)
+       or, if cursor is None, at offset.
+    """
+    args = request.args.to_dict()
+    if cursor is None:
+        args['offset'] = offset
+    else:
+        args.pop('offset', None)
+        args['after'] = encode_cursor(cursor)
+    args.update(request.view_args or {})
+    url = url_for(request.endpoint, _external=True, **args)
+    return f'<{url}>; rel="next"'
+
+def collection_etag(rows, filters, count=None):
+    """Return ETag of List Collection page of current Request, derived from
+       primary keys and versions of page rows, total count of Collection
+       and filters loaded from Query String, independent of Query String
+       parameters order. Rows of page are already loaded, so ETag costs
+       no Database query.
+    """
+    version = [(inspect(row).identity, row.version) for row in rows]
+    key = repr((request.endpoint, sorted((request.view_args or {}).items()),
+        version, count, sorted(filters.items())))
+    return sha1(key.encode('utf-8')).hexdigest()
+
+def not_modified(etag):
+    """Return 304 Not Modified Response if etag matches Request
+       If-None-Match header, otherwise None
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
+
+def precondition_failed(etag):
+    """Checks if Request If-Match header is present and does not match etag"""
+    return bool(request.if_match) and not request.if_match.contains(etag)
+
+def response_cache_key(filters):
+    """Return response_cache key of current Request: endpoint, Path
+       Parameters and filters loaded from Query String. Root URL is part
+       of the key, because Responses contain external URLs.
+    """
+    return repr((request.url_root, request.endpoint,
+        sorted((request.view_args or {}).items()), sorted(filters.items())))
+
+def cached_response(key, generation):
+    """Return Response of current Request from response_cache, or 304 if
+       cached ETag matches If-None-Match. Returns None if Response is not
+       cached or was cached with other generation of tables (see
+       database.get_generation()), that is before last write to them.
+    """
+    if not current_app.config.get('RESPONSE_CACHE'):
+        return None
+    log_cache_stats()
+    entry = response_cache.get(key)
+    if entry is None or entry[0] != generation:
+        return None
+    _, etag, headers, body = entry
+    response = not_modified(etag)
+    if response is None:
+        response = current_app.response_class(
+            body, mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+    return response
+
+def log_cache_stats():
+    """Log hit rate and memory use of response_cache and entity_cache,
+       at most once per CACHE_STATS_INTERVAL seconds
+    """
+    global cache_stats_logged
+    now = time.monotonic()
+    if now - cache_stats_logged < CACHE_STATS_INTERVAL:
+        return
+    cache_stats_logged = now
+    current_app.logger.info(f'response_cache stats: {response_cache.stats()}')
+    current_app.logger.info(f'entity_cache stats: {entity_cache.stats()}')
+
+def cache_response(key, generation, etag, response):
+    """Store List Collection Response in response_cache. generation of
+       tables must be read before query was executed. Responses read from
+       replica Database are not cached, they may lag behind primary
+       Database.
+    """
+    if not current_app.config.get('RESPONSE_CACHE') or g.get('read_replica'):
+        return
+    headers = [(name, response.headers[name]) for name in CACHED_HEADERS
+        if name in response.headers]
+    response_cache.set(key, (generation, etag, headers, response.get_data()))
+
+def cached_entity(key):
+    """Return Response with Resource Representation cached for key
+       (table, primary key) in entity_cache, or 304 if its version matches
+       If-None-Match. Returns None if Representation is not cached.
+    """
+    if not current_app.config.get('ENTITY_CACHE'):
+        return None
+    entry = entity_cache.get(key)
+    if entry is None:
+        return None
+    etag = str(entry[0])
+    response = not_modified(etag)
+    if response is None:
+        response = current_app.response_class(
+            entry[1], mimetype='application/json')
+        response.set_etag(etag)
+    return response
+
+def cache_entity(key, generation, version, response):
+    """Store Resource Representation with version in entity_cache.
+       generation of table must be read before Resource was loaded, if
+       table was written since then, Representation may be stale and is
+       not cached. Representations read from replica Database are not cached.
+    """
+    if (not current_app.config.get('ENTITY_CACHE') or g.get('read_replica')
+            or get_generation(key[0]) != generation):
+        return
+    entity_cache.set(key, (version, response.get_data()))
+
+def stream_requested(filters):
+    """Checks if 'stream' Query String parameter is true or Request Accept
+       header prefers NDJSON format
+    """
+    return filters.get('stream', False) or ndjson_accepted()
+
+def ndjson_accepted():
+    """Checks if Request Accept header prefers NDJSON to JSON"""
+    best = request.accept_mimetypes.best_match(
+        ['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_response(query, schema):
+    """Return Response streaming query rows serialized one by one with
+       schema. Rows are fetched from Database in batches, so memory use
+       does not depend on size of collection.
+       Response is NDJSON if Request Accept header prefers it, otherwise
+       Response is a JSON array sent in chunks. Rows are encoded with
+       json_provider.
+    """
+    rows = query.yield_per(STREAM_BATCH_SIZE)
+
+    def generate_ndjson():
+        for row in rows:
+            yield json_provider.dumps(schema.dump(row, many=False)) + b'\n'
+
+    def generate_array():
+        separator = b'['
+        for row in rows:
+            yield separator + json_provider.dumps(schema.dump(row, many=False))
+            separator = b','
+        yield b']' if separator == b',' else b'[]'
+
+    if ndjson_accepted():
+        return Response(stream_with_context(generate_ndjson()),
+            mimetype='application/x-ndjson')
+    else:
+        return Response(stream_with_context(generate_array()),
+            mimetype='application/json')
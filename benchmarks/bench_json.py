@@ -0,0 +1,64 @@
+"""Benchmark of JSON encoding of List Users Responses
+
+Encodes List Users payloads (rows dumped with ListSerializer) of different
+sizes with stdlib and orjson JSON providers, compact and indented (debug
+mode), reporting bytes/sec of Response body.
+
+Usage:
+    python benchmarks/bench_json.py [--sizes N,N,...] [--repeat N]
+"""
+import os, sys, argparse, tempfile, time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.argv, argv = sys.argv[:1], sys.argv[1:] # keep options from configure()
+os.environ.setdefault('APPUSERS_CONFIG', 'test_config.py')
+from appusers import create_app
+from appusers.models import UserListSchema, list_serializer
+from appusers.jsonprovider import json_provider, orjson
+
+
+def best_rate(encode, payload, repeat):
+    """Return bytes/sec and size of fastest of repeat encodings of payload"""
+    best = None
+    number = max(1, 100000 // max(len(payload), 1))
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            body = encode(payload)
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return len(body) / best, len(body)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['APPUSERS_DATABASE_URI'] = \
+            f'sqlite:///{os.path.join(tmpdir, "bench.sqlite3")}'
+        # audit log would be flushed after temporary Database is removed
+        os.environ['APPUSERS_AUDIT_LOG'] = 'False'
+        app = create_app()
+        providers = ['stdlib', 'orjson'] if orjson else ['stdlib']
+        if not orjson:
+            print('orjson is not installed, only stdlib is measured')
+        with app.test_request_context():
+            serializer = list_serializer(UserListSchema)
+            for size in [int(s) for s in args.sizes.split(',')]:
+                payload = serializer.dump([SimpleNamespace(userid=i,
+                    username=f'user{i}', firstname='Bench',
+                    lastname=f'User{i % 100}', email=f'user{i}@example.com',
+                    phone=f'123-444-{i % 10000:04}')
+                    for i in range(1, size + 1)])
+                for pretty in [False, True]:
+                    for name in providers:
+                        app.config['JSON_PROVIDER'] = name
+                        json_provider.init_app(app)
+                        rate, length = best_rate(
+                            lambda p: json_provider.dumps(p, pretty),
+                            payload, args.repeat)
+                        print(f'rows={size:6} pretty={pretty!s:5} {name:6} '
+                            f'bytes={length:9} MB/sec={rate / 1e6:8.1f}')
@@ -0,0 +1,94 @@
+"""Benchmark of login throughput and latency of concurrent Requests
+
+Client threads log in continuously while one thread keeps retrieving a
+User Resource. Compares password verification in Request handling thread
+(workers=0) with thread and process pools, reporting logins/sec and
+latency of the concurrent cheap Requests.
+
+Usage:
+    python benchmarks/bench_login.py [--clients N] [--seconds S]
+        [--cost N] [--workers N]
+"""
+import os, sys, argparse, statistics, tempfile, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.argv, argv = sys.argv[:1], sys.argv[1:] # keep options from configure()
+os.environ.setdefault('APPUSERS_CONFIG', 'test_config.py')
+from appusers import create_app
+from appusers.database import User
+from appusers.passwords import hasher
+
+
+def run(app, clients, seconds):
+    """Run login clients and one retrieve client for seconds,
+       return logins/sec and median and max retrieve latency in ms
+    """
+    stop = threading.Event()
+    logins = []
+    latencies = []
+    headers = {'X-API-Key': app.config['API_KEY']}
+
+    def login_client(i):
+        client = app.test_client()
+        n = 0
+        while not stop.is_set():
+            resp = client.post('/login',
+                json={'username': f'user{i}', 'password': 'pass'})
+            assert resp.status_code == 200, resp.status_code
+            n += 1
+        logins.append(n)
+
+    def retrieve_client():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get('/users/1', headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login_client, args=(i,))
+        for i in range(clients)]
+    threads.append(threading.Thread(target=retrieve_client))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return (sum(logins) / seconds, statistics.median(latencies),
+        max(latencies))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--cost', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['APPUSERS_DATABASE_URI'] = \
+            f'sqlite:///{os.path.join(tmpdir, "bench.sqlite3")}'
+        os.environ['APPUSERS_PASSWORD_COST'] = str(args.cost)
+        os.environ['APPUSERS_LOGIN_IP_RATE'] = '0'
+        os.environ['APPUSERS_LOGIN_USERNAME_RATE'] = '0'
+        # audit log would be flushed after temporary Database is removed
+        os.environ['APPUSERS_AUDIT_LOG'] = 'False'
+        app = create_app()
+        with app.app_context():
+            for i in range(args.clients):
+                User(username=f'user{i}', firstname='Bench',
+                    lastname='User', email=f'user{i}@example.com',
+                    phone=f'123-444-{i:04}').set_password('pass')
+
+        for pool, workers in [('thread', 0), ('thread', args.workers),
+                ('process', args.workers)]:
+            app.config['PASSWORD_POOL'] = pool
+            app.config['PASSWORD_WORKERS'] = workers
+            hasher.init_app(app)
+            rate, median, worst = run(app, args.clients, args.seconds)
+            print(f'pool={pool:7} workers={workers:2} logins/sec={rate:8.1f} '
+                f'retrieve median={median:7.1f}ms max={worst:7.1f}ms')
+        # shut down last pool
+        app.config['PASSWORD_WORKERS'] = 0
+        hasher.init_app(app)
@@ -0,0 +1,62 @@
+"""Benchmark of List Users serialization
+
+Dumps rows with User attributes with Marshmallow schema created for every
+Request, with cached schema instance and with compiled ListSerializer
+(with and without links), for all fields and for 'fields' projection,
+reporting rows/sec.
+
+Usage:
+    python benchmarks/bench_serializers.py [--rows N] [--repeat N]
+"""
+import os, sys, argparse, tempfile, time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.argv, argv = sys.argv[:1], sys.argv[1:] # keep options from configure()
+os.environ.setdefault('APPUSERS_CONFIG', 'test_config.py')
+from appusers import create_app
+from appusers.models import UserListSchema, list_serializer
+
+
+def best_rate(dump, rows, repeat):
+    """Return rows/sec of fastest of repeat dumps of rows"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        dump(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows) / best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rows = [SimpleNamespace(userid=i, username=f'user{i}', firstname='Bench',
+        lastname=f'User{i % 100}', email=f'user{i}@example.com',
+        phone=f'123-444-{i % 10000:04}') for i in range(1, args.rows + 1)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['APPUSERS_DATABASE_URI'] = \
+            f'sqlite:///{os.path.join(tmpdir, "bench.sqlite3")}'
+        # audit log would be flushed after temporary Database is removed
+        os.environ['APPUSERS_AUDIT_LOG'] = 'False'
+        app = create_app()
+        with app.test_request_context():
+            for return_fields in [None, 'username,email']:
+                only = return_fields and return_fields.split(',') + ['href']
+                cached = UserListSchema(many=True, only=only)
+                serializer = list_serializer(UserListSchema, return_fields)
+                assert serializer.dump(rows[:100]) == cached.dump(rows[:100])
+                for name, dump in [
+                        ('schema per request',
+                            lambda r: UserListSchema(many=True, only=only).dump(r)),
+                        ('cached schema', cached.dump),
+                        ('ListSerializer', serializer.dump),
+                        ('links=false', list_serializer(UserListSchema,
+                            return_fields, links=False).dump)]:
+                    rate = best_rate(dump, rows, args.repeat)
+                    print(f'fields={return_fields or "all":15} {name:20} '
+                        f'rows/sec={rate:10.0f}')
@@ -0,0 +1,101 @@
+"""Benchmark of SQLite read throughput under concurrent write load
+
+Compares User list reads per second in default (DELETE) and WAL journal
+modes. Reader processes, like multiple application workers, list Users
+while one writer process keeps updating User lock status, as failed
+logins do.
+
+Usage:
+    python benchmarks/bench_sqlite_wal.py [--users N] [--readers N]
+        [--seconds S]
+"""
+import os, sys, argparse, multiprocessing, tempfile, time
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from appusers.database import db, User, init_sqlite_pragmas
+
+
+def create_app(path, journal_mode):
+    """Create minimal app with SQLite file Database at path"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_JOURNAL_MODE'] = journal_mode
+    app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL' if journal_mode == 'WAL' else None
+    app.config['SQLITE_BUSY_TIMEOUT'] = 5000
+    with app.app_context():
+        db.init_app(app)
+        init_sqlite_pragmas(app)
+        db.create_all()
+    return app
+
+def populate(app, users):
+    """Insert users test Users"""
+    with app.app_context():
+        User.create_many([
+            {
+                'username': f'user{i}',
+                'firstname': 'Bench',
+                'lastname': f'User{i % 100}',
+                'email': f'user{i}@example.com',
+                'phone': f'123-{i:07}'
+            }
+            for i in range(users)])
+
+def writer(path, journal_mode, stop, counter):
+    """Worker process updating User lock status until stop is set"""
+    app = create_app(path, journal_mode)
+    with app.app_context():
+        user = User.get_list({'username': 'user0'})[0]
+        while not stop.is_set():
+            user.set_lock()
+            user.unlock()
+            with counter.get_lock():
+                counter.value += 1
+
+def reader(path, journal_mode, stop, counter):
+    """Worker process reading filtered User lists until stop is set"""
+    app = create_app(path, journal_mode)
+    n = 0
+    with app.app_context():
+        while not stop.is_set():
+            User.get_list({'lastname': f'User{n % 100}', 'limit': 20})
+            db.session.remove()
+            n += 1
+    with counter.get_lock():
+        counter.value += n
+
+def run(path, journal_mode, readers, seconds):
+    """Run reader processes and one writer process for seconds,
+       return reads/sec and writes/sec
+    """
+    stop = multiprocessing.Event()
+    reads = multiprocessing.Value('i', 0)
+    writes = multiprocessing.Value('i', 0)
+    processes = [multiprocessing.Process(target=writer,
+        args=(path, journal_mode, stop, writes))]
+    processes += [multiprocessing.Process(target=reader,
+        args=(path, journal_mode, stop, reads)) for _ in range(readers)]
+    for p in processes:
+        p.start()
+    time.sleep(seconds)
+    stop.set()
+    for p in processes:
+        p.join()
+    return reads.value / seconds, writes.value / seconds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for journal_mode in ['DELETE', 'WAL']:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.sqlite3')
+            populate(create_app(path, journal_mode), args.users)
+            reads, writes = run(path, journal_mode, args.readers, args.seconds)
+            print(f'journal_mode={journal_mode:6} reads/sec={reads:10.1f} '
+                f'writes/sec={writes:8.1f}')
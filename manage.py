@@ -4,6 +4,7 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from appusers import create_app
 from appusers.database import db
+from appusers.passwords import calibrate as calibrate_cost
 
 app = create_app()
 
@@ -12,5 +13,15 @@ migrate = Migrate(app, db)
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
+@manager.option('-m', '--method', dest='method', default='pbkdf2-sha256',
+    help='Password hashing method: pbkdf2-sha256 or scrypt')
+@manager.option('-t', '--target', dest='target', type=float, default=250,
+    help='Target password hashing latency in milliseconds')
+def calibrate(method, target):
+    """Print password hashing cost meeting target latency on this machine"""
+    cost = calibrate_cost(method, target / 1000)
+    print(f'PASSWORD_HASH = {method!r}')
+    print(f'PASSWORD_COST = {cost}')
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,31 @@
+"""add user authz_epoch
+
+Revision ID: 3f6a2c9d8b71
+Revises: 85dbe4ed5315
+Create Date: 2026-10-16 21:12:40.318552
+
+Column is added with ALTER TABLE ADD COLUMN, not batch mode, because
+recreating user table on SQLite would drop full-text search triggers.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2c9d8b71'
+down_revision = '85dbe4ed5315'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [c['name'] for c in inspector.get_columns('user')]
+    if 'authz_epoch' not in columns:
+        op.add_column('user', sa.Column('authz_epoch', sa.Integer(),
+            nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('authz_epoch')
@@ -0,0 +1,42 @@
+"""add filter and sort indexes
+
+Revision ID: 85dbe4ed5315
+Revises: 
+Create Date: 2026-10-16 19:45:06.581164
+
+Tables of Databases created before this revision were created by
+db.create_all() in Application Factory, so this is the first revision.
+Application Factory creates these indexes for new Databases, therefore
+only missing indexes are created.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '85dbe4ed5315'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+indexes = [
+    ('ix_members_userid_groupid', 'members', ['userid', 'groupid']),
+    ('ix_group_description_groupid', 'group', ['description', 'groupid']),
+    ('ix_user_firstname_userid', 'user', ['firstname', 'userid']),
+    ('ix_user_lastname_userid', 'user', ['lastname', 'userid']),
+    ('ix_user_email_userid', 'user', ['email', 'userid']),
+    ('ix_user_phone_userid', 'user', ['phone', 'userid']),
+    ]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in indexes:
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(indexes):
+        op.drop_index(name, table_name=table)
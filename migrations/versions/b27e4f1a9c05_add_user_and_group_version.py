@@ -0,0 +1,33 @@
+"""add user and group version
+
+Revision ID: b27e4f1a9c05
+Revises: 3f6a2c9d8b71
+Create Date: 2026-10-16 22:41:07.512934
+
+Columns are added with ALTER TABLE ADD COLUMN, not batch mode, because
+recreating user table on SQLite would drop full-text search triggers.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27e4f1a9c05'
+down_revision = '3f6a2c9d8b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in ['user', 'group']:
+        columns = [c['name'] for c in inspector.get_columns(table)]
+        if 'version' not in columns:
+            op.add_column(table, sa.Column('version', sa.Integer(),
+                nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ['user', 'group']:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')